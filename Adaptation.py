@@ -0,0 +1,237 @@
+"""
+Adaptive Bitrate
+Picks a quality tier per session from receiver feedback and re-encodes frames for it
+"""
+
+import io
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Pillow is only needed to re-encode; without it tiers can only lower the frame rate
+try:
+    from PIL import Image
+    HAVE_PIL = True
+except ImportError:
+    Image = None
+    HAVE_PIL = False
+
+# One rung of the quality ladder: frame scale, JPEG quality (None keeps the
+# stored frame), the fraction of frames sent (1 in fpsDivisor) and the
+# pre-encoded rendition file to read (None for the file the client asked for)
+QualityTier = namedtuple('QualityTier', ['name', 'scale', 'quality', 'fpsDivisor', 'path'],
+                         defaults=(None,))
+
+# Best first
+DEFAULT_TIERS = (
+    QualityTier('full', 1.0, None, 1),
+    QualityTier('high', 1.0, 60, 1),
+    QualityTier('medium', 0.75, 45, 1),
+    QualityTier('low', 0.5, 35, 2),
+    QualityTier('minimal', 0.5, 25, 4),
+)
+
+# Without an encoder the only lever is the frame rate
+FPS_TIERS = (
+    QualityTier('full', 1.0, None, 1),
+    QualityTier('half-fps', 1.0, None, 2),
+    QualityTier('quarter-fps', 1.0, None, 4),
+)
+
+# Congestion thresholds
+LOSS_HIGH = 0.05        # RTCP fraction lost that triggers a step down
+LOSS_LOW = 0.01         # ... and below which a report counts as clean
+FRAME_LOSS_HIGH = 0.10  # frames the receiver had to drop
+RTT_RISE = 0.1          # seconds of RTT above the best seen (queueing delay)
+
+# Re-encoded frames kept for all sessions
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+
+def renditionTiers(renditions):
+    """
+    Quality ladder from a rendition manifest (MjpegFile.loadManifest): one
+    tier per pre-encoded rendition, best first, then the smallest rendition
+    at reduced frame rates
+    """
+    tiers = [QualityTier(r.name, 1.0, None, 1, r.path) for r in renditions]
+    last = renditions[-1]
+    for divisor, suffix in ((2, 'half-fps'), (4, 'quarter-fps')):
+        tiers.append(QualityTier(f'{last.name}-{suffix}', 1.0, None, divisor, last.path))
+    return tiers
+
+
+class RateController:
+    """
+    Chooses the quality tier for one session.
+
+    After each receiver report the session steps down a tier when the
+    receiver reports packet loss, drops frames, or the round-trip time rises
+    well above the lowest seen (a queue building up in front of the link).
+    It steps back up one tier after several clean reports in a row. Changes
+    are rate-limited so one bad report does not make the quality oscillate,
+    and upgrades wait longer than downgrades.
+    """
+
+    def __init__(self, tiers=DEFAULT_TIERS, holdTime=1.0, upgradeTime=3.0,
+                 upgradeReports=3, clock=time.monotonic):
+        self.tiers = tiers
+        self.holdTime = holdTime
+        self.upgradeTime = upgradeTime
+        self.upgradeReports = upgradeReports
+        self.clock = clock
+        self.level = 0
+        self.cleanReports = 0
+        self.lastChange = clock()
+        self.minRtt = None
+
+        # Metrics
+        self.downgrades = 0
+        self.upgrades = 0
+
+    def tier(self):
+        """Current quality tier"""
+        return self.tiers[self.level]
+
+    def congested(self, feedback):
+        """True if the latest report shows the path is overloaded"""
+        if feedback.fractionLost > LOSS_HIGH or feedback.frameLoss > FRAME_LOSS_HIGH:
+            return True
+        if feedback.rtt is not None:
+            if self.minRtt is None or feedback.rtt < self.minRtt:
+                self.minRtt = feedback.rtt
+            return feedback.rtt > self.minRtt + RTT_RISE
+        return False
+
+    def update(self, feedback, now=None):
+        """Take a new receiver report (a ReceiverFeedback); returns True if the tier changed"""
+        if now is None:
+            now = self.clock()
+        sinceChange = now - self.lastChange
+
+        if self.congested(feedback):
+            self.cleanReports = 0
+            if self.level < len(self.tiers) - 1 and sinceChange >= self.holdTime:
+                self.level += 1
+                self.downgrades += 1
+                self.lastChange = now
+                return True
+            return False
+
+        if feedback.fractionLost > LOSS_LOW:
+            # Some loss but not enough to act on: neither better nor worse
+            self.cleanReports = 0
+            return False
+
+        self.cleanReports += 1
+        if self.level > 0 and self.cleanReports >= self.upgradeReports and \
+                sinceChange >= self.upgradeTime:
+            self.level -= 1
+            self.upgrades += 1
+            self.cleanReports = 0
+            self.lastChange = now
+            return True
+        return False
+
+    def sendFrame(self, frameIndex):
+        """True if the frame with this media index goes out at the current frame rate"""
+        return frameIndex % self.tier().fpsDivisor == 0
+
+    def stats(self):
+        """Adaptation metrics for logging"""
+        return {
+            'tier': self.tier().name,
+            'downgrades': self.downgrades,
+            'upgrades': self.upgrades,
+        }
+
+    def summary(self):
+        """One-line description of the adaptation state"""
+        s = self.stats()
+        return f"tier {s['tier']}, down {s['downgrades']}, up {s['upgrades']}"
+
+
+class TierEncoder:
+    """
+    Re-encodes JPEG frames for quality tiers, shared by every session.
+
+    Results are kept in a byte-bounded LRU cache keyed on the file, frame
+    and tier, so viewers of the same file on the same tier share one encode.
+    """
+
+    def __init__(self, maxBytes=DEFAULT_CACHE_BYTES):
+        self.maxBytes = maxBytes
+        self.cache = OrderedDict()
+        self.cachedBytes = 0
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def tiers(self):
+        """The quality ladder this encoder can serve"""
+        return DEFAULT_TIERS if HAVE_PIL else FPS_TIERS
+
+    def frame(self, filename, frameNumber, data, tier):
+        """The frame as sent on a tier (the stored frame for tiers without re-encoding)"""
+        if tier.quality is None and tier.scale == 1.0:
+            return data
+
+        key = (filename, frameNumber, tier.name)
+        with self.lock:
+            encoded = self.cache.get(key)
+            if encoded is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return encoded
+            self.misses += 1
+
+        try:
+            encoded = encode(data, tier.scale, tier.quality)
+        except (OSError, ValueError) as e:
+            # Not decodable here: send it as stored
+            print(f"[Adaptation] Re-encode failed for frame {frameNumber}: {e}")
+            self.errors += 1
+            return data
+
+        with self.lock:
+            if key not in self.cache:
+                self.cache[key] = encoded
+                self.cachedBytes += len(encoded)
+            while self.cachedBytes > self.maxBytes and self.cache:
+                _, evicted = self.cache.popitem(last=False)
+                self.cachedBytes -= len(evicted)
+        return encoded
+
+    def stats(self):
+        """Cache metrics for logging"""
+        with self.lock:
+            return {
+                'entries': len(self.cache),
+                'cached_bytes': self.cachedBytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'errors': self.errors,
+            }
+
+
+def encode(data, scale=1.0, quality=None):
+    """
+    Re-encode a JPEG at a scale and quality. The output is baseline 4:2:0
+    with the standard Huffman tables, dimensions a multiple of 16, so it
+    fits RTP/JPEG type 1 (RFC 2435).
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    width = max(16, int(image.width * scale) // 16 * 16)
+    height = max(16, int(image.height * scale) // 16 * 16)
+    if (width, height) != image.size:
+        image = image.resize((width, height), Image.BILINEAR)
+
+    out = io.BytesIO()
+    image.save(out, 'JPEG', quality=quality or 75, subsampling=2)
+    return out.getvalue()
@@ -0,0 +1,393 @@
+"""
+Asynchronous RTSP/RTP Video Streaming Server
+Runs RTSP control and RTP pacing for all sessions on one asyncio event loop
+"""
+
+import asyncio
+import time
+from RtpPacket import RtpSender
+from RtpJpeg import JpegPacketizer
+from Pacer import FramePacer
+from VideoStream import VideoStream
+from RtcpPacket import ReceiverFeedback, reportInterval
+from Server import (INIT, READY, PLAYING, SETUP, PLAY, PAUSE, TEARDOWN, parseRange, formatRange,
+                    parseTransport, formatTransport, senderReport)
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel shared by all sessions. Timers are bucketed by tick so
+    scheduling and expiry cost O(1) regardless of how many sessions play.
+    """
+
+    def __init__(self, tick=0.005, slots=256):
+        self.tick = tick
+        self.slots = [[] for _ in range(slots)]
+        self.currentTick = None
+        self.wakeup = asyncio.Event()
+        self.count = 0
+
+    def _tickOf(self, deadline):
+        return int(deadline / self.tick)
+
+    def schedule(self, deadline, callback):
+        """Call callback() once the loop time reaches deadline"""
+        loop = asyncio.get_running_loop()
+        if self.currentTick is None:
+            self.currentTick = self._tickOf(loop.time())
+        # Never schedule into a slot that has already been swept
+        tick = max(self._tickOf(deadline), self.currentTick)
+        self.slots[tick % len(self.slots)].append((tick, callback))
+        self.count += 1
+        self.wakeup.set()
+
+    async def run(self):
+        """Fire expired timers forever"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.count == 0:
+                # Nothing scheduled: sleep until somebody schedules a timer.
+                # Forget the position so the wheel restarts at the current
+                # tick instead of sweeping every tick that passed while idle.
+                self.currentTick = None
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            nowTick = self._tickOf(loop.time())
+            if self.currentTick is None:
+                self.currentTick = nowTick
+
+            while self.currentTick <= nowTick:
+                slot = self.slots[self.currentTick % len(self.slots)]
+                due = [entry for entry in slot if entry[0] <= self.currentTick]
+                if due:
+                    # Timers for later revolutions stay in the slot
+                    slot[:] = [entry for entry in slot if entry[0] > self.currentTick]
+                    self.count -= len(due)
+                    for tick, callback in due:
+                        try:
+                            callback()
+                        except Exception as e:
+                            print(f"[AsyncServer] Timer callback error: {e}")
+                self.currentTick += 1
+
+            await asyncio.sleep(self.tick)
+
+
+class RtpProtocol(asyncio.DatagramProtocol):
+    """Send-only datagram endpoint for one session"""
+
+    def error_received(self, exc):
+        print(f"[AsyncServer] RTP error: {exc}")
+
+
+class RtcpProtocol(asyncio.DatagramProtocol):
+    """RTCP endpoint for one session: receiver reports in, sender reports out"""
+
+    def __init__(self, session):
+        self.session = session
+
+    def datagram_received(self, data, addr):
+        self.session.feedback.receive(data)
+
+    def error_received(self, exc):
+        print(f"[AsyncServer] RTCP error: {exc}")
+
+
+class AsyncSession:
+    """RTSP session handled as a coroutine instead of a thread"""
+
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.clientAddr = writer.get_extra_info('peername')
+        self.rtspSeq = 0
+        self.sessionId = 0
+        self.clientRtpPort = 0
+        self.clientRtcpPort = 0
+        self.rtpTransport = None
+        self.rtcpTransport = None
+        self.rtcpTimer = None
+        self.feedback = None
+        self.state = INIT
+        self.videoStream = None
+        self.rtpSender = None
+        self.packetizer = JpegPacketizer()
+        self.pacer = None
+        # Bumped on every PLAY/PAUSE so stale timers become no-ops
+        self.generation = 0
+
+    async def run(self):
+        """Main loop to handle RTSP requests"""
+        print(f"[AsyncServer] Connection from {self.clientAddr}")
+
+        while True:
+            try:
+                data = await self.reader.read(1024)
+                if not data:
+                    break
+
+                request = data.decode('utf-8')
+                print(f"[AsyncServer] Received from {self.clientAddr}:\n{request}")
+
+                # Parse the RTSP request
+                lines = request.split('\n')
+                requestLine = lines[0].split(' ')
+
+                if len(requestLine) >= 2:
+                    requestType = requestLine[0]
+
+                    # Get CSeq
+                    for line in lines:
+                        if line.startswith('CSeq:'):
+                            self.rtspSeq = int(line.split(' ')[1])
+
+                    # Handle different request types
+                    if requestType == SETUP:
+                        await self.handleSetup(lines)
+                    elif requestType == PLAY:
+                        self.handlePlay(lines)
+                    elif requestType == PAUSE:
+                        self.handlePause()
+                    elif requestType == TEARDOWN:
+                        self.handleTeardown()
+                        break
+
+            except Exception as e:
+                print(f"[AsyncServer] Error handling request: {e}")
+                break
+
+        # Cleanup
+        self.cleanup()
+
+    async def handleSetup(self, lines):
+        """Handle SETUP request"""
+        if self.state == INIT:
+            try:
+                # Get video filename from request
+                filename = lines[0].split(' ')[1]
+
+                # Open video file
+                self.videoStream = VideoStream(filename)
+                self.pacer = FramePacer(self.videoStream.fps,
+                                        clock=asyncio.get_running_loop().time)
+
+                # Get RTP/RTCP port from request
+                self.clientRtpPort, self.clientRtcpPort = parseTransport(lines)
+
+                # Generate session ID
+                self.sessionId = int(time.time())
+
+                # Create RTP and RTCP datagram transports
+                loop = asyncio.get_running_loop()
+                self.rtpTransport, _ = await loop.create_datagram_endpoint(
+                    RtpProtocol, local_addr=('0.0.0.0', 0),
+                    remote_addr=(self.clientAddr[0], self.clientRtpPort))
+                # Datagram transports have no sendmsg; the sender only builds headers
+                self.rtpSender = RtpSender(None, None, self.sessionId)
+
+                self.feedback = ReceiverFeedback(self.sessionId)
+                self.rtcpTransport, _ = await loop.create_datagram_endpoint(
+                    lambda: RtcpProtocol(self), local_addr=('0.0.0.0', 0))
+                self.rtcpTimer = loop.call_later(reportInterval(), self.sendSenderReport)
+
+                # Send RTSP reply
+                self.state = READY
+                self.sendRtspReply(200, self.rtspSeq, self.sessionId, {
+                    'Transport': formatTransport(self.clientRtpPort, self.clientRtcpPort,
+                                                 self.rtpTransport.get_extra_info('sockname')[1],
+                                                 self.rtcpTransport.get_extra_info('sockname')[1])
+                })
+
+                print(f"[AsyncServer] SETUP completed. Session: {self.sessionId}, RTP port: {self.clientRtpPort}")
+
+            except Exception as e:
+                print(f"[AsyncServer] SETUP error: {e}")
+                self.sendRtspReply(404, self.rtspSeq)
+
+    def handlePlay(self, lines):
+        """Handle PLAY request (with an optional Range header to seek)"""
+        position = parseRange(lines)
+
+        # PLAY while playing repositions the stream
+        if self.state == READY or (self.state == PLAYING and position is not None):
+            self.state = PLAYING
+
+            if position is not None:
+                # Jump straight to the requested frame via the index
+                self.videoStream.seekTime(position)
+
+            # Send RTSP reply
+            self.sendRtspReply(200, self.rtspSeq, self.sessionId, {
+                'Range': formatRange(self.videoStream.position(), self.videoStream.duration())
+            })
+
+            # Start pacing frames on the shared timer wheel
+            self.generation += 1
+            generation = self.generation
+            self.pacer.start()
+            self.server.timerWheel.schedule(self.pacer.deadline(),
+                                            lambda: self.sendNextFrame(generation))
+
+            print(f"[AsyncServer] PLAY started for session {self.sessionId}")
+
+    def handlePause(self):
+        """Handle PAUSE request"""
+        if self.state == PLAYING:
+            self.state = READY
+            self.generation += 1
+
+            # Send RTSP reply
+            self.sendRtspReply(200, self.rtspSeq, self.sessionId)
+
+            print(f"[AsyncServer] PAUSE for session {self.sessionId}")
+            self.printSummary()
+
+    def handleTeardown(self):
+        """Handle TEARDOWN request"""
+        self.state = INIT
+        self.generation += 1
+
+        # Send RTSP reply
+        self.sendRtspReply(200, self.rtspSeq, self.sessionId)
+
+        print(f"[AsyncServer] TEARDOWN for session {self.sessionId}")
+        self.printSummary()
+
+    def printSummary(self):
+        """Log pacing and receiver report metrics for this session"""
+        if self.pacer:
+            print(f"[AsyncServer] Pacing for session {self.sessionId}: {self.pacer.summary()}")
+        if self.feedback:
+            print(f"[AsyncServer] RTCP for session {self.sessionId}: {self.feedback.summary()}")
+        if self.videoStream and self.videoStream.cache:
+            print(f"[AsyncServer] Frame cache: {self.videoStream.cache.summary()}")
+
+    def sendSenderReport(self):
+        """Timer callback: send an SR while playing and schedule the next one"""
+        if self.state == PLAYING and self.clientRtcpPort:
+            report = senderReport(self.rtpSender.ssrc, self.pacer,
+                                  self.rtpSender.packetsSent, self.rtpSender.bytesSent)
+            self.rtcpTransport.sendto(report, (self.clientAddr[0], self.clientRtcpPort))
+        self.rtcpTimer = asyncio.get_running_loop().call_later(reportInterval(),
+                                                               self.sendSenderReport)
+
+    def sendNextFrame(self, generation):
+        """Timer callback: send one frame and schedule the next"""
+        if generation != self.generation or self.state != PLAYING:
+            return
+
+        try:
+            # Too far behind: skip frames rather than bursting them
+            for _ in range(self.pacer.framesToDrop()):
+                self.readFrame()
+
+            # Get next frame from video
+            data = self.readFrame()
+            if data:
+                # All fragments share the frame's media timestamp (90kHz clock)
+                self.sendFrame(data, self.pacer.rtpTimestamp())
+                self.pacer.frameSent()
+        except Exception as e:
+            print(f"[AsyncServer] Error sending RTP: {e}")
+
+        # The next deadline is fixed by the frame rate, not by when we finished
+        self.server.timerWheel.schedule(self.pacer.deadline(),
+                                        lambda: self.sendNextFrame(generation))
+
+    def readFrame(self):
+        """Read the next frame, looping back to the start at end of file"""
+        data = self.videoStream.nextFrame()
+        if not data:
+            self.videoStream.reset()
+            data = self.videoStream.nextFrame()
+        return data
+
+    def sendFrame(self, data, timestamp):
+        """Split a JPEG into MTU-sized RTP/JPEG fragments (RFC 2435) and send them"""
+        for header, chunk, marker in self.packetizer.fragments(data):
+            packet = self.rtpSender.encode((header, chunk), timestamp, marker)
+            self.rtpTransport.sendto(packet)
+            # Counted here for sender reports; encode() only builds the packet
+            self.rtpSender.packetsSent += 1
+            self.rtpSender.bytesSent += len(packet)
+
+    def sendRtspReply(self, code, seq, session=None, headers=None):
+        """Send RTSP reply to the client"""
+        if code == 200:
+            reply = f'RTSP/1.0 200 OK\nCSeq: {seq}\n'
+            if session:
+                reply += f'Session: {session}\n'
+            for name, value in (headers or {}).items():
+                reply += f'{name}: {value}\n'
+        elif code == 404:
+            reply = f'RTSP/1.0 404 Not Found\nCSeq: {seq}\n'
+        else:
+            reply = f'RTSP/1.0 {code}\nCSeq: {seq}\n'
+
+        try:
+            self.writer.write(reply.encode('utf-8'))
+        except Exception as e:
+            print(f"[AsyncServer] Error sending RTSP reply: {e}")
+
+    def cleanup(self):
+        """Clean up resources"""
+        self.state = INIT
+        self.generation += 1
+
+        if self.rtpTransport:
+            self.rtpTransport.close()
+
+        if self.rtcpTimer:
+            self.rtcpTimer.cancel()
+        if self.rtcpTransport:
+            self.rtcpTransport.close()
+
+        if self.videoStream:
+            self.videoStream.close()
+
+        self.writer.close()
+
+        print(f"[AsyncServer] Connection closed for {self.clientAddr}")
+
+
+class AsyncServer:
+    """RTSP server running every session on a single event loop"""
+
+    def __init__(self, port=8554):
+        self.port = port
+        self.timerWheel = None
+        self.sessions = set()
+
+    async def handleClient(self, reader, writer):
+        """Serve one RTSP connection"""
+        session = AsyncSession(self, reader, writer)
+        self.sessions.add(session)
+        try:
+            await session.run()
+        finally:
+            self.sessions.discard(session)
+
+    async def serve(self):
+        """Accept RTSP connections and drive the timer wheel"""
+        self.timerWheel = TimerWheel()
+        server = await asyncio.start_server(self.handleClient, '', self.port, reuse_address=True)
+
+        print(f"[AsyncServer] RTSP Server started on port {self.port} (asyncio)")
+        print("[AsyncServer] Waiting for clients...")
+
+        async with server:
+            await asyncio.gather(server.serve_forever(), self.timerWheel.run())
+
+    def start(self):
+        """Start the RTSP server"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            print("\n[AsyncServer] Server interrupted by user")
+        except Exception as e:
+            print(f"[AsyncServer] Error: {e}")
+        finally:
+            print("[AsyncServer] Server stopped")
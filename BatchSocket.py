@@ -0,0 +1,253 @@
+"""
+Batched UDP Socket I/O
+Sends and receives many datagrams per system call with sendmmsg/recvmmsg on Linux
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import select
+import socket
+import struct
+import sys
+
+# recvmmsg flag: block for the first datagram only (linux/socket.h)
+MSG_WAITFORONE = 0x10000
+_MSG_TRUNC = getattr(socket, 'MSG_TRUNC', 0x20)
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [('base', ctypes.c_void_p), ('len', ctypes.c_size_t)]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [('name', ctypes.c_void_p), ('namelen', ctypes.c_uint32),
+                ('iov', ctypes.POINTER(_Iovec)), ('iovlen', ctypes.c_size_t),
+                ('control', ctypes.c_void_p), ('controllen', ctypes.c_size_t),
+                ('flags', ctypes.c_int)]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [('hdr', _Msghdr), ('len', ctypes.c_uint)]
+
+
+def _loadLibc():
+    """Return libc if it provides sendmmsg and recvmmsg, else None"""
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or None, use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_Mmsghdr),
+                                  ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.POINTER(_Mmsghdr),
+                                  ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+_libc = _loadLibc()
+
+# True where datagrams can be batched into one system call
+HAVE_MMSG = _libc is not None
+
+
+def _sockaddrIn(addr):
+    """Pack an IPv4 (host, port) as a struct sockaddr_in, or None if it is not one"""
+    try:
+        host = socket.inet_aton(addr[0])
+    except (OSError, TypeError, IndexError):
+        return None
+    return struct.pack('=H', socket.AF_INET) + struct.pack('!H', addr[1]) + host + bytes(8)
+
+
+def _bufferAddress(buffer):
+    """Return (keepalive, address) of a writable buffer"""
+    view = (ctypes.c_char * len(buffer)).from_buffer(buffer)
+    return view, ctypes.addressof(view)
+
+
+def _raiseErrno():
+    code = ctypes.get_errno()
+    raise OSError(code, errno.errorcode.get(code, 'error'))
+
+
+class _MessageVector:
+    """One mmsghdr per slot of a buffer, built once and reused"""
+
+    def __init__(self, buffer, slots, slotSize, name=None):
+        self.keepalive, base = _bufferAddress(buffer)
+        self.iovecs = (_Iovec * slots)()
+        self.messages = (_Mmsghdr * slots)()
+        for i in range(slots):
+            self.iovecs[i].base = base + i * slotSize
+            self.iovecs[i].len = slotSize
+            hdr = self.messages[i].hdr
+            hdr.iov = ctypes.pointer(self.iovecs[i])
+            hdr.iovlen = 1
+            if name is not None:
+                # Every message goes to the address held in name
+                hdr.name = ctypes.addressof(name)
+                hdr.namelen = len(name)
+
+
+class BatchSender:
+    """
+    Queues datagrams and sends them together.
+
+    Each datagram is gathered from its parts into a fixed slot of a
+    preallocated buffer; send() hands every queued slot to the kernel in a
+    single sendmmsg call. Without sendmmsg (or for non-IPv4 destinations)
+    the queued slots are sent one sendto at a time.
+
+    A growable sender has no fixed destination: it stages a whole frame once
+    and send() can then be repeated for several destinations.
+    """
+
+    def __init__(self, sock=None, addr=None, slots=16, slotSize=2048, growable=False):
+        self.slotSize = slotSize
+        self.growable = growable
+        self.count = 0
+        # struct sockaddr_in of the destination, shared by all messages
+        self.name = ctypes.create_string_buffer(16) if HAVE_MMSG else None
+        self.batched = False
+        self._allocate(slots)
+        self.setDestination(sock, addr)
+
+        # Metrics
+        self.packetsSent = 0
+        self.bytesSent = 0
+        self.syscalls = 0
+
+    def _allocate(self, slots):
+        """(Re)build the slot buffer, keeping any queued datagrams"""
+        buffer = bytearray(slots * self.slotSize)
+        if self.count:
+            buffer[:self.count * self.slotSize] = self.view[:self.count * self.slotSize]
+            self.view.release()
+        lengths = [0] * slots
+        if self.count:
+            lengths[:self.count] = self.lengths[:self.count]
+        self.slots = slots
+        self.buffer = buffer
+        self.view = memoryview(buffer)
+        self.lengths = lengths
+        self.vector = _MessageVector(buffer, slots, self.slotSize, self.name) if HAVE_MMSG else None
+        if self.vector is not None:
+            for i in range(self.count):
+                self.vector.iovecs[i].len = lengths[i]
+
+    def setDestination(self, sock, addr):
+        """Send subsequent datagrams from sock to addr"""
+        self.sock = sock
+        self.addr = addr
+        sockaddr = _sockaddrIn(addr) if addr and self.name is not None else None
+        self.batched = bool(sockaddr) and sock is not None and sock.family == socket.AF_INET
+        if self.batched:
+            ctypes.memmove(self.name, sockaddr, len(sockaddr))
+
+    def add(self, parts):
+        """Queue one datagram made of the concatenated parts. Returns its length."""
+        if self.count == self.slots:
+            if self.growable:
+                self._allocate(self.slots * 2)
+            else:
+                self.flush()
+        view = self.view
+        pos = start = self.count * self.slotSize
+        for part in parts:
+            end = pos + len(part)
+            view[pos:end] = part
+            pos = end
+        length = pos - start
+        if length > self.slotSize:
+            # The overflow only touched the next (unqueued) slot
+            raise ValueError(f"Datagram larger than slot size {self.slotSize}")
+        if self.vector is not None:
+            self.vector.iovecs[self.count].len = length
+        self.lengths[self.count] = length
+        self.count += 1
+        return length
+
+    def send(self):
+        """Send every queued datagram to the destination, keeping them queued"""
+        count = self.count
+        if count == 0:
+            return 0
+
+        sent = 0
+        if self.batched:
+            sent = _libc.sendmmsg(self.sock.fileno(), self.vector.messages, count, 0)
+            self.syscalls += 1
+            if sent < 0:
+                if ctypes.get_errno() not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                    _raiseErrno()
+                sent = 0
+            for i in range(sent):
+                self.bytesSent += self.lengths[i]
+
+        # Whatever the kernel did not take (or everything, without sendmmsg)
+        for i in range(sent, count):
+            start = i * self.slotSize
+            self.bytesSent += self.sock.sendto(self.view[start:start + self.lengths[i]], self.addr)
+            self.syscalls += 1
+
+        self.packetsSent += count
+        return count
+
+    def clear(self):
+        """Drop every queued datagram"""
+        self.count = 0
+
+    def flush(self):
+        """Send every queued datagram and empty the queue. Returns the number sent."""
+        try:
+            return self.send()
+        finally:
+            self.count = 0
+
+
+class BatchReceiver:
+    """
+    Receives a burst of datagrams into the slots of a caller's buffer with a
+    single recvmmsg call. Only usable where HAVE_MMSG is true.
+    """
+
+    def __init__(self, sock, buffer, slots, slotSize):
+        self.sock = sock
+        self.slots = slots
+        self.slotSize = slotSize
+        self.vector = _MessageVector(buffer, slots, slotSize)
+        self.poller = select.poll()
+        self.poller.register(sock, select.POLLIN)
+        self.syscalls = 0
+
+    def receive(self, lengths, flags=0):
+        """
+        Wait (honoring the socket timeout) until a datagram is queued, then
+        take up to one slot's worth of every queued datagram. Fills lengths
+        and returns the number received.
+        """
+        fd = self.sock.fileno()
+        timeout = self.sock.gettimeout()
+        while True:
+            if timeout is not None:
+                # Timeout sockets are non-blocking underneath, so wait here
+                if not self.poller.poll(timeout * 1000):
+                    raise socket.timeout('timed out')
+                count = _libc.recvmmsg(fd, self.vector.messages, self.slots,
+                                       socket.MSG_DONTWAIT | flags, None)
+            else:
+                count = _libc.recvmmsg(fd, self.vector.messages, self.slots,
+                                       MSG_WAITFORONE | flags, None)
+            self.syscalls += 1
+            if count >= 0:
+                break
+            if ctypes.get_errno() not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                _raiseErrno()
+
+        for i in range(count):
+            message = self.vector.messages[i]
+            # Mark datagrams cut short by the slot size as oversized
+            lengths[i] = self.slotSize + 1 if message.hdr.flags & _MSG_TRUNC else message.len
+        return count
@@ -0,0 +1,376 @@
+"""
+Streaming Benchmarks
+Measure CPU and memory cost of the server's streaming paths on loopback
+"""
+
+import sys
+import os
+import socket
+import time
+import tracemalloc
+from Server import ServerWorker
+from VideoStream import VideoStream
+from Broadcast import BroadcastSource, BroadcastSubscriber
+from RtpPacket import RtpPacket, RtpSender, RtpRing
+from BatchSocket import HAVE_MMSG
+
+
+def _sink():
+    """Create a UDP socket that receives (and never reads) benchmark traffic"""
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', 0))
+    return sink
+
+
+def _measure(setup, step, frames):
+    """Run setup() once then step() per frame; return (cpu s, wall s, peak bytes)"""
+    tracemalloc.start()
+    state = setup()
+    cpuStart = time.process_time()
+    wallStart = time.perf_counter()
+    for _ in range(frames):
+        step(state)
+    cpu = time.process_time() - cpuStart
+    wall = time.perf_counter() - wallStart
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return state, cpu, wall, peak
+
+
+def benchmark_fanout(mjpeg_file, viewer_counts, frames=100):
+    """
+    Compare one reader per session against one shared reader per file
+
+    Args:
+        mjpeg_file: MJPEG file to stream
+        viewer_counts: Numbers of concurrent viewers to test
+        frames: Frames sent per run
+    """
+    sink = _sink()
+    addr = sink.getsockname()
+
+    print(f"Fan-out benchmark: {mjpeg_file}, {frames} frames per run")
+    print(f"{'Viewers':>8} {'Mode':>10} {'CPU ms/frame':>14} {'CPU us/viewer':>14} "
+          f"{'Peak KB':>10} {'KB/viewer':>10} {'Files':>6}")
+
+    for viewers in viewer_counts:
+        # One VideoStream and packetizer per session (ServerWorker.sendRtp)
+        def setup_sessions():
+            workers = []
+            for i in range(viewers):
+                worker = ServerWorker({'socket': None, 'addr': addr})
+                worker.clientRtpPort = addr[1]
+                worker.sessionId = i + 1
+                worker.videoStream = VideoStream(mjpeg_file)
+                worker.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                worker.rtpSender = RtpSender(worker.rtpSocket, addr, i + 1, batched=True)
+                workers.append(worker)
+            return workers
+
+        def step_sessions(workers):
+            for worker in workers:
+                worker.sendFrame(worker.readFrame(), 0)
+
+        # One shared reader, datagrams patched per subscriber
+        def setup_shared():
+            source = BroadcastSource(mjpeg_file, VideoStream(mjpeg_file))
+            for i in range(viewers):
+                rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                source.subscribers.append(BroadcastSubscriber(rtpSocket, addr, i + 1))
+            return source
+
+        def step_shared(source):
+            source.step()
+
+        for mode, setup, step in (('session', setup_sessions, step_sessions),
+                                  ('shared', setup_shared, step_shared)):
+            state, cpu, wall, peak = _measure(setup, step, frames)
+            cpuPerFrame = cpu * 1000 / frames
+            print(f"{viewers:>8} {mode:>10} {cpuPerFrame:>14.3f} "
+                  f"{cpuPerFrame * 1000 / viewers:>14.1f} {peak / 1024:>10.1f} "
+                  f"{peak / 1024 / viewers:>10.1f} {viewers if mode == 'session' else 1:>6}")
+
+            # Release sockets and files before the next run
+            if mode == 'session':
+                for worker in state:
+                    worker.rtpSocket.close()
+                    worker.videoStream.close()
+            else:
+                for subscriber in state.subscribers:
+                    subscriber.rtpSocket.close()
+                state.videoStream.close()
+
+    sink.close()
+
+
+def benchmark_rtp_encode(packets=200000, payload_size=1380):
+    """
+    Compare packets/sec of RtpPacket objects against RtpSender
+
+    Args:
+        packets: Packets per run
+        payload_size: Payload bytes per packet (RTP/JPEG fragment size)
+    """
+    sink = _sink()
+    addr = sink.getsockname()
+    rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    jpegHeader = bytes(8)
+    chunk = memoryview(bytes(payload_size - len(jpegHeader)))
+
+    def packet_encode():
+        for i in range(packets):
+            rtpPacket = RtpPacket()
+            rtpPacket.setPayloadType(26)
+            rtpPacket.setSeqNum(i & 0xFFFF)
+            rtpPacket.setTimestamp(i)
+            rtpPacket.setMarker(0)
+            rtpPacket.setSSRC(1234)
+            rtpPacket.setPayload(jpegHeader + chunk)
+            rtpPacket.encode()
+
+    def packet_send():
+        for i in range(packets):
+            rtpPacket = RtpPacket()
+            rtpPacket.setPayloadType(26)
+            rtpPacket.setSeqNum(i & 0xFFFF)
+            rtpPacket.setTimestamp(i)
+            rtpPacket.setMarker(0)
+            rtpPacket.setSSRC(1234)
+            rtpPacket.setPayload(jpegHeader + chunk)
+            rtpSocket.sendto(rtpPacket.encode(), addr)
+
+    sender = RtpSender(rtpSocket, addr, 1234)
+    parts = (jpegHeader, chunk)
+
+    def sender_encode():
+        for i in range(packets):
+            sender.packHeader(i, 0)
+
+    def sender_send():
+        for i in range(packets):
+            sender.send(parts, i, 0)
+
+    print(f"RTP encode benchmark: {packets} packets of {payload_size} payload bytes")
+    print(f"sendmsg available: {sender.useSendmsg}")
+    print(f"{'Path':>28} {'Packets/sec':>14} {'us/packet':>10}")
+
+    for name, run in (('RtpPacket encode', packet_encode),
+                      ('RtpSender pack header', sender_encode),
+                      ('RtpPacket encode + sendto', packet_send),
+                      ('RtpSender sendmsg', sender_send)):
+        start = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - start
+        print(f"{name:>28} {packets / elapsed:>14.0f} {elapsed * 1e6 / packets:>10.2f}")
+
+    rtpSocket.close()
+    sink.close()
+
+
+def benchmark_udp(packets=200000, payload_size=1380, burst=64):
+    """
+    Compare per-datagram and batched UDP send/receive throughput on loopback
+
+    Args:
+        packets: Packets per run
+        payload_size: Payload bytes per packet (RTP/JPEG fragment size)
+        burst: Packets sent or received per batch (about one frame)
+    """
+    sink = _sink()
+    addr = sink.getsockname()
+    rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    parts = (bytes(8), memoryview(bytes(payload_size - 8)))
+    rounds = packets // burst
+
+    def send_single():
+        sender = RtpSender(rtpSocket, addr, 1234)
+        for _ in range(rounds):
+            for i in range(burst):
+                sender.send(parts, 0, i == burst - 1)
+
+    def send_batched():
+        sender = RtpSender(rtpSocket, addr, 1234, batched=True)
+        for _ in range(rounds):
+            for i in range(burst):
+                sender.send(parts, 0, i == burst - 1)
+            sender.flush()
+
+    print(f"UDP benchmark: {rounds * burst} packets of {payload_size} payload bytes, "
+          f"bursts of {burst}")
+    print(f"sendmmsg/recvmmsg available: {HAVE_MMSG}")
+    print(f"{'Path':>28} {'Packets/sec':>14} {'us/packet':>10}")
+
+    def report(name, elapsed):
+        print(f"{name:>28} {rounds * burst / elapsed:>14.0f} "
+              f"{elapsed * 1e6 / (rounds * burst):>10.2f}")
+
+    for name, run in (('send per datagram', send_single),
+                      ('send batched', send_batched)):
+        start = time.perf_counter()
+        run()
+        report(name, time.perf_counter() - start)
+
+    # Receive: queue one burst, then time draining it
+    sink.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    sink.settimeout(1.0)
+    feeder = RtpSender(rtpSocket, addr, 1234, batched=True)
+
+    def recv_single():
+        elapsed = 0.0
+        for _ in range(rounds):
+            for i in range(burst):
+                feeder.send(parts, 0)
+            feeder.flush()
+            start = time.perf_counter()
+            for i in range(burst):
+                data, _ = sink.recvfrom(65536)
+                rtpPacket = RtpPacket()
+                rtpPacket.decode(data)
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    def recv_batched():
+        ring = RtpRing(burst)
+        elapsed = 0.0
+        for _ in range(rounds):
+            for i in range(burst):
+                feeder.send(parts, 0)
+            feeder.flush()
+            start = time.perf_counter()
+            received = 0
+            while received < burst:
+                received += len(ring.decode(ring.receive(sink)))
+            elapsed += time.perf_counter() - start
+        return elapsed
+
+    for name, run in (('recv + decode per datagram', recv_single),
+                      ('recv + decode batched', recv_batched)):
+        try:
+            report(name, run())
+        except socket.timeout:
+            print(f"{name:>28} {'packets lost, increase SO_RCVBUF':>25}")
+
+    rtpSocket.close()
+    sink.close()
+
+
+def benchmark_web(mjpeg_file, frames=200, viewers=10):
+    """
+    Compare base64 JSON and binary video_frame events from the web gateway
+
+    Args:
+        mjpeg_file: MJPEG file whose frames are sent
+        frames: Frames per run
+        viewers: Browser sessions each frame is sent to
+    """
+    # Needs Flask-SocketIO, so only imported for this benchmark
+    from socketio import packet
+    from WebServer import frame_message
+
+    videoStream = VideoStream(mjpeg_file)
+    count = videoStream.frameCount()
+    jpegs = [bytes(videoStream.getFrame(i % count)) for i in range(frames)] if count else []
+    videoStream.close()
+    if not jpegs:
+        print(f"Error: No frames in {mjpeg_file}")
+        return
+
+    stats = {'frame_num': 0, 'packets': 0, 'data_rate': 0.0, 'fps': 0.0, 'buffer_ms': 0,
+             'buffer_depth': 0, 'late': 0, 'lost': 0, 'jitter_ms': 0.0, 'loss': 0.0}
+    jpegBytes = sum(len(jpeg) for jpeg in jpegs)
+
+    print(f"Web frame benchmark: {mjpeg_file}, {len(jpegs)} frames "
+          f"(avg {jpegBytes / len(jpegs) / 1024:.1f} KB), {viewers} viewers")
+    print(f"{'Transport':>10} {'CPU us/frame/viewer':>20} {'Wire KB/frame':>14} "
+          f"{'Overhead':>9} {'MB/s/viewer @20fps':>19}")
+
+    for transport in ('base64', 'binary'):
+        wireBytes = 0
+        cpuStart = time.process_time()
+        for jpeg in jpegs:
+            for _ in range(viewers):
+                # What each session's socketio.emit serializes
+                message = frame_message(jpeg, stats, transport)
+                encoded = packet.Packet(packet.EVENT, data=['video_frame', message]).encode()
+                if isinstance(encoded, list):
+                    # Text header then one WebSocket message per binary attachment
+                    wireBytes += sum(len(part) for part in encoded)
+                else:
+                    wireBytes += len(encoded)
+        cpu = time.process_time() - cpuStart
+
+        sends = len(jpegs) * viewers
+        perFrame = wireBytes / sends
+        print(f"{transport:>10} {cpu * 1e6 / sends:>20.1f} {perFrame / 1024:>14.1f} "
+              f"{(perFrame / (jpegBytes / len(jpegs)) - 1) * 100:>8.1f}% "
+              f"{perFrame * 20 / 1048576:>19.2f}")
+
+
+def main():
+    """Main function"""
+    if len(sys.argv) < 2:
+        print("Streaming Benchmarks for RTSP/RTP Streaming")
+        print("\nUsage:")
+        print("  Shared reader fan-out vs. one reader per session:")
+        print("    python Benchmark.py fanout <mjpeg_file> [viewers...]")
+        print("    Example: python Benchmark.py fanout video/movie.Mjpeg 1 10 50 200")
+        print("\n  RTP packet encode/send rate:")
+        print("    python Benchmark.py rtp [packets]")
+        print("    Example: python Benchmark.py rtp 200000")
+        print("\n  Per-datagram vs. batched UDP send/receive:")
+        print("    python Benchmark.py udp [packets]")
+        print("    Example: python Benchmark.py udp 200000")
+        print("\n  Web gateway frame delivery, base64 JSON vs. binary:")
+        print("    python Benchmark.py web <mjpeg_file> [frames] [viewers]")
+        print("    Example: python Benchmark.py web video/movie.Mjpeg 200 10")
+        sys.exit(1)
+
+    command = sys.argv[1].lower()
+
+    if command == 'fanout':
+        if len(sys.argv) < 3:
+            print("Error: Missing arguments for fanout command")
+            print("Usage: python Benchmark.py fanout <mjpeg_file> [viewers...]")
+            sys.exit(1)
+
+        mjpeg_file = sys.argv[2]
+        viewer_counts = [int(v) for v in sys.argv[3:]] or [1, 10, 50, 100, 200]
+
+        if not os.path.exists(mjpeg_file):
+            print(f"Error: File {mjpeg_file} not found")
+            sys.exit(1)
+
+        benchmark_fanout(mjpeg_file, viewer_counts)
+
+    elif command == 'rtp':
+        packets = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+        benchmark_rtp_encode(packets)
+
+    elif command == 'udp':
+        packets = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+        benchmark_udp(packets)
+
+    elif command == 'web':
+        if len(sys.argv) < 3:
+            print("Error: Missing arguments for web command")
+            print("Usage: python Benchmark.py web <mjpeg_file> [frames] [viewers]")
+            sys.exit(1)
+
+        mjpeg_file = sys.argv[2]
+        frames = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+        viewers = int(sys.argv[4]) if len(sys.argv) > 4 else 10
+
+        if not os.path.exists(mjpeg_file):
+            print(f"Error: File {mjpeg_file} not found")
+            sys.exit(1)
+
+        benchmark_web(mjpeg_file, frames, viewers)
+
+    else:
+        print(f"Error: Unknown command '{command}'")
+        print("Valid commands: fanout, rtp, udp, web")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+"""
+Shared Broadcast Sources
+Reads and packetizes each video frame once and fans it out to every session
+watching the same file
+"""
+
+import struct
+import threading
+from RtpPacket import RtpSender
+from BatchSocket import BatchSender
+from RtpJpeg import JpegPacketizer
+from Pacer import FramePacer
+
+# Offsets of the per-session fields inside the 12-byte RTP header
+_SEQ = struct.Struct('!H')
+_SEQ_OFFSET = 2
+_SSRC = struct.Struct('!I')
+_SSRC_OFFSET = 8
+
+
+class BroadcastSubscriber:
+    """One session receiving a shared stream, with its own SSRC and sequence"""
+
+    def __init__(self, rtpSocket, addr, ssrc):
+        self.rtpSocket = rtpSocket
+        self.addr = addr
+        self.ssrc = ssrc & 0xFFFFFFFF
+        self.seqNum = 0
+        self.packetsSent = 0
+        self.bytesSent = 0
+
+    def send(self, frame):
+        """Rewrite seq/SSRC in the shared datagrams of a staged frame and send them"""
+        buffer = frame.buffer
+        offset = 0
+        for i in range(frame.count):
+            _SEQ.pack_into(buffer, offset + _SEQ_OFFSET, self.seqNum)
+            _SSRC.pack_into(buffer, offset + _SSRC_OFFSET, self.ssrc)
+            self.seqNum = (self.seqNum + 1) & 0xFFFF
+            offset += frame.slotSize
+        # The whole frame goes out in one sendmmsg call where available
+        frame.setDestination(self.rtpSocket, self.addr)
+        frame.send()
+        self.packetsSent += frame.count
+        self.bytesSent += sum(frame.lengths[:frame.count])
+
+
+class BroadcastSource:
+    """A single reader for one video file shared by all of its subscribers"""
+
+    def __init__(self, filename, videoStream, packetizer=None):
+        self.filename = filename
+        self.videoStream = videoStream
+        self.packetizer = packetizer or JpegPacketizer()
+        self.pacer = FramePacer(videoStream.fps)
+        # Builds the shared headers; seq/SSRC are patched per subscriber
+        self.builder = RtpSender(None, None, 0)
+        # Each frame's datagrams are staged once and sent to every subscriber
+        self.frame = BatchSender(growable=True)
+        self.subscribers = []
+        self.lock = threading.Lock()
+        self.stopEvent = threading.Event()
+        self.thread = None
+
+    def subscribe(self, subscriber):
+        """Start sending frames to a subscriber"""
+        with self.lock:
+            if subscriber not in self.subscribers:
+                self.subscribers.append(subscriber)
+            # The sender thread only runs while somebody is watching
+            if self.thread is None and not self.stopEvent.is_set():
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+
+    def unsubscribe(self, subscriber):
+        """Stop sending frames to a subscriber"""
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    def prepare(self, data, timestamp):
+        """Packetize one frame into staged datagrams whose seq/SSRC are patched per subscriber"""
+        self.frame.clear()
+        for header, chunk, marker in self.packetizer.fragments(data):
+            self.frame.add((self.builder.packHeader(timestamp, marker), header, chunk))
+        return self.frame
+
+    def readFrame(self):
+        """Read the next frame, looping back to the start at end of file"""
+        data = self.videoStream.nextFrame()
+        if not data:
+            self.videoStream.reset()
+            data = self.videoStream.nextFrame()
+        return data
+
+    def step(self):
+        """Read, packetize and fan out one frame. Returns False if there was none."""
+        data = self.readFrame()
+        if not data:
+            return False
+
+        # All fragments share the frame's media timestamp (90kHz clock)
+        frame = self.prepare(data, self.pacer.rtpTimestamp())
+
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.send(frame)
+            except Exception as e:
+                print(f"[Broadcast] Error sending to {subscriber.addr}: {e}")
+
+        self.pacer.frameSent()
+        return True
+
+    def run(self):
+        """Send frames to all subscribers until none are left"""
+        print(f"[Broadcast] Starting shared stream for {self.filename}")
+
+        # Frames are due at fixed intervals from now, whatever fan-out costs
+        self.pacer.start()
+
+        while not self.stopEvent.is_set():
+            with self.lock:
+                if not self.subscribers:
+                    self.thread = None
+                    break
+            try:
+                # Wait for the next frame's deadline
+                delay = self.pacer.timeUntilDue()
+                if delay > 0 and self.stopEvent.wait(delay):
+                    break
+
+                # Too far behind: skip frames rather than bursting them
+                for _ in range(self.pacer.framesToDrop()):
+                    self.readFrame()
+
+                self.step()
+            except Exception as e:
+                print(f"[Broadcast] Error streaming {self.filename}: {e}")
+
+        print(f"[Broadcast] Shared stream for {self.filename} idle: {self.pacer.summary()}")
+
+    def close(self):
+        """Stop the sender thread and close the file"""
+        self.stopEvent.set()
+        with self.lock:
+            thread = self.thread
+        if thread and thread is not threading.current_thread():
+            thread.join()
+        self.videoStream.close()
+
+
+class BroadcastHub:
+    """Registry of broadcast sources, one per file, shared by all sessions"""
+
+    def __init__(self, streamFactory):
+        self.streamFactory = streamFactory
+        self.sources = {}
+        self.refCounts = {}
+        self.lock = threading.Lock()
+
+    def acquire(self, filename):
+        """Get (or open) the shared source for a file"""
+        with self.lock:
+            source = self.sources.get(filename)
+            if source is None:
+                source = BroadcastSource(filename, self.streamFactory(filename))
+                self.sources[filename] = source
+                self.refCounts[filename] = 0
+            self.refCounts[filename] += 1
+            return source
+
+    def release(self, source):
+        """Drop a reference; the source is closed when nobody uses it"""
+        with self.lock:
+            filename = source.filename
+            if self.sources.get(filename) is not source:
+                return
+            self.refCounts[filename] -= 1
+            if self.refCounts[filename] > 0:
+                return
+            del self.sources[filename]
+            del self.refCounts[filename]
+        source.close()
@@ -5,13 +5,17 @@ GUI-based client for streaming video with RTSP/RTP
 
 import sys
 import socket
+import select
 import threading
 import time
 from tkinter import *
 from tkinter import messagebox
 from PIL import Image, ImageTk
 import io
-from RtpPacket import RtpPacket
+from RtpPacket import RtpRing
+from RtpJpeg import JpegReassembler
+from JitterBuffer import JitterBuffer
+from RtcpPacket import ReceiverReporter
 
 # RTSP States
 INIT = 0
@@ -24,6 +28,13 @@ PLAY = 'PLAY'
 PAUSE = 'PAUSE'
 TEARDOWN = 'TEARDOWN'
 
+# RTP receive ring: datagrams taken per burst, and slot size (above the server MTU)
+RTP_RING_SLOTS = 64
+RTP_SLOT_SIZE = 2048
+
+# Longest wait for RTP packets before checking for a stop
+RTP_TIMEOUT = 0.5
+
 
 class Client:
     """RTSP Client with GUI"""
@@ -43,6 +54,8 @@ class Client:
         # RTSP/RTP parameters
         self.rtspSocket = None
         self.rtpSocket = None
+        self.rtcpSocket = None
+        self.rtcp = None
         self.rtspSeq = 0
         self.sessionId = 0
         self.requestSent = INIT
@@ -51,10 +64,16 @@ class Client:
         
         # Statistics
         self.frameNum = 0
+        self.framesReceived = 0
         self.packetsReceived = 0
         self.bytesReceived = 0
         self.startTime = 0
         
+        # RTP/JPEG frame reassembly
+        self.rtpRing = RtpRing(RTP_RING_SLOTS, RTP_SLOT_SIZE)
+        self.jitterBuffer = JitterBuffer()
+        self.reassembler = JpegReassembler()
+        
         # Threading
         self.rtpThread = None
         self.stopEvent = threading.Event()
@@ -89,9 +108,25 @@ class Client:
         self.teardown["command"] = self.exitClient
         self.teardown.grid(row=1, column=3, padx=2, pady=2)
         
+        # Seek control (seconds from the start of the video)
+        self.seekLabel = Label(self.master, text="Position (s):", anchor=E)
+        self.seekLabel.grid(row=2, column=0, sticky=E, padx=2, pady=2)
+        
+        self.seekEntry = Entry(self.master, width=20)
+        self.seekEntry.insert(0, "0")
+        self.seekEntry.grid(row=2, column=1, padx=2, pady=2)
+        
+        self.seek = Button(self.master, width=20, padx=3, pady=3)
+        self.seek["text"] = "Seek"
+        self.seek["command"] = self.seekMovie
+        self.seek.grid(row=2, column=2, padx=2, pady=2)
+        
+        self.rangeLabel = Label(self.master, text="", anchor=W)
+        self.rangeLabel.grid(row=2, column=3, sticky=W, padx=2, pady=2)
+        
         # Statistics display
         self.statsLabel = Label(self.master, text="Statistics: ", anchor=W, justify=LEFT)
-        self.statsLabel.grid(row=2, column=0, columnspan=4, sticky=W, padx=5, pady=5)
+        self.statsLabel.grid(row=3, column=0, columnspan=4, sticky=W, padx=5, pady=5)
     
     def setupMovie(self):
         """Send SETUP request"""
@@ -103,14 +138,20 @@ class Client:
                 
                 # Create RTP socket
                 self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-                self.rtpSocket.settimeout(0.5)
+                self.rtpSocket.settimeout(RTP_TIMEOUT)
                 self.rtpSocket.bind(('', self.rtpPort))
                 
+                # Create RTCP socket on the next port up (polled from the RTP thread)
+                self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.rtcpSocket.setblocking(False)
+                self.rtcpSocket.bind(('', self.rtpPort + 1))
+                self.rtcp = ReceiverReporter(self.rtcpSocket, playback=self.reassembler)
+                
                 # Send SETUP request
                 self.rtspSeq += 1
                 request = f"{SETUP} {self.fileName} RTSP/1.0\n"
                 request += f"CSeq: {self.rtspSeq}\n"
-                request += f"Transport: RTP/AVP;unicast;client_port={self.rtpPort}\n"
+                request += f"Transport: RTP/AVP;unicast;client_port={self.rtpPort}-{self.rtpPort + 1}\n"
                 
                 self.rtspSocket.send(request.encode('utf-8'))
                 self.requestSent = SETUP
@@ -127,6 +168,12 @@ class Client:
                 
                 if seqNum == self.rtspSeq:
                     self.sessionId = int(lines[2].split(' ')[1])
+                    
+                    # Receiver reports go to the server's RTCP port
+                    serverRtcpPort = self.parseServerRtcpPort(lines)
+                    if serverRtcpPort:
+                        self.rtcp.serverAddr = (self.serverAddr, serverRtcpPort)
+                    
                     self.state = READY
                     messagebox.showinfo("Setup", "Setup successful!")
                     print(f"[Client] Session {self.sessionId} established")
@@ -135,15 +182,27 @@ class Client:
                 messagebox.showerror("Error", f"Setup failed: {e}")
                 print(f"[Client] Setup error: {e}")
     
-    def playMovie(self):
-        """Send PLAY request"""
-        if self.state == READY:
+    @staticmethod
+    def parseServerRtcpPort(lines):
+        """Get the server's RTCP port from the Transport header of a SETUP reply"""
+        for line in lines:
+            if line.startswith('Transport:') and 'server_port=' in line:
+                ports = line.split('server_port=')[1].split(';')[0].strip().split('-')
+                if len(ports) > 1:
+                    return int(ports[1])
+        return 0
+    
+    def playMovie(self, position=None):
+        """Send PLAY request, optionally starting at a position in seconds"""
+        if self.state == READY or (self.state == PLAYING and position is not None):
             try:
                 # Send PLAY request
                 self.rtspSeq += 1
                 request = f"{PLAY} {self.fileName} RTSP/1.0\n"
                 request += f"CSeq: {self.rtspSeq}\n"
                 request += f"Session: {self.sessionId}\n"
+                if position is not None:
+                    request += f"Range: npt={position:.3f}-\n"
                 
                 self.rtspSocket.send(request.encode('utf-8'))
                 self.requestSent = PLAY
@@ -159,6 +218,16 @@ class Client:
                 seqNum = int(lines[1].split(' ')[1])
                 
                 if seqNum == self.rtspSeq:
+                    # Show the position the server is playing from
+                    for line in lines:
+                        if line.startswith('Range:'):
+                            self.rangeLabel.config(text=line.split(' ', 1)[1])
+                    
+                    if self.state == PLAYING:
+                        # Repositioned while playing: the RTP thread keeps running
+                        print(f"[Client] Seeked to {position:.3f}s")
+                        return
+                    
                     self.state = PLAYING
                     self.startTime = time.time()
                     
@@ -173,6 +242,19 @@ class Client:
                 messagebox.showerror("Error", f"Play failed: {e}")
                 print(f"[Client] Play error: {e}")
     
+    def seekMovie(self):
+        """Send PLAY with a Range header to jump to the entered position"""
+        if self.state not in (READY, PLAYING):
+            return
+        
+        try:
+            position = float(self.seekEntry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Position must be a number of seconds")
+            return
+        
+        self.playMovie(max(position, 0.0))
+    
     def pauseMovie(self):
         """Send PAUSE request"""
         if self.state == PLAYING:
@@ -240,6 +322,9 @@ class Client:
             # Close sockets
             if self.rtpSocket:
                 self.rtpSocket.close()
+            if self.rtcpSocket:
+                self.rtcp.bye()
+                self.rtcpSocket.close()
             if self.rtspSocket:
                 self.rtspSocket.close()
             
@@ -254,36 +339,65 @@ class Client:
         """Listen for RTP packets"""
         print("[Client] Listening for RTP packets...")
         
+        # Resuming after a pause starts a new playout clock
+        self.jitterBuffer.reset()
+        self.reassembler.reset()
+        
         while not self.stopEvent.is_set():
             try:
-                # Receive RTP packet
-                data, addr = self.rtpSocket.recvfrom(20480)
+                # Wake up for the next playout deadline or RTCP report if it comes first
+                wait = self.jitterBuffer.timeUntilNext()
+                wait = self.rtcp.timeUntilReport() if wait is None else \
+                    min(wait, self.rtcp.timeUntilReport())
+                readable, _, _ = select.select([self.rtpSocket, self.rtcpSocket], [], [],
+                                               min(max(wait, 0), RTP_TIMEOUT))
                 
-                if data:
-                    # Decode RTP packet
-                    rtpPacket = RtpPacket()
-                    rtpPacket.decode(data)
+                # Sender reports are read as they arrive so the RTT measurement holds
+                if self.rtcpSocket in readable:
+                    self.rtcp.poll()
+                
+                if self.rtpSocket in readable:
+                    # Receive a burst of RTP packets and parse their headers together
+                    count = self.rtpRing.receive(self.rtpSocket)
+                    batch = self.rtpRing.decode(count)
                     
                     # Update statistics
-                    self.packetsReceived += 1
-                    self.bytesReceived += len(data)
-                    self.frameNum = rtpPacket.getSeqNum()
-                    
-                    # Update statistics display
-                    self.updateStats()
-                    
-                    # Get frame data
-                    payload = rtpPacket.getPayload()
+                    self.packetsReceived += len(batch)
+                    self.bytesReceived += batch.bytes
                     
-                    # Display frame
-                    self.displayFrame(payload)
+                    # Reorder in the jitter buffer
+                    now = time.monotonic()
+                    for packet in zip(batch.seqNums, batch.timestamps, batch.markers,
+                                      batch.payloads):
+                        self.jitterBuffer.push(*packet, now)
+                    self.rtcp.update(batch, now)
                     
             except socket.timeout:
-                continue
+                pass
             except Exception as e:
                 if not self.stopEvent.is_set():
                     print(f"[Client] Error receiving RTP: {e}")
                 break
+            
+            self.playOut()
+            self.rtcp.poll()
+    
+    def playOut(self):
+        """Reassemble and display the packets that are due for playout"""
+        for timestamp, marker, payload in self.jitterBuffer.pop():
+            # Add the fragment; a frame is returned once it is complete
+            frame = self.reassembler.addPacket(timestamp, marker, payload)
+            if frame is None:
+                continue
+            
+            self.framesReceived += 1
+            self.frameNum = self.reassembler.framesCompleted
+            
+            # Update statistics display
+            self.updateStats()
+            
+            # Display frame
+            self.displayFrame(frame)
     
     def displayFrame(self, data):
         """Display video frame"""
@@ -309,11 +423,16 @@ class Client:
         if self.startTime > 0:
             elapsed = time.time() - self.startTime
             dataRate = (self.bytesReceived * 8) / (elapsed * 1000)  # kbps
-            fps = self.packetsReceived / elapsed if elapsed > 0 else 0
+            fps = self.framesReceived / elapsed if elapsed > 0 else 0
             
             stats = f"Statistics:\n"
             stats += f"Frame: {self.frameNum} | "
             stats += f"Packets: {self.packetsReceived} | "
+            stats += f"Dropped: {self.reassembler.framesDropped} | "
+            stats += f"Late: {self.jitterBuffer.late} | "
+            stats += f"Lost: {self.jitterBuffer.lost} | "
+            stats += f"Buffer: {self.jitterBuffer.depth()} ({self.jitterBuffer.delay * 1000:.0f} ms) | "
+            stats += f"Jitter: {self.rtcp.stats.jitterSeconds() * 1000:.1f} ms | "
             stats += f"Data Rate: {dataRate:.2f} kbps | "
             stats += f"FPS: {fps:.2f}"
             
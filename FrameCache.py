@@ -0,0 +1,199 @@
+"""
+Frame Cache
+Server-wide in-memory cache of video frames with segmented LRU eviction and pinning
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+# Share of the budget reserved for frames that were hit more than once
+PROTECTED_RATIO = 0.8
+
+
+class FrameCache:
+    """
+    Byte-bounded frame cache shared by every VideoStream in the process.
+
+    Eviction is segmented LRU: a newly cached frame enters the probation
+    segment and moves to the protected segment when it is hit again.
+    Frames leaving the protected segment drop back to probation, and only
+    probation frames are evicted. A scan through cold content therefore
+    only churns probation and cannot push out frames of titles that are
+    being watched.
+
+    Frames of pinned files are kept outside both segments and never
+    evicted. They count against the same budget: the segments shrink to
+    make room for them, and a file that would push pinned frames past the
+    budget is refused (frames beyond it are cached as ordinary frames).
+
+    Keys are (path, size, mtime, frame number), so a file replaced on disk
+    is never served from stale entries.
+    """
+
+    def __init__(self, maxBytes, protectedRatio=PROTECTED_RATIO):
+        self.maxBytes = maxBytes
+        self.protectedRatio = protectedRatio
+        self.protectedLimit = int(maxBytes * protectedRatio)
+        self.probation = OrderedDict()
+        self.protected = OrderedDict()
+        self.pinned = {}
+        self.pinnedPaths = set()
+        self.probationBytes = 0
+        self.protectedBytes = 0
+        self.pinnedBytes = 0
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.insertions = 0
+        self.pinOverflows = 0
+
+    def get(self, key):
+        """Cached frame data for a key, or None"""
+        with self.lock:
+            data = self.pinned.get(key)
+            if data is None:
+                data = self.protected.get(key)
+                if data is not None:
+                    self.protected.move_to_end(key)
+                else:
+                    data = self.probation.pop(key, None)
+                    if data is not None:
+                        # Second hit: promote
+                        self.probationBytes -= len(data)
+                        self.protected[key] = data
+                        self.protectedBytes += len(data)
+                        self._demote()
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Cache frame data (bytes) read from disk"""
+        size = len(data)
+        with self.lock:
+            if key in self.pinned or key in self.protected or key in self.probation:
+                return
+            if key[0] in self.pinnedPaths and self.pinnedBytes + size <= self.maxBytes:
+                self.pinned[key] = data
+                self.pinnedBytes += size
+                self._resize()
+            else:
+                if key[0] in self.pinnedPaths:
+                    # Pinned frames may not take more than the whole budget
+                    self.pinOverflows += 1
+                    if self.pinOverflows == 1:
+                        print(f"[FrameCache] Pinned frames exceed the "
+                              f"{self.maxBytes / 1048576:.0f} MB budget, caching the rest "
+                              f"of {key[0]} as ordinary frames")
+                if not self._insert(key, data):
+                    return
+            self.insertions += 1
+
+    def _insert(self, key, data):
+        """Add a frame to probation; False if it is larger than the whole segment"""
+        size = len(data)
+        if size > self.maxBytes - self.pinnedBytes - self.protectedLimit:
+            return False
+        self.probation[key] = data
+        self.probationBytes += size
+        self._evict()
+        return True
+
+    def _demote(self):
+        """Move the least recently used protected frames back to probation"""
+        while self.protectedBytes > self.protectedLimit:
+            key, data = self.protected.popitem(last=False)
+            self.protectedBytes -= len(data)
+            self.probation[key] = data
+            self.probationBytes += len(data)
+        self._evict()
+
+    def _evict(self):
+        """Drop probation frames (then demoted protected ones) until the cache fits its budget"""
+        while self.probationBytes + self.protectedBytes + self.pinnedBytes > self.maxBytes:
+            if not self.probation:
+                if not self.protected:
+                    break
+                key, data = self.protected.popitem(last=False)
+                self.protectedBytes -= len(data)
+                self.probation[key] = data
+                self.probationBytes += len(data)
+            key, data = self.probation.popitem(last=False)
+            self.probationBytes -= len(data)
+            self.evictions += 1
+
+    def _resize(self):
+        """Fit the segments into the budget left over by pinned frames"""
+        self.protectedLimit = int((self.maxBytes - self.pinnedBytes) * self.protectedRatio)
+        self._demote()
+
+    def pin(self, path, size=0):
+        """
+        Never evict frames of a file (already cached frames are moved over).
+        Returns False, pinning nothing, if size bytes of frames would not
+        fit in the budget next to the files already pinned.
+        """
+        path = os.path.abspath(path)
+        with self.lock:
+            if self.pinnedBytes + size > self.maxBytes:
+                return False
+            self.pinnedPaths.add(path)
+            for segment in (self.probation, self.protected):
+                for key in [key for key in segment if key[0] == path]:
+                    data = segment.pop(key)
+                    if segment is self.probation:
+                        self.probationBytes -= len(data)
+                    else:
+                        self.protectedBytes -= len(data)
+                    self.pinned[key] = data
+                    self.pinnedBytes += len(data)
+            self._resize()
+            return True
+
+    def unpin(self, path):
+        """Make a pinned file's frames evictable again"""
+        path = os.path.abspath(path)
+        with self.lock:
+            self.pinnedPaths.discard(path)
+            for key in [key for key in self.pinned if key[0] == path]:
+                data = self.pinned.pop(key)
+                self.pinnedBytes -= len(data)
+                self.probation[key] = data
+                self.probationBytes += len(data)
+            self._resize()
+
+    def isPinned(self, path):
+        """True if a file's frames are pinned"""
+        return os.path.abspath(path) in self.pinnedPaths
+
+    def stats(self):
+        """Cache metrics for logging"""
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'insertions': self.insertions,
+                'frames': len(self.probation) + len(self.protected) + len(self.pinned),
+                'cached_bytes': self.probationBytes + self.protectedBytes,
+                'pinned_bytes': self.pinnedBytes,
+                'pin_overflows': self.pinOverflows,
+                'max_bytes': self.maxBytes,
+            }
+
+    def summary(self):
+        """One-line description of the cache metrics"""
+        s = self.stats()
+        return (f"hits {s['hits']}, misses {s['misses']} ({s['hit_ratio'] * 100:.1f}% hit), "
+                f"evictions {s['evictions']}, {s['frames']} frames, "
+                f"{(s['cached_bytes'] + s['pinned_bytes']) / 1048576:.1f}/"
+                f"{s['max_bytes'] / 1048576:.0f} MB used "
+                f"({s['pinned_bytes'] / 1048576:.1f} MB pinned)")
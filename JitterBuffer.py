@@ -0,0 +1,170 @@
+"""
+RTP Jitter Buffer
+Reorders received RTP packets and releases them on a playout clock
+"""
+
+import heapq
+import time
+from Pacer import CLOCK_RATE
+
+
+def _extend(value, reference, bits):
+    """Unwrap a sequence number or timestamp to the value closest to reference"""
+    half = 1 << (bits - 1)
+    delta = ((value - reference + half) & ((1 << bits) - 1)) - half
+    return reference + delta
+
+
+class JitterBuffer:
+    """
+    Receiver-side jitter buffer.
+
+    Packets are keyed on their extended (wraparound-free) sequence numbers,
+    so reordered packets are released in order and anything arriving after
+    its successors were released is dropped as late. Each packet is played
+    out at a fixed offset from its RTP timestamp: the earliest observed
+    transit time plus a delay that adapts to the measured interarrival
+    jitter (RFC 3550) and grows whenever packets turn up late. Gaps in the
+    sequence when packets are released are counted as lost; the frame they
+    belonged to is dropped by the reassembler and the last frame stays on
+    screen.
+    """
+
+    def __init__(self, clockRate=CLOCK_RATE, minDelay=0.04, maxDelay=0.5,
+                 maxPackets=2048, clock=time.monotonic):
+        self.clockRate = clockRate
+        self.minDelay = minDelay
+        self.maxDelay = maxDelay
+        self.maxPackets = maxPackets
+        self.clock = clock
+        self.reset()
+
+        # Counters (kept across resets)
+        self.received = 0
+        self.late = 0
+        self.lost = 0
+        self.duplicates = 0
+        self.reordered = 0
+        self.resyncs = 0
+
+    def reset(self):
+        """Forget buffered packets and the playout clock (PLAY after PAUSE)"""
+        self.heap = []
+        self.packets = {}
+        self.maxSeq = None
+        self.lastReleased = None
+        self.lastTimestamp = None
+        self.baseTransit = None
+        self.lastArrival = None
+        self.lastMediaTime = None
+        self.jitter = 0.0
+        self.delay = self.minDelay
+
+    def push(self, seqNum, timestamp, marker, payload, now=None):
+        """
+        Add one received packet. The payload is copied, so it may be a view
+        into a reused receive buffer. Returns False if it was dropped.
+        """
+        if now is None:
+            now = self.clock()
+        self.received += 1
+
+        if self.maxSeq is None:
+            extSeq = seqNum
+            extTimestamp = timestamp
+        else:
+            extSeq = _extend(seqNum, self.maxSeq, 16)
+            extTimestamp = _extend(timestamp, self.lastTimestamp, 32)
+
+        if self.lastReleased is not None and extSeq <= self.lastReleased:
+            # Its successors already played out
+            self.late += 1
+            self.delay = min(self.maxDelay, self.delay * 1.25 + 0.005)
+            return False
+        if extSeq in self.packets:
+            self.duplicates += 1
+            return False
+
+        if self.maxSeq is None or extSeq > self.maxSeq:
+            self.maxSeq = extSeq
+            self.lastTimestamp = extTimestamp
+        else:
+            self.reordered += 1
+
+        mediaTime = extTimestamp / self.clockRate
+        self.updateClock(now, mediaTime)
+
+        self.packets[extSeq] = (mediaTime, timestamp, marker, bytes(payload))
+        heapq.heappush(self.heap, extSeq)
+        return True
+
+    def updateClock(self, now, mediaTime):
+        """Track transit time and interarrival jitter for one arrival"""
+        transit = now - mediaTime
+        if self.baseTransit is None or transit < self.baseTransit:
+            self.baseTransit = transit
+        elif transit > self.baseTransit + self.maxDelay:
+            # The sender stalled or jumped (e.g. resumed after a pause)
+            self.baseTransit = transit
+            self.resyncs += 1
+
+        if self.lastArrival is not None:
+            d = (now - self.lastArrival) - (mediaTime - self.lastMediaTime)
+            self.jitter += (abs(d) - self.jitter) / 16
+        self.lastArrival = now
+        self.lastMediaTime = mediaTime
+
+        # Aim for a few times the jitter; back off slowly from late bumps
+        target = min(max(self.minDelay, 4 * self.jitter), self.maxDelay)
+        self.delay += (target - self.delay) / 64
+
+    def deadline(self, mediaTime):
+        """Local time at which media time should be played out"""
+        return self.baseTransit + mediaTime + self.delay
+
+    def nextDeadline(self):
+        """Local time the next packet is due, or None if the buffer is empty"""
+        if not self.heap:
+            return None
+        return self.deadline(self.packets[self.heap[0]][0])
+
+    def timeUntilNext(self, now=None):
+        """Seconds until the next packet is due (<= 0 if due), or None if empty"""
+        deadline = self.nextDeadline()
+        if deadline is None:
+            return None
+        return deadline - (self.clock() if now is None else now)
+
+    def pop(self, now=None):
+        """Release every due packet in sequence order as (timestamp, marker, payload)"""
+        if now is None:
+            now = self.clock()
+        released = []
+        while self.heap:
+            extSeq = self.heap[0]
+            mediaTime, timestamp, marker, payload = self.packets[extSeq]
+            if self.deadline(mediaTime) > now and len(self.heap) <= self.maxPackets:
+                break
+            heapq.heappop(self.heap)
+            del self.packets[extSeq]
+            if self.lastReleased is not None and extSeq > self.lastReleased + 1:
+                self.lost += extSeq - self.lastReleased - 1
+            self.lastReleased = extSeq
+            released.append((timestamp, marker, payload))
+        return released
+
+    def depth(self):
+        """Number of buffered packets"""
+        return len(self.heap)
+
+    def stats(self):
+        """Buffer metrics for display"""
+        return {
+            'depth': self.depth(),
+            'delay_ms': round(self.delay * 1000, 1),
+            'jitter_ms': round(self.jitter * 1000, 2),
+            'late': self.late,
+            'lost': self.lost,
+            'duplicates': self.duplicates,
+            'reordered': self.reordered,
+        }
@@ -0,0 +1,400 @@
+"""
+MJPEG File Format Helpers
+Frame writing and the binary sidecar frame index shared by VideoPrep and the server
+"""
+
+import io
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from Pacer import DEFAULT_FPS
+
+# Legacy format (v1): each frame is prefixed with its length as 5 ASCII digits
+LENGTH_SIZE = 5
+
+# Container v2: a binary file header, a binary header per frame and an
+# optional index after the last frame
+CONTAINER_MAGIC = b'MJP2'
+CONTAINER_VERSION = 2
+LEGACY_VERSION = 1
+
+# magic, version, flags, fps, width, height, offset of the trailing index (0 if none)
+_FILE_HEADER = struct.Struct('<4sHHdIIQ')
+# JPEG length, presentation time in milliseconds
+_FRAME_HEADER = struct.Struct('<II')
+
+# Sidecar index: <file>.Mjpeg.idx
+INDEX_SUFFIX = '.idx'
+INDEX_MAGIC = b'MJIX'
+INDEX_VERSION = 2
+
+# Rendition manifest: <file>.Mjpeg.json
+MANIFEST_SUFFIX = '.json'
+MANIFEST_VERSION = 1
+
+# Frame flags
+FLAG_KEYFRAME = 0x01
+
+# magic, version, reserved, frame count, fps, size and mtime (ns) of the indexed file
+_INDEX_HEADER = struct.Struct('<4sHHIdQq')
+
+# Version 1 headers lack the mtime (still read from containers written before it)
+_INDEX_HEADER_V1 = struct.Struct('<4sHHIdQ')
+_INDEX_MTIME = struct.Struct('<q')
+
+
+def indexPath(mjpegPath):
+    """Path of the sidecar index for an MJPEG file"""
+    return mjpegPath + INDEX_SUFFIX
+
+
+# One encoding of a video in a manifest (bitrate in bits/s)
+Rendition = namedtuple('Rendition', ['name', 'path', 'width', 'height', 'quality',
+                                     'fps', 'frames', 'bitrate'])
+
+
+def manifestPath(mjpegPath):
+    """Path of the rendition manifest for an MJPEG file"""
+    return mjpegPath + MANIFEST_SUFFIX
+
+
+def saveManifest(path, renditions, source=None):
+    """
+    Write a rendition manifest. Rendition paths are stored relative to the
+    manifest so the files can be moved together.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'source': source,
+        'renditions': [
+            dict(r._asdict(), path=os.path.relpath(os.path.abspath(r.path), base))
+            for r in renditions
+        ],
+    }
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+
+def loadManifest(path):
+    """
+    Read a rendition manifest, best rendition (highest bitrate) first, with
+    paths resolved next to the manifest. Returns None if it is missing,
+    corrupt or lists no rendition that exists.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        if manifest.get('version') != MANIFEST_VERSION:
+            return None
+        base = os.path.dirname(path)
+        renditions = []
+        for entry in manifest['renditions']:
+            rendition = Rendition(**{field: entry[field] for field in Rendition._fields})
+            rendition = rendition._replace(path=os.path.join(base, rendition.path))
+            if os.path.exists(rendition.path):
+                renditions.append(rendition)
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        return None
+    renditions.sort(key=lambda r: r.bitrate, reverse=True)
+    return renditions or None
+
+
+def _littleEndian(values):
+    """Return a copy of an array in little-endian byte order"""
+    values = array(values.typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class FrameIndex:
+    """
+    Offsets, sizes, flags and presentation times of every frame in a file.
+
+    Stored after the last frame of a v2 container, or next to a legacy
+    MJPEG as a small binary sidecar file:
+      header   magic 'MJIX', version, reserved, frame count, fps (float64),
+               size and modification time (int64 ns, 0 if not recorded)
+               of the MJPEG file it describes
+      offsets  uint64[count]  position of each frame's JPEG data
+      sizes    uint32[count]  JPEG length in bytes
+      times    uint32[count]  presentation time in milliseconds
+      flags    uint8[count]   FLAG_KEYFRAME (every MJPEG frame is one)
+    All values are little-endian.
+    """
+
+    def __init__(self, fps=DEFAULT_FPS, sourceSize=0):
+        self.fps = fps
+        self.sourceSize = sourceSize
+        self.sourceMtime = 0
+        # Container format and frame size (from the v2 file header; 0 if unknown)
+        self.version = LEGACY_VERSION
+        self.width = 0
+        self.height = 0
+        self.offsets = array('Q')
+        self.sizes = array('I')
+        self.times = array('I')
+        self.flags = array('B')
+
+    def add(self, offset, size, timeMs=None, flags=FLAG_KEYFRAME):
+        """Append one frame"""
+        if timeMs is None:
+            timeMs = round(len(self.offsets) * 1000 / self.fps)
+        self.offsets.append(offset)
+        self.sizes.append(size)
+        self.times.append(timeMs)
+        self.flags.append(flags)
+
+    def frameCount(self):
+        """Number of indexed frames"""
+        return len(self.offsets)
+
+    def totalSize(self):
+        """Sum of JPEG sizes"""
+        return sum(self.sizes)
+
+    def duration(self):
+        """Playback duration in seconds at the nominal fps"""
+        return self.frameCount() / self.fps if self.fps else 0
+
+    def frameAt(self, seconds):
+        """Index of the frame shown at a presentation time"""
+        return min(max(int(seconds * self.fps), 0), self.frameCount())
+
+    @classmethod
+    def scan(cls, data, fps=DEFAULT_FPS):
+        """
+        Index an MJPEG buffer in either format: a v2 container's trailing
+        index is read directly, otherwise the frame headers are walked
+        """
+        if data[:len(CONTAINER_MAGIC)] == CONTAINER_MAGIC:
+            return cls.scanContainer(data)
+
+        index = cls(fps, len(data))
+        pos = 0
+        end = len(data)
+
+        while pos + LENGTH_SIZE <= end:
+            try:
+                frameLength = int(data[pos:pos + LENGTH_SIZE])
+            except ValueError:
+                print(f"[MjpegFile] Bad frame header at offset {pos}, stopping index")
+                break
+            start = pos + LENGTH_SIZE
+            if start + frameLength > end:
+                print(f"[MjpegFile] Truncated frame at offset {pos}, stopping index")
+                break
+            index.add(start, frameLength)
+            pos = start + frameLength
+
+        return index
+
+    @classmethod
+    def scanContainer(cls, data):
+        """Index a v2 container buffer"""
+        end = len(data)
+        if end < _FILE_HEADER.size:
+            print("[MjpegFile] Truncated container header")
+            return cls(DEFAULT_FPS, end)
+        magic, version, flags, fps, width, height, indexOffset = _FILE_HEADER.unpack_from(data)
+
+        index = None
+        if _FILE_HEADER.size <= indexOffset < end:
+            index = cls.read(io.BytesIO(data[indexOffset:]), indexOffset)
+            if index is None:
+                print("[MjpegFile] Bad trailing index, scanning frames")
+        if index is None:
+            index = cls(fps, end)
+            pos = _FILE_HEADER.size
+            # Frames stop where the index starts (or at end of file if there is none)
+            limit = indexOffset if _FILE_HEADER.size <= indexOffset < end else end
+            while pos + _FRAME_HEADER.size <= limit:
+                frameLength, timeMs = _FRAME_HEADER.unpack_from(data, pos)
+                start = pos + _FRAME_HEADER.size
+                if start + frameLength > limit:
+                    print(f"[MjpegFile] Truncated frame at offset {pos}, stopping index")
+                    break
+                index.add(start, frameLength, timeMs)
+                pos = start + frameLength
+
+        index.fps = fps
+        index.version = version
+        index.width = width
+        index.height = height
+        return index
+
+    @classmethod
+    def build(cls, mjpegPath, fps=DEFAULT_FPS):
+        """Build an index for an existing MJPEG file"""
+        with open(mjpegPath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return cls(fps, 0)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                index = cls.scan(data, fps)
+            index.sourceMtime = os.fstat(f.fileno()).st_mtime_ns
+            return index
+
+    def save(self, path):
+        """Write the index to a sidecar file"""
+        with open(path, 'wb') as f:
+            self.write(f)
+
+    def write(self, f):
+        """Write the index to an open file"""
+        f.write(_INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0,
+                                   self.frameCount(), float(self.fps), self.sourceSize,
+                                   self.sourceMtime))
+        _littleEndian(self.offsets).tofile(f)
+        _littleEndian(self.sizes).tofile(f)
+        _littleEndian(self.times).tofile(f)
+        self.flags.tofile(f)
+
+    @classmethod
+    def load(cls, path, sourceSize=None, sourceMtime=None):
+        """
+        Read a sidecar index. Returns None if it is missing, corrupt or was
+        written for a file of a different size or modification time.
+        """
+        try:
+            with open(path, 'rb') as f:
+                return cls.read(f, sourceSize, sourceMtime)
+        except OSError:
+            return None
+
+    @classmethod
+    def read(cls, f, sourceSize=None, sourceMtime=None):
+        """Read an index from an open file (None if corrupt or for another size or mtime)"""
+        try:
+            header = f.read(_INDEX_HEADER_V1.size)
+            if len(header) < _INDEX_HEADER_V1.size:
+                return None
+            magic, version, reserved, count, fps, size = _INDEX_HEADER_V1.unpack(header)
+            if magic != INDEX_MAGIC or version not in (1, INDEX_VERSION):
+                return None
+            mtime = 0
+            if version == INDEX_VERSION:
+                mtime, = _INDEX_MTIME.unpack(f.read(_INDEX_MTIME.size))
+            if sourceSize is not None and size != sourceSize:
+                return None
+            # A version 1 sidecar cannot show it is current, so it is rebuilt
+            if sourceMtime is not None and mtime != sourceMtime:
+                return None
+
+            index = cls(fps, size)
+            index.sourceMtime = mtime
+            for values in (index.offsets, index.sizes, index.times, index.flags):
+                values.fromfile(f, count)
+                if sys.byteorder == 'big' and values.itemsize > 1:
+                    values.byteswap()
+            return index
+        except (OSError, EOFError, struct.error):
+            return None
+
+    @classmethod
+    def open(cls, mjpegPath, fps=DEFAULT_FPS):
+        """Load the sidecar index if it is current, otherwise scan the file (or read its trailing index)"""
+        stat = os.stat(mjpegPath)
+        index = cls.load(indexPath(mjpegPath), stat.st_size, stat.st_mtime_ns)
+        if index is None:
+            index = cls.build(mjpegPath, fps)
+        return index
+
+
+class MjpegWriter:
+    """
+    Write JPEG frames and their index.
+
+    By default the file is a v2 container:
+      header   magic 'MJP2', version, flags, fps (float64), width, height,
+               offset of the trailing index (0 if there is none)
+      frames   uint32 JPEG length, uint32 presentation time (ms), JPEG data
+      index    a FrameIndex (see above) covering everything before it
+    All values are little-endian. version=LEGACY_VERSION writes the old
+    5-digit length-prefixed format with a sidecar index instead.
+    """
+
+    def __init__(self, path, fps=DEFAULT_FPS, writeIndex=True, width=0, height=0,
+                 version=CONTAINER_VERSION):
+        if version not in (LEGACY_VERSION, CONTAINER_VERSION):
+            raise ValueError(f"Unknown MJPEG format version {version}")
+        self.path = path
+        self.file = open(path, 'wb')
+        self.index = FrameIndex(fps)
+        self.index.version = version
+        self.index.width = width
+        self.index.height = height
+        self.writeIndex = writeIndex
+        self.version = version
+        self.position = 0
+        if version == CONTAINER_VERSION:
+            # Rewritten with the index offset on close
+            self.writeHeader(0)
+            self.position = _FILE_HEADER.size
+
+    def writeHeader(self, indexOffset):
+        """Write the v2 file header at the start of the file"""
+        self.file.seek(0)
+        self.file.write(_FILE_HEADER.pack(CONTAINER_MAGIC, CONTAINER_VERSION, 0,
+                                          float(self.index.fps), self.index.width,
+                                          self.index.height, indexOffset))
+
+    def write(self, frameData, timeMs=None):
+        """Append one JPEG frame"""
+        frameLength = len(frameData)
+        if self.version == LEGACY_VERSION:
+            if frameLength >= 10 ** LENGTH_SIZE:
+                # The length prefix would overflow and corrupt the file
+                raise ValueError(f"Frame of {frameLength} bytes is too large for the "
+                                 f"{LENGTH_SIZE}-digit length prefix")
+            header = str(frameLength).zfill(LENGTH_SIZE).encode()
+            self.index.add(self.position + len(header), frameLength, timeMs)
+        else:
+            self.index.add(self.position + _FRAME_HEADER.size, frameLength, timeMs)
+            header = _FRAME_HEADER.pack(frameLength, self.index.times[-1])
+        self.file.write(header)
+        self.file.write(frameData)
+        self.position += len(header) + frameLength
+
+    def frameCount(self):
+        """Frames written so far"""
+        return self.index.frameCount()
+
+    def indexLocation(self):
+        """Where the frame index is written (for messages)"""
+        if not self.writeIndex:
+            return 'none'
+        if self.version == CONTAINER_VERSION:
+            return f'{self.path} (embedded)'
+        return indexPath(self.path)
+
+    def close(self):
+        """Close the file and write its index"""
+        if self.file:
+            if self.version == CONTAINER_VERSION:
+                indexOffset = 0
+                if self.writeIndex:
+                    indexOffset = self.position
+                    self.index.sourceSize = self.position
+                    self.index.write(self.file)
+                self.writeHeader(indexOffset)
+            self.file.close()
+            self.file = None
+            if self.writeIndex and self.version == LEGACY_VERSION:
+                # Stamped with the finished file's mtime so a later rewrite invalidates it
+                self.index.sourceSize = self.position
+                self.index.sourceMtime = os.stat(self.path).st_mtime_ns
+                self.index.save(indexPath(self.path))
+            elif os.path.exists(indexPath(self.path)):
+                # A sidecar left from an earlier legacy file of the same name
+                os.remove(indexPath(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
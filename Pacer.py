@@ -0,0 +1,136 @@
+"""
+Frame Pacing
+Schedules RTP frames against monotonic deadlines derived from the media frame rate
+"""
+
+import random
+import time
+
+# Nominal frame rate when the file does not say otherwise
+DEFAULT_FPS = 20
+
+# RTP clock rate for JPEG video (RFC 2435)
+CLOCK_RATE = 90000
+
+
+class FramePacer:
+    """
+    Drift-free frame scheduler.
+
+    Frame n is due at start + n / fps on a monotonic clock, so the output
+    rate does not depend on how long encoding and sending take. A sender
+    that falls behind sends immediately to catch up; once it is more than
+    maxLateFrames behind it drops frames instead. RTP timestamps are
+    derived from the media frame index, not from the wall clock.
+    """
+
+    def __init__(self, fps=DEFAULT_FPS, maxLateFrames=2, clock=time.monotonic,
+                 timestampBase=None):
+        self.fps = fps if fps and fps > 0 else DEFAULT_FPS
+        self.interval = 1.0 / self.fps
+        self.maxLateFrames = maxLateFrames
+        self.clock = clock
+        self.timestampBase = random.getrandbits(32) if timestampBase is None else timestampBase
+
+        # Media frame index (keeps counting across loops, pauses and seeks)
+        self.frameIndex = 0
+        self.startTime = None
+        self.startFrame = 0
+
+        # Metrics
+        self.framesSent = 0
+        self.lateFrames = 0
+        self.droppedFrames = 0
+        self.skippedFrames = 0
+        self.jitter = 0.0
+        self.maxLateness = 0.0
+
+    def start(self):
+        """Anchor the schedule so the next frame is due now (PLAY/resume)"""
+        self.startTime = self.clock()
+        self.startFrame = self.frameIndex
+
+    def deadline(self):
+        """Monotonic time at which the next frame is due"""
+        if self.startTime is None:
+            self.start()
+        return self.startTime + (self.frameIndex - self.startFrame) * self.interval
+
+    def setRate(self, fps):
+        """Change the frame rate mid-stream, keeping media time and the schedule continuous"""
+        fps = fps if fps and fps > 0 else DEFAULT_FPS
+        if fps == self.fps:
+            return
+        timestamp = self.rtpTimestamp()
+        deadline = self.deadline() if self.startTime is not None else None
+        self.fps = fps
+        self.interval = 1.0 / fps
+        # Rebase so the next frame keeps its timestamp and deadline
+        self.timestampBase = (timestamp - round(self.frameIndex * CLOCK_RATE / fps)) & 0xFFFFFFFF
+        if deadline is not None:
+            self.startTime = deadline
+            self.startFrame = self.frameIndex
+
+    def timeUntilDue(self):
+        """Seconds to wait before the next frame (<= 0 when due or late)"""
+        return self.deadline() - self.clock()
+
+    def framesToDrop(self):
+        """
+        Number of frames to skip because the sender is too far behind.
+        The skipped frames are counted as dropped and the schedule advances.
+        """
+        late = self.clock() - self.deadline()
+        behind = int(late / self.interval)
+        if behind <= self.maxLateFrames:
+            return 0
+        skip = behind - self.maxLateFrames
+        self.frameIndex += skip
+        self.droppedFrames += skip
+        return skip
+
+    def rtpTimestamp(self):
+        """90kHz RTP timestamp of the next frame, from media time"""
+        return (self.timestampBase + round(self.frameIndex * CLOCK_RATE / self.fps)) & 0xFFFFFFFF
+
+    def rtpTimestampNow(self):
+        """RTP timestamp corresponding to the current clock time (for sender reports)"""
+        if self.startTime is None:
+            return self.rtpTimestamp()
+        mediaTime = self.frameIndex / self.fps + self.clock() - self.deadline()
+        return (self.timestampBase + round(mediaTime * CLOCK_RATE)) & 0xFFFFFFFF
+
+    def frameSent(self):
+        """Record that the next frame went out and advance the schedule"""
+        lateness = self.clock() - self.deadline()
+        if lateness > self.interval / 2:
+            self.lateFrames += 1
+        self.maxLateness = max(self.maxLateness, lateness)
+        # Smoothed mean deviation from the schedule (RFC 3550 style, gain 1/16)
+        self.jitter += (abs(lateness) - self.jitter) / 16
+        self.framesSent += 1
+        self.frameIndex += 1
+
+    def frameSkipped(self):
+        """Advance the schedule past a frame deliberately not sent (reduced frame rate)"""
+        self.skippedFrames += 1
+        self.frameIndex += 1
+
+    def stats(self):
+        """Pacing metrics for logging"""
+        return {
+            'fps': self.fps,
+            'frames_sent': self.framesSent,
+            'late_frames': self.lateFrames,
+            'dropped_frames': self.droppedFrames,
+            'skipped_frames': self.skippedFrames,
+            'jitter_ms': round(self.jitter * 1000, 3),
+            'max_lateness_ms': round(self.maxLateness * 1000, 3),
+        }
+
+    def summary(self):
+        """One-line description of the pacing metrics"""
+        s = self.stats()
+        return (f"sent {s['frames_sent']}, late {s['late_frames']}, "
+                f"dropped {s['dropped_frames']}, skipped {s['skipped_frames']}, jitter {s['jitter_ms']:.2f} ms, "
+                f"max lateness {s['max_lateness_ms']:.2f} ms")
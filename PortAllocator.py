@@ -0,0 +1,91 @@
+"""
+RTP Port Allocation
+Hands out unique RTP/RTCP UDP port pairs to receiving sessions and recycles them
+"""
+
+import socket
+import threading
+from collections import deque
+
+# Default range for receiving sessions (5000 pairs)
+PORT_MIN = 25000
+PORT_MAX = 35000
+
+
+class PortAllocator:
+    """
+    Thread-safe pool of RTP/RTCP port pairs.
+
+    RTP gets an even port and RTCP the odd port above it (RFC 3550
+    section 11). allocate() binds both sockets before handing the pair
+    out, so a port taken by another process is skipped rather than
+    reported, and nothing can take it between the check and the bind.
+    Released pairs go to the back of the pool, which delays reuse and
+    keeps late packets of an old session away from a new one.
+    """
+
+    def __init__(self, low=PORT_MIN, high=PORT_MAX, host=''):
+        low += low % 2
+        self.host = host
+        self.free = deque(range(low, high - 1, 2))
+        self.inUse = set()
+        self.lock = threading.Lock()
+
+        # Metrics
+        self.allocations = 0
+        self.bindFailures = 0
+        self.peak = 0
+
+    def allocate(self):
+        """Bind a free pair; returns (rtpPort, rtpSocket, rtcpSocket) or raises OSError"""
+        with self.lock:
+            for _ in range(len(self.free)):
+                port = self.free.popleft()
+                sockets = self.bind(port)
+                if sockets is None:
+                    # Held by something outside the pool: try it again later
+                    self.bindFailures += 1
+                    self.free.append(port)
+                    continue
+                self.inUse.add(port)
+                self.allocations += 1
+                self.peak = max(self.peak, len(self.inUse))
+                return (port,) + sockets
+        raise OSError(f"No free RTP port pair ({len(self.inUse)} in use)")
+
+    def bind(self, port):
+        """Bind RTP and RTCP sockets on a pair, or None if either port is taken"""
+        rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            rtpSocket.bind((self.host, port))
+            rtcpSocket.bind((self.host, port + 1))
+        except OSError:
+            rtpSocket.close()
+            rtcpSocket.close()
+            return None
+        return rtpSocket, rtcpSocket
+
+    def release(self, port):
+        """Return a pair to the pool (its sockets must be closed)"""
+        with self.lock:
+            if port in self.inUse:
+                self.inUse.remove(port)
+                self.free.append(port)
+
+    def stats(self):
+        """Pool metrics for logging"""
+        with self.lock:
+            return {
+                'in_use': len(self.inUse),
+                'free': len(self.free),
+                'peak': self.peak,
+                'allocations': self.allocations,
+                'bind_failures': self.bindFailures,
+            }
+
+    def summary(self):
+        """One-line description of the pool metrics"""
+        s = self.stats()
+        return (f"{s['in_use']} pairs in use, {s['free']} free, peak {s['peak']}, "
+                f"{s['allocations']} allocations, {s['bind_failures']} bind failures")
@@ -0,0 +1,432 @@
+"""
+RTCP Packet Handler
+Implements RTCP sender/receiver reports according to RFC 3550
+"""
+
+import random
+import socket
+import struct
+import time
+from collections import namedtuple
+from Pacer import CLOCK_RATE
+
+# RTCP packet types
+PT_SR = 200
+PT_RR = 201
+PT_SDES = 202
+PT_BYE = 203
+PT_APP = 204
+
+# SDES item carrying the canonical name
+SDES_CNAME = 1
+
+# APP packet with receiver playback feedback: receive rate, frames completed/dropped
+APP_FEEDBACK = b'QFBK'
+_FEEDBACK = struct.Struct('!III')
+
+# Nominal time between reports in seconds (randomized per report)
+RTCP_INTERVAL = 1.0
+
+# Large enough for any compound RTCP packet we exchange
+RTCP_BUFFER_SIZE = 2048
+
+# Seconds between the NTP epoch (1900) and the Unix epoch (1970)
+NTP_OFFSET = 2208988800
+
+# V/P/RC, PT, length in 32-bit words minus one
+_HEADER = struct.Struct('!BBH')
+# SSRC, NTP seconds, NTP fraction, RTP timestamp, packet count, octet count
+_SENDER_INFO = struct.Struct('!IIIIII')
+# SSRC, fraction lost, cumulative lost (24 bits), extended highest seq, jitter, LSR, DLSR
+_REPORT_BLOCK = struct.Struct('!IB3sIIII')
+_SSRC = struct.Struct('!I')
+
+# One reception report about one source
+ReportBlock = namedtuple('ReportBlock', ['ssrc', 'fractionLost', 'cumulativeLost',
+                                         'highestSeq', 'jitter', 'lastSR', 'delaySinceLastSR'])
+
+
+def reportInterval():
+    """Time until the next report, randomized so receivers do not synchronize"""
+    return RTCP_INTERVAL * random.uniform(0.5, 1.5)
+
+
+def ntpTime(now=None):
+    """64-bit NTP timestamp of a wall clock time as (seconds, fraction)"""
+    if now is None:
+        now = time.time()
+    seconds = int(now)
+    return (seconds + NTP_OFFSET) & 0xFFFFFFFF, int((now - seconds) * (1 << 32)) & 0xFFFFFFFF
+
+
+def ntpMiddle(seconds, fraction):
+    """Middle 32 bits of an NTP timestamp (the LSR/DLSR time base)"""
+    return ((seconds & 0xFFFF) << 16) | (fraction >> 16)
+
+
+def _header(count, pt, body):
+    """Prefix a packet body (a multiple of 4 bytes) with its common header"""
+    return _HEADER.pack(0x80 | count, pt, len(body) // 4) + body
+
+
+def _packBlocks(blocks):
+    data = b''
+    for block in blocks:
+        cumulative = max(min(block.cumulativeLost, 0x7FFFFF), -0x800000) & 0xFFFFFF
+        data += _REPORT_BLOCK.pack(block.ssrc, block.fractionLost,
+                                   cumulative.to_bytes(3, 'big'), block.highestSeq,
+                                   block.jitter, block.lastSR, block.delaySinceLastSR)
+    return data
+
+
+def buildSenderReport(ssrc, rtpTimestamp, packetCount, octetCount, blocks=(), now=None):
+    """Build an SR packet"""
+    seconds, fraction = ntpTime(now)
+    body = _SENDER_INFO.pack(ssrc, seconds, fraction, rtpTimestamp & 0xFFFFFFFF,
+                             packetCount & 0xFFFFFFFF, octetCount & 0xFFFFFFFF)
+    return _header(len(blocks), PT_SR, body + _packBlocks(blocks))
+
+
+def buildReceiverReport(ssrc, blocks=()):
+    """Build an RR packet"""
+    return _header(len(blocks), PT_RR, _SSRC.pack(ssrc) + _packBlocks(blocks))
+
+
+def buildSdes(ssrc, cname):
+    """Build an SDES packet with a single CNAME item"""
+    text = cname.encode('utf-8')[:255]
+    chunk = _SSRC.pack(ssrc) + bytes((SDES_CNAME, len(text))) + text + b'\x00'
+    chunk += bytes(-len(chunk) % 4)
+    return _header(1, PT_SDES, chunk)
+
+
+def buildApp(ssrc, name, data, subtype=0):
+    """Build an APP packet (data is padded to a multiple of 4 bytes)"""
+    data = bytes(data) + bytes(-len(data) % 4)
+    return _header(subtype, PT_APP, _SSRC.pack(ssrc) + name + data)
+
+
+def buildFeedback(ssrc, receiveRate, framesCompleted, framesDropped):
+    """Build the receiver playback feedback APP packet (receiveRate in bits/s)"""
+    return buildApp(ssrc, APP_FEEDBACK,
+                    _FEEDBACK.pack(min(int(receiveRate), 0xFFFFFFFF),
+                                   framesCompleted & 0xFFFFFFFF, framesDropped & 0xFFFFFFFF))
+
+
+def buildBye(ssrc):
+    """Build a BYE packet for one source"""
+    return _header(1, PT_BYE, _SSRC.pack(ssrc))
+
+
+class RtcpPacket:
+    """One packet of a compound RTCP datagram"""
+
+    def __init__(self, pt, count, body):
+        self.pt = pt
+        self.count = count
+        self.body = body
+        self.ssrc = _SSRC.unpack_from(body)[0] if len(body) >= 4 else 0
+        self.reports = []
+
+        # APP name and application data
+        self.name = b''
+        self.data = b''
+
+        # Sender info (SR only)
+        self.ntpSeconds = 0
+        self.ntpFraction = 0
+        self.rtpTimestamp = 0
+        self.packetCount = 0
+        self.octetCount = 0
+
+        if pt == PT_SR:
+            (self.ssrc, self.ntpSeconds, self.ntpFraction, self.rtpTimestamp,
+             self.packetCount, self.octetCount) = _SENDER_INFO.unpack_from(body)
+            self.reports = self._parseBlocks(_SENDER_INFO.size)
+        elif pt == PT_RR:
+            self.reports = self._parseBlocks(_SSRC.size)
+        elif pt == PT_APP:
+            self.name = body[4:8]
+            self.data = body[8:]
+
+    def _parseBlocks(self, pos):
+        reports = []
+        for _ in range(self.count):
+            if pos + _REPORT_BLOCK.size > len(self.body):
+                break
+            ssrc, fraction, cumulative, highest, jitter, lsr, dlsr = \
+                _REPORT_BLOCK.unpack_from(self.body, pos)
+            cumulative = int.from_bytes(cumulative, 'big', signed=True)
+            reports.append(ReportBlock(ssrc, fraction, cumulative, highest, jitter, lsr, dlsr))
+            pos += _REPORT_BLOCK.size
+        return reports
+
+    def ntpMiddle(self):
+        """Middle 32 bits of the SR's NTP timestamp"""
+        return ntpMiddle(self.ntpSeconds, self.ntpFraction)
+
+
+def parseCompound(data):
+    """Split a compound RTCP datagram into RtcpPacket objects (malformed tails are ignored)"""
+    packets = []
+    pos = 0
+    while pos + _HEADER.size <= len(data):
+        first, pt, length = _HEADER.unpack_from(data, pos)
+        end = pos + (length + 1) * 4
+        if first >> 6 != 2 or end > len(data):
+            break
+        try:
+            packets.append(RtcpPacket(pt, first & 0x1F, bytes(data[pos + _HEADER.size:end])))
+        except struct.error:
+            break
+        pos = end
+    return packets
+
+
+class ReceptionStats:
+    """
+    Receiver-side statistics for one RTP source (RFC 3550 appendix A):
+    extended highest sequence number, cumulative and interval loss,
+    interarrival jitter, and the timing of the last sender report.
+    """
+
+    def __init__(self, clockRate=CLOCK_RATE):
+        self.clockRate = clockRate
+        self.ssrc = None
+        self.baseSeq = 0
+        self.maxSeq = 0
+        self.received = 0
+        self.expectedPrior = 0
+        self.receivedPrior = 0
+        self.transit = None
+        self.jitter = 0.0
+        self.fractionLost = 0
+        self.lastSR = 0
+        self.lastSRArrival = None
+
+    def update(self, ssrc, seqNum, timestamp, now):
+        """Account for one received RTP packet (now in seconds)"""
+        if self.ssrc != ssrc:
+            # New (or first) source: start counting from this packet
+            self.__init__(self.clockRate)
+            self.ssrc = ssrc
+            self.baseSeq = self.maxSeq = seqNum
+
+        delta = ((seqNum - self.maxSeq + 0x8000) & 0xFFFF) - 0x8000
+        if delta > 0:
+            self.maxSeq += delta
+        self.received += 1
+
+        transit = now * self.clockRate - timestamp
+        if self.transit is not None:
+            d = abs(transit - self.transit)
+            # Ignore timestamp wraparound
+            if d < (1 << 31):
+                self.jitter += (d - self.jitter) / 16
+        self.transit = transit
+
+    def senderReport(self, packet, now):
+        """Remember an SR so the next RR can carry LSR/DLSR"""
+        self.lastSR = packet.ntpMiddle()
+        self.lastSRArrival = now
+
+    def expected(self):
+        """Packets expected from the first to the highest sequence number"""
+        return self.maxSeq - self.baseSeq + 1
+
+    def lost(self):
+        """Cumulative number of packets lost"""
+        return self.expected() - self.received
+
+    def jitterSeconds(self):
+        """Interarrival jitter in seconds"""
+        return self.jitter / self.clockRate
+
+    def reportBlock(self, now):
+        """Report block for the next RR, starting a new loss interval"""
+        expected = self.expected()
+        expectedInterval = expected - self.expectedPrior
+        receivedInterval = self.received - self.receivedPrior
+        self.expectedPrior = expected
+        self.receivedPrior = self.received
+        lostInterval = expectedInterval - receivedInterval
+        if expectedInterval > 0 and lostInterval > 0:
+            self.fractionLost = min((lostInterval << 8) // expectedInterval, 255)
+        else:
+            self.fractionLost = 0
+
+        delay = 0
+        if self.lastSRArrival is not None:
+            delay = int((now - self.lastSRArrival) * 65536) & 0xFFFFFFFF
+        return ReportBlock(self.ssrc or 0, self.fractionLost, self.lost(),
+                           self.maxSeq & 0xFFFFFFFF, int(self.jitter) & 0xFFFFFFFF,
+                           self.lastSR, delay)
+
+
+class ReceiverFeedback:
+    """
+    Sender-side view of what a receiver reported about one of our streams:
+    loss fraction, cumulative loss, jitter and round-trip time, plus the
+    receive rate and frame loss from its playback feedback (APP) packets.
+    """
+
+    def __init__(self, ssrc, clockRate=CLOCK_RATE):
+        self.ssrc = ssrc & 0xFFFFFFFF
+        self.clockRate = clockRate
+        self.reports = 0
+        self.fractionLost = 0.0
+        self.cumulativeLost = 0
+        self.jitter = 0.0
+        self.rtt = None
+        self.lastReport = None
+
+        # Playback feedback
+        self.receiveRate = None
+        self.framesCompleted = 0
+        self.framesDropped = 0
+        self.frameLoss = 0.0
+
+    def receive(self, data, now=None):
+        """Process a compound RTCP datagram from the receiver; returns its packets"""
+        packets = parseCompound(data)
+        for packet in packets:
+            for block in packet.reports:
+                if block.ssrc == self.ssrc:
+                    self.update(block, now)
+            if packet.pt == PT_APP and packet.name == APP_FEEDBACK and \
+                    len(packet.data) >= _FEEDBACK.size:
+                self.playback(*_FEEDBACK.unpack_from(packet.data))
+        return packets
+
+    def playback(self, receiveRate, framesCompleted, framesDropped):
+        """Take the figures from one playback feedback packet"""
+        completed = (framesCompleted - self.framesCompleted) & 0xFFFFFFFF
+        dropped = (framesDropped - self.framesDropped) & 0xFFFFFFFF
+        if framesCompleted < self.framesCompleted or framesDropped < self.framesDropped:
+            # The receiver restarted its counters
+            completed, dropped = framesCompleted, framesDropped
+        self.frameLoss = dropped / (completed + dropped) if completed + dropped else 0.0
+        self.receiveRate = receiveRate
+        self.framesCompleted = framesCompleted
+        self.framesDropped = framesDropped
+
+    def update(self, block, now=None):
+        """Take the figures from one report block about our stream"""
+        if now is None:
+            now = time.time()
+        self.reports += 1
+        self.lastReport = now
+        self.fractionLost = block.fractionLost / 256
+        self.cumulativeLost = block.cumulativeLost
+        self.jitter = block.jitter / self.clockRate
+        if block.lastSR:
+            # RTT = arrival - LSR - DLSR, in 1/65536 s units
+            arrival = ntpMiddle(*ntpTime(now))
+            self.rtt = ((arrival - block.lastSR - block.delaySinceLastSR) & 0xFFFFFFFF) / 65536
+
+    def stats(self):
+        """Feedback metrics for logging"""
+        return {
+            'reports': self.reports,
+            'fraction_lost': round(self.fractionLost, 4),
+            'cumulative_lost': self.cumulativeLost,
+            'jitter_ms': round(self.jitter * 1000, 3),
+            'rtt_ms': None if self.rtt is None else round(self.rtt * 1000, 3),
+            'receive_kbps': None if self.receiveRate is None else round(self.receiveRate / 1000, 1),
+            'frame_loss': round(self.frameLoss, 4),
+        }
+
+    def summary(self):
+        """One-line description of the receiver's reports"""
+        s = self.stats()
+        rtt = 'n/a' if s['rtt_ms'] is None else f"{s['rtt_ms']:.2f} ms"
+        line = (f"reports {s['reports']}, loss {s['fraction_lost'] * 100:.1f}%, "
+                f"lost {s['cumulative_lost']}, jitter {s['jitter_ms']:.2f} ms, rtt {rtt}")
+        if s['receive_kbps'] is not None:
+            line += f", rate {s['receive_kbps']:.0f} kbps, frame loss {s['frame_loss'] * 100:.1f}%"
+        return line
+
+
+class ReceiverReporter:
+    """
+    Receiver side of RTCP for one session: keeps reception statistics for
+    the incoming RTP stream, reads the server's sender reports and sends
+    receiver reports at the report interval. The socket must be non-blocking.
+
+    Given the frame reassembler (anything with framesCompleted and
+    framesDropped counters), each report also carries a playback feedback
+    packet with the receive rate and frame counts for adaptive senders.
+    """
+
+    def __init__(self, sock, ssrc=None, cname=None, clock=time.monotonic, playback=None):
+        self.sock = sock
+        self.ssrc = random.getrandbits(32) if ssrc is None else ssrc
+        self.cname = cname or f'client@{socket.gethostname()}'
+        self.clock = clock
+        self.serverAddr = None
+        self.stats = ReceptionStats()
+        self.nextReport = clock() + reportInterval()
+        self.senderReports = 0
+        self.reportsSent = 0
+
+        # Playback feedback
+        self.playback = playback
+        self.bytesReceived = 0
+        self.lastBytes = 0
+        self.lastReportTime = clock()
+
+    def update(self, batch, now=None):
+        """Account for a burst of received RTP packets (an RtpBatch)"""
+        if now is None:
+            now = self.clock()
+        self.bytesReceived += batch.bytes
+        for ssrc, seqNum, timestamp in zip(batch.ssrcs, batch.seqNums, batch.timestamps):
+            self.stats.update(ssrc, seqNum, timestamp, now)
+
+    def timeUntilReport(self, now=None):
+        """Seconds until the next receiver report is due"""
+        return self.nextReport - (self.clock() if now is None else now)
+
+    def poll(self, now=None):
+        """Read any queued sender reports and send a receiver report if one is due"""
+        if now is None:
+            now = self.clock()
+        while True:
+            try:
+                data, addr = self.sock.recvfrom(RTCP_BUFFER_SIZE)
+            except (BlockingIOError, InterruptedError, ConnectionResetError):
+                break
+            for packet in parseCompound(data):
+                if packet.pt == PT_SR:
+                    self.stats.senderReport(packet, now)
+                    self.senderReports += 1
+
+        if now >= self.nextReport:
+            self.nextReport = now + reportInterval()
+            if self.serverAddr and self.stats.ssrc is not None:
+                report = (buildReceiverReport(self.ssrc, [self.stats.reportBlock(now)]) +
+                          buildSdes(self.ssrc, self.cname))
+                if self.playback is not None:
+                    report += self.feedback(now)
+                self.send(report)
+                self.reportsSent += 1
+
+    def feedback(self, now):
+        """Playback feedback APP packet covering the time since the last one"""
+        elapsed = now - self.lastReportTime
+        rate = (self.bytesReceived - self.lastBytes) * 8 / elapsed if elapsed > 0 else 0
+        self.lastBytes = self.bytesReceived
+        self.lastReportTime = now
+        return buildFeedback(self.ssrc, rate, self.playback.framesCompleted,
+                             self.playback.framesDropped)
+
+    def bye(self):
+        """Tell the server this receiver is leaving"""
+        if self.serverAddr:
+            self.send(buildReceiverReport(self.ssrc) + buildBye(self.ssrc))
+
+    def send(self, data):
+        try:
+            self.sock.sendto(data, self.serverAddr)
+        except OSError as e:
+            print(f"[RTCP] Error sending report: {e}")
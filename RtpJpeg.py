@@ -0,0 +1,434 @@
+"""
+RTP Payload Format for JPEG
+Implements JPEG fragmentation and reassembly according to RFC 2435
+"""
+
+import struct
+
+# Largest datagram (RTP header + JPEG headers + data) we put on the wire
+DEFAULT_MTU = 1400
+
+RTP_HEADER_SIZE = 12
+JPEG_HEADER_SIZE = 8
+RESTART_HEADER_SIZE = 4
+QTABLE_HEADER_SIZE = 4
+
+# Dynamic type (RFC 2435 allows 128-255) used for JPEGs that cannot be
+# expressed with the standard types; the payload carries the whole file
+TYPE_JFIF = 255
+
+# Main JPEG header: type-specific, fragment offset (24 bits), type, Q, width/8, height/8
+_MAIN_HEADER = struct.Struct('!I4B')
+_RESTART_HEADER = struct.Struct('!HH')
+_QTABLE_HEADER = struct.Struct('!BBH')
+
+# Standard Huffman tables (ITU-T T.81 Annex K.3), implied by types 0/1
+LUM_DC_CODELENS = bytes([0, 1, 5, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0, 0, 0])
+LUM_DC_SYMBOLS = bytes(range(12))
+LUM_AC_CODELENS = bytes([0, 2, 1, 3, 3, 2, 4, 3, 5, 5, 4, 4, 0, 0, 1, 0x7d])
+LUM_AC_SYMBOLS = bytes([
+    0x01, 0x02, 0x03, 0x00, 0x04, 0x11, 0x05, 0x12,
+    0x21, 0x31, 0x41, 0x06, 0x13, 0x51, 0x61, 0x07,
+    0x22, 0x71, 0x14, 0x32, 0x81, 0x91, 0xa1, 0x08,
+    0x23, 0x42, 0xb1, 0xc1, 0x15, 0x52, 0xd1, 0xf0,
+    0x24, 0x33, 0x62, 0x72, 0x82, 0x09, 0x0a, 0x16,
+    0x17, 0x18, 0x19, 0x1a, 0x25, 0x26, 0x27, 0x28,
+    0x29, 0x2a, 0x34, 0x35, 0x36, 0x37, 0x38, 0x39,
+    0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48, 0x49,
+    0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58, 0x59,
+    0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68, 0x69,
+    0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78, 0x79,
+    0x7a, 0x83, 0x84, 0x85, 0x86, 0x87, 0x88, 0x89,
+    0x8a, 0x92, 0x93, 0x94, 0x95, 0x96, 0x97, 0x98,
+    0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5, 0xa6, 0xa7,
+    0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4, 0xb5, 0xb6,
+    0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3, 0xc4, 0xc5,
+    0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2, 0xd3, 0xd4,
+    0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda, 0xe1, 0xe2,
+    0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9, 0xea,
+    0xf1, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+    0xf9, 0xfa,
+])
+CHM_DC_CODELENS = bytes([0, 3, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 0, 0, 0, 0])
+CHM_DC_SYMBOLS = bytes(range(12))
+CHM_AC_CODELENS = bytes([0, 2, 1, 2, 4, 4, 3, 4, 7, 5, 4, 4, 0, 1, 2, 0x77])
+CHM_AC_SYMBOLS = bytes([
+    0x00, 0x01, 0x02, 0x03, 0x11, 0x04, 0x05, 0x21,
+    0x31, 0x06, 0x12, 0x41, 0x51, 0x07, 0x61, 0x71,
+    0x13, 0x22, 0x32, 0x81, 0x08, 0x14, 0x42, 0x91,
+    0xa1, 0xb1, 0xc1, 0x09, 0x23, 0x33, 0x52, 0xf0,
+    0x15, 0x62, 0x72, 0xd1, 0x0a, 0x16, 0x24, 0x34,
+    0xe1, 0x25, 0xf1, 0x17, 0x18, 0x19, 0x1a, 0x26,
+    0x27, 0x28, 0x29, 0x2a, 0x35, 0x36, 0x37, 0x38,
+    0x39, 0x3a, 0x43, 0x44, 0x45, 0x46, 0x47, 0x48,
+    0x49, 0x4a, 0x53, 0x54, 0x55, 0x56, 0x57, 0x58,
+    0x59, 0x5a, 0x63, 0x64, 0x65, 0x66, 0x67, 0x68,
+    0x69, 0x6a, 0x73, 0x74, 0x75, 0x76, 0x77, 0x78,
+    0x79, 0x7a, 0x82, 0x83, 0x84, 0x85, 0x86, 0x87,
+    0x88, 0x89, 0x8a, 0x92, 0x93, 0x94, 0x95, 0x96,
+    0x97, 0x98, 0x99, 0x9a, 0xa2, 0xa3, 0xa4, 0xa5,
+    0xa6, 0xa7, 0xa8, 0xa9, 0xaa, 0xb2, 0xb3, 0xb4,
+    0xb5, 0xb6, 0xb7, 0xb8, 0xb9, 0xba, 0xc2, 0xc3,
+    0xc4, 0xc5, 0xc6, 0xc7, 0xc8, 0xc9, 0xca, 0xd2,
+    0xd3, 0xd4, 0xd5, 0xd6, 0xd7, 0xd8, 0xd9, 0xda,
+    0xe2, 0xe3, 0xe4, 0xe5, 0xe6, 0xe7, 0xe8, 0xe9,
+    0xea, 0xf2, 0xf3, 0xf4, 0xf5, 0xf6, 0xf7, 0xf8,
+    0xf9, 0xfa,
+])
+
+# (table class << 4 | id) -> (code lengths, symbols)
+STANDARD_HUFFMAN_TABLES = {
+    0x00: (LUM_DC_CODELENS, LUM_DC_SYMBOLS),
+    0x10: (LUM_AC_CODELENS, LUM_AC_SYMBOLS),
+    0x01: (CHM_DC_CODELENS, CHM_DC_SYMBOLS),
+    0x11: (CHM_AC_CODELENS, CHM_AC_SYMBOLS),
+}
+
+# Example quantization tables from RFC 2435 Appendix A (zigzag order)
+_JPEG_LUMA_QUANTIZER = [
+    16, 11, 12, 14, 12, 10, 16, 14,
+    13, 14, 18, 17, 16, 19, 24, 40,
+    26, 24, 22, 22, 24, 49, 35, 37,
+    29, 40, 58, 51, 61, 60, 57, 51,
+    56, 55, 64, 72, 92, 78, 64, 68,
+    87, 69, 55, 56, 80, 109, 81, 87,
+    95, 98, 103, 104, 103, 62, 77, 113,
+    121, 112, 100, 120, 92, 101, 103, 99,
+]
+_JPEG_CHROMA_QUANTIZER = [
+    17, 18, 18, 24, 21, 24, 47, 26,
+    26, 47, 99, 66, 56, 66, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+    99, 99, 99, 99, 99, 99, 99, 99,
+]
+
+
+def makeTables(q):
+    """Build the luma/chroma tables implied by Q values 1-99 (RFC 2435 Appendix A)"""
+    q = min(max(q, 1), 99)
+    factor = 5000 // q if q < 50 else 200 - q * 2
+    tables = bytearray(128)
+    for i in range(64):
+        lq = (_JPEG_LUMA_QUANTIZER[i] * factor + 50) // 100
+        cq = (_JPEG_CHROMA_QUANTIZER[i] * factor + 50) // 100
+        tables[i] = min(max(lq, 1), 255)
+        tables[i + 64] = min(max(cq, 1), 255)
+    return bytes(tables)
+
+
+class JpegFrame:
+    """The parts of a baseline JPEG that RFC 2435 carries on the wire"""
+
+    def __init__(self, jpegType, width, height, qtables, restartInterval, scan):
+        self.type = jpegType
+        self.width = width
+        self.height = height
+        self.qtables = qtables
+        self.restartInterval = restartInterval
+        self.scan = scan
+
+
+def parseJpeg(data):
+    """
+    Split a JFIF image into RFC 2435 parameters and entropy-coded scan data.
+    Returns None if the image cannot be expressed with types 0/1 (e.g.
+    progressive, grayscale, 4:4:4, custom Huffman tables or wider than 2040).
+    """
+    view = memoryview(data)
+    if len(view) < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+
+    qtables = {}
+    components = []
+    width = height = 0
+    restartInterval = 0
+    pos = 2
+
+    while pos + 4 <= len(view):
+        if view[pos] != 0xFF:
+            return None
+        marker = view[pos + 1]
+        if marker == 0xFF:
+            # Fill byte
+            pos += 1
+            continue
+        length = (view[pos + 2] << 8) | view[pos + 3]
+        segment = view[pos + 4:pos + 2 + length]
+
+        if marker == 0xDB:
+            # DQT: one or more 8-bit tables
+            i = 0
+            while i < len(segment):
+                precision, tableId = segment[i] >> 4, segment[i] & 0x0F
+                if precision != 0:
+                    return None
+                qtables[tableId] = bytes(segment[i + 1:i + 65])
+                i += 65
+        elif marker == 0xC0:
+            # Baseline SOF
+            if segment[0] != 8:
+                return None
+            height = (segment[1] << 8) | segment[2]
+            width = (segment[3] << 8) | segment[4]
+            for c in range(segment[5]):
+                base = 6 + c * 3
+                components.append((segment[base + 1], segment[base + 2]))
+        elif marker in (0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                        0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+            # Extended, progressive, lossless or arithmetic coding
+            return None
+        elif marker == 0xC4:
+            # DHT: only the standard tables are implied by the RTP types
+            i = 0
+            while i < len(segment):
+                tableClass = segment[i]
+                codelens = bytes(segment[i + 1:i + 17])
+                count = sum(codelens)
+                symbols = bytes(segment[i + 17:i + 17 + count])
+                if STANDARD_HUFFMAN_TABLES.get(tableClass) != (codelens, symbols):
+                    return None
+                i += 17 + count
+        elif marker == 0xDD:
+            restartInterval = (segment[0] << 8) | segment[1]
+        elif marker == 0xDA:
+            # Scan must use luma tables for Y and chroma tables for Cb/Cr
+            if bytes(segment[2:7:2]) != b'\x00\x11\x11':
+                return None
+            scanStart = pos + 2 + length
+            scanEnd = len(view)
+            if view[scanEnd - 2] == 0xFF and view[scanEnd - 1] == 0xD9:
+                scanEnd -= 2
+            break
+        pos += 2 + length
+    else:
+        return None
+
+    if len(components) != 3 or width == 0 or height == 0:
+        return None
+    # Dimensions travel in 8-pixel units up to 2040
+    if width > 2040 or height > 2040 or width % 8 or height % 8:
+        return None
+
+    sampling = components[0][0]
+    if sampling == 0x21:
+        jpegType = 0
+    elif sampling == 0x22:
+        jpegType = 1
+    else:
+        return None
+    if components[1][0] != 0x11 or components[2][0] != 0x11:
+        return None
+    if components[1][1] != components[2][1]:
+        return None
+
+    try:
+        tables = qtables[components[0][1]] + qtables[components[1][1]]
+    except KeyError:
+        return None
+    if len(tables) != 128:
+        return None
+
+    if restartInterval:
+        jpegType += 64
+
+    return JpegFrame(jpegType, width, height, tables, restartInterval,
+                     view[scanStart:scanEnd])
+
+
+def makeHeaders(jpegType, width, height, qtables, restartInterval=0):
+    """Rebuild the JFIF headers for a frame (RFC 2435 Appendix B)"""
+    out = bytearray(b'\xff\xd8')
+
+    # Quantization tables
+    lumq, chmq = qtables[:64], qtables[64:128]
+    out += b'\xff\xdb' + struct.pack('!HB', 67, 0) + lumq
+    out += b'\xff\xdb' + struct.pack('!HB', 67, 1) + chmq
+
+    if restartInterval:
+        out += b'\xff\xdd' + struct.pack('!HH', 4, restartInterval)
+
+    # Frame header: 3 components, luma 2x1 (type 0) or 2x2 (type 1)
+    sampling = 0x21 if (jpegType & 0x3F) == 0 else 0x22
+    out += b'\xff\xc0' + struct.pack('!HBHHB', 17, 8, height, width, 3)
+    out += bytes([0, sampling, 0, 1, 0x11, 1, 2, 0x11, 1])
+
+    # Huffman tables
+    for tableClass in (0x00, 0x10, 0x01, 0x11):
+        codelens, symbols = STANDARD_HUFFMAN_TABLES[tableClass]
+        out += b'\xff\xc4' + struct.pack('!HB', 3 + len(codelens) + len(symbols), tableClass)
+        out += codelens + symbols
+
+    # Scan header
+    out += b'\xff\xda' + struct.pack('!HB', 12, 3)
+    out += bytes([0, 0x00, 1, 0x11, 2, 0x11, 0, 63, 0])
+    return bytes(out)
+
+
+class JpegPacketizer:
+    """Split JPEG frames into MTU-sized RTP/JPEG payloads"""
+
+    def __init__(self, mtu=DEFAULT_MTU):
+        self.mtu = mtu
+
+    def packetize(self, jpeg):
+        """
+        Return a list of (payload, marker) tuples for one frame.
+        Each payload starts with the RFC 2435 main JPEG header; the marker
+        is set only on the last fragment of the frame.
+        """
+        return [(header + chunk, marker) for header, chunk, marker in self.fragments(jpeg)]
+
+    def fragments(self, jpeg):
+        """
+        Return a list of (header, chunk, marker) tuples for one frame, where
+        chunk is a zero-copy slice of the frame data. Senders that support
+        scatter/gather I/O can send header and chunk without joining them.
+        """
+        frame = parseJpeg(jpeg)
+        if frame is None:
+            return self._fragment(memoryview(jpeg), TYPE_JFIF, 0, 0, 0, b'', b'')
+
+        restartHeader = b''
+        if frame.restartInterval:
+            # F=L=1, count 0x3FFF: fragments are not aligned to restart intervals
+            restartHeader = _RESTART_HEADER.pack(frame.restartInterval, 0xFFFF)
+
+        qtableHeader = _QTABLE_HEADER.pack(0, 0, len(frame.qtables)) + frame.qtables
+
+        # Q=255: tables travel in-band with every frame
+        return self._fragment(frame.scan, frame.type, 255, frame.width // 8,
+                              frame.height // 8, restartHeader, qtableHeader)
+
+    def _fragment(self, data, jpegType, q, width, height, restartHeader, qtableHeader):
+        """Cut data into fragments, prefixing the RFC 2435 headers"""
+        fragments = []
+        offset = 0
+        total = len(data)
+        room = self.mtu - RTP_HEADER_SIZE - JPEG_HEADER_SIZE - len(restartHeader)
+
+        while True:
+            header = _MAIN_HEADER.pack(offset & 0xFFFFFF, jpegType, q, width & 0xFF, height & 0xFF)
+            header += restartHeader
+            if offset == 0:
+                header += qtableHeader
+            size = max(1, room - (len(qtableHeader) if offset == 0 else 0))
+            chunk = data[offset:offset + size]
+            offset += len(chunk)
+            last = offset >= total
+            fragments.append((header, chunk, 1 if last else 0))
+            if last:
+                return fragments
+
+
+class JpegReassembler:
+    """Rebuild complete JPEG frames from RTP/JPEG fragments"""
+
+    def __init__(self, maxPending=4):
+        self.maxPending = maxPending
+        self.pending = {}
+        self.framesCompleted = 0
+        self.framesDropped = 0
+
+    def addPacket(self, timestamp, marker, payload):
+        """
+        Add one RTP payload. Fragments may arrive in any order; frames are
+        keyed on the RTP timestamp. Returns the JPEG bytes when a frame is
+        complete, otherwise None.
+        """
+        view = memoryview(payload)
+        if len(view) < JPEG_HEADER_SIZE:
+            return None
+
+        word, jpegType, q, width, height = _MAIN_HEADER.unpack_from(view)
+        offset = word & 0xFFFFFF
+        pos = JPEG_HEADER_SIZE
+
+        frame = self.pending.get(timestamp)
+        if frame is None:
+            if len(self.pending) >= self.maxPending:
+                # Give up on the oldest incomplete frame
+                del self.pending[next(iter(self.pending))]
+                self.framesDropped += 1
+            frame = self.pending[timestamp] = _PendingFrame(jpegType, q, width, height)
+
+        if 64 <= jpegType <= 127:
+            frame.restartInterval = _RESTART_HEADER.unpack_from(view, pos)[0]
+            pos += RESTART_HEADER_SIZE
+
+        if offset == 0 and 128 <= q <= 255 and jpegType != TYPE_JFIF:
+            mbz, precision, length = _QTABLE_HEADER.unpack_from(view, pos)
+            pos += QTABLE_HEADER_SIZE
+            if length:
+                frame.qtables = bytes(view[pos:pos + length])
+            pos += length
+
+        frame.fragments[offset] = bytes(view[pos:])
+        if marker:
+            frame.totalLength = offset + len(view) - pos
+
+        data = frame.assemble()
+        if data is None:
+            return None
+
+        del self.pending[timestamp]
+        # Anything older than a completed frame can no longer be shown in order
+        for stale in [ts for ts in self.pending if _isOlder(ts, timestamp)]:
+            del self.pending[stale]
+            self.framesDropped += 1
+        self.framesCompleted += 1
+        return data
+
+    def reset(self):
+        """Forget all partially received frames"""
+        self.pending.clear()
+
+
+def _isOlder(a, b):
+    """Compare 32-bit RTP timestamps with wraparound"""
+    return a != b and ((b - a) & 0xFFFFFFFF) < 0x80000000
+
+
+class _PendingFrame:
+    """Fragments received so far for one RTP timestamp"""
+
+    def __init__(self, jpegType, q, width, height):
+        self.type = jpegType
+        self.q = q
+        self.width = width
+        self.height = height
+        self.restartInterval = 0
+        self.qtables = None
+        self.fragments = {}
+        self.totalLength = None
+
+    def assemble(self):
+        """Return the complete JPEG, or None while fragments are missing"""
+        if self.totalLength is None:
+            return None
+
+        expected = 0
+        for offset in sorted(self.fragments):
+            if offset != expected:
+                return None
+            expected += len(self.fragments[offset])
+        if expected != self.totalLength:
+            return None
+
+        body = b''.join(self.fragments[offset] for offset in sorted(self.fragments))
+        if self.type == TYPE_JFIF:
+            return body
+
+        if self.q < 128:
+            qtables = makeTables(self.q)
+        elif self.qtables is not None and len(self.qtables) >= 128:
+            qtables = self.qtables
+        else:
+            return None
+
+        header = makeHeaders(self.type, self.width * 8, self.height * 8,
+                             qtables, self.restartInterval)
+        return header + body + b'\xff\xd9'
@@ -3,11 +3,18 @@ RTP Packet Handler
 Implements RTP packet encoding and decoding according to RFC 3550
 """
 
+import socket
+import struct
 import sys
+from array import array
 from time import time
+from BatchSocket import HAVE_MMSG, BatchSender, BatchReceiver
 
 HEADER_SIZE = 12
 
+# V/P/X/CC, M/PT, sequence number, timestamp, SSRC
+_HEADER = struct.Struct('!BBHII')
+
 
 class RtpPacket:
     """
@@ -26,9 +33,8 @@ class RtpPacket:
     +-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+-+
     """
     
-    header = bytearray(HEADER_SIZE)
-    
     def __init__(self):
+        self.header = bytearray(HEADER_SIZE)
         self.version = 2
         self.padding = 0
         self.extension = 0
@@ -42,28 +48,15 @@ class RtpPacket:
     
     def encode(self):
         """Encode the RTP packet with header and payload"""
-        # Set the first byte: V(2 bits), P(1 bit), X(1 bit), CC(4 bits)
-        self.header[0] = (self.version << 6) | (self.padding << 5) | \
-                         (self.extension << 4) | self.cc
-        
-        # Set the second byte: M(1 bit), PT(7 bits)
-        self.header[1] = (self.marker << 7) | self.pt
-        
-        # Set sequence number (bytes 2-3)
-        self.header[2] = (self.seqNum >> 8) & 0xFF
-        self.header[3] = self.seqNum & 0xFF
-        
-        # Set timestamp (bytes 4-7)
-        self.header[4] = (self.timestamp >> 24) & 0xFF
-        self.header[5] = (self.timestamp >> 16) & 0xFF
-        self.header[6] = (self.timestamp >> 8) & 0xFF
-        self.header[7] = self.timestamp & 0xFF
-        
-        # Set SSRC (bytes 8-11)
-        self.header[8] = (self.ssrc >> 24) & 0xFF
-        self.header[9] = (self.ssrc >> 16) & 0xFF
-        self.header[10] = (self.ssrc >> 8) & 0xFF
-        self.header[11] = self.ssrc & 0xFF
+        # First byte: V(2 bits), P(1 bit), X(1 bit), CC(4 bits)
+        # Second byte: M(1 bit), PT(7 bits)
+        _HEADER.pack_into(self.header, 0,
+                          (self.version << 6) | (self.padding << 5) |
+                          (self.extension << 4) | self.cc,
+                          (self.marker << 7) | self.pt,
+                          self.seqNum & 0xFFFF,
+                          self.timestamp & 0xFFFFFFFF,
+                          self.ssrc & 0xFFFFFFFF)
         
         # Concatenate header and payload
         return bytes(self.header) + self.payload
@@ -72,27 +65,17 @@ class RtpPacket:
         """Decode the RTP packet from byte stream"""
         try:
             self.header = bytearray(byteStream[:HEADER_SIZE])
+            first, second, self.seqNum, self.timestamp, self.ssrc = _HEADER.unpack(self.header)
             
-            # Parse the first byte
-            self.version = (self.header[0] >> 6) & 0x03
-            self.padding = (self.header[0] >> 5) & 0x01
-            self.extension = (self.header[0] >> 4) & 0x01
-            self.cc = self.header[0] & 0x0F
+            # First byte: V(2 bits), P(1 bit), X(1 bit), CC(4 bits)
+            self.version = first >> 6
+            self.padding = (first >> 5) & 0x01
+            self.extension = (first >> 4) & 0x01
+            self.cc = first & 0x0F
             
-            # Parse the second byte
-            self.marker = (self.header[1] >> 7) & 0x01
-            self.pt = self.header[1] & 0x7F
-            
-            # Parse sequence number
-            self.seqNum = (self.header[2] << 8) | self.header[3]
-            
-            # Parse timestamp
-            self.timestamp = (self.header[4] << 24) | (self.header[5] << 16) | \
-                           (self.header[6] << 8) | self.header[7]
-            
-            # Parse SSRC
-            self.ssrc = (self.header[8] << 24) | (self.header[9] << 16) | \
-                       (self.header[10] << 8) | self.header[11]
+            # Second byte: M(1 bit), PT(7 bits)
+            self.marker = second >> 7
+            self.pt = second & 0x7F
             
             # Extract payload
             self.payload = byteStream[HEADER_SIZE:]
@@ -113,6 +96,10 @@ class RtpPacket:
         """Return the timestamp"""
         return self.timestamp
     
+    def getMarker(self):
+        """Return the marker bit"""
+        return self.marker
+    
     def getPayloadType(self):
         """Return the payload type"""
         return self.pt
@@ -144,3 +131,183 @@ class RtpPacket:
     def setSSRC(self, ssrc):
         """Set the SSRC"""
         self.ssrc = ssrc
+
+
+class RtpSender:
+    """
+    Sends RTP packets for one stream without building a packet object per
+    datagram. The header is packed into a buffer owned by this sender (one
+    sender per sending thread), and header and payload go out together with
+    scatter/gather sendmsg, so the payload is never copied in Python.
+    
+    A batched sender queues packets instead and sends them with one
+    sendmmsg call per flush() (see BatchSocket.py).
+    """
+    
+    def __init__(self, sock, addr, ssrc, pt=26, seqNum=0, batched=False):
+        self.sock = sock
+        self.addr = addr
+        self.ssrc = ssrc & 0xFFFFFFFF
+        self.pt = pt
+        self.seqNum = seqNum & 0xFFFF
+        self.header = bytearray(HEADER_SIZE)
+        # sendmsg is not available on Windows
+        self.useSendmsg = hasattr(sock, 'sendmsg')
+        self.batch = BatchSender(sock, addr) if batched and sock is not None else None
+        self.packetsSent = 0
+        self.bytesSent = 0
+    
+    def packHeader(self, timestamp, marker=0):
+        """Pack the header for the next packet into the sender's buffer"""
+        _HEADER.pack_into(self.header, 0, 0x80, (marker << 7) | self.pt,
+                          self.seqNum, timestamp & 0xFFFFFFFF, self.ssrc)
+        return self.header
+    
+    def encode(self, parts, timestamp, marker=0):
+        """Return the next packet as bytes (for transports without sendmsg)"""
+        self.packHeader(timestamp, marker)
+        self.seqNum = (self.seqNum + 1) & 0xFFFF
+        return b''.join((self.header, *parts))
+    
+    def send(self, parts, timestamp, marker=0):
+        """Send (or, when batched, queue) one packet whose payload is the concatenation of parts"""
+        self.packHeader(timestamp, marker)
+        if self.batch:
+            sent = self.batch.add((self.header, *parts))
+        elif self.useSendmsg:
+            sent = self.sock.sendmsg([self.header, *parts], [], 0, self.addr)
+        else:
+            sent = self.sock.sendto(b''.join((self.header, *parts)), self.addr)
+        self.seqNum = (self.seqNum + 1) & 0xFFFF
+        self.packetsSent += 1
+        self.bytesSent += sent
+        return sent
+    
+    def flush(self):
+        """Send any queued packets"""
+        if self.batch:
+            self.batch.flush()
+
+
+class RtpBatch:
+    """
+    Header fields of a burst of received RTP datagrams, one entry per
+    datagram, with zero-copy payload views. Datagrams that are not RTP
+    version 2 are skipped.
+    """
+    
+    def __init__(self):
+        self.seqNums = array('H')
+        self.timestamps = array('I')
+        self.ssrcs = array('I')
+        self.markers = bytearray()
+        self.payloadTypes = bytearray()
+        self.payloads = []
+        self.bytes = 0
+    
+    def __len__(self):
+        return len(self.seqNums)
+    
+    def add(self, first, second, seqNum, timestamp, ssrc, datagram):
+        """Append one datagram whose fixed header has already been unpacked"""
+        if first >> 6 != 2:
+            return
+        
+        # Skip CSRCs, header extension and padding
+        start = HEADER_SIZE + (first & 0x0F) * 4
+        end = len(datagram)
+        if first & 0x10:
+            if start + 4 > end:
+                return
+            start += 4 + ((datagram[start + 2] << 8) | datagram[start + 3]) * 4
+        if first & 0x20 and end > start:
+            end -= datagram[end - 1]
+        if start > end:
+            return
+        
+        self.seqNums.append(seqNum)
+        self.timestamps.append(timestamp)
+        self.ssrcs.append(ssrc)
+        self.markers.append(second >> 7)
+        self.payloadTypes.append(second & 0x7F)
+        self.payloads.append(datagram[start:end])
+        self.bytes += len(datagram)
+
+
+def decodeBatch(datagrams):
+    """Parse the headers of a list of RTP datagrams at once"""
+    batch = RtpBatch()
+    unpack = _HEADER.unpack_from
+    for datagram in datagrams:
+        if len(datagram) < HEADER_SIZE:
+            continue
+        datagram = memoryview(datagram)
+        batch.add(*unpack(datagram), datagram)
+    return batch
+
+
+class RtpRing:
+    """
+    Preallocated ring of fixed-size datagram slots. A burst of datagrams is
+    received straight into the slots (with one recvmmsg call on Linux) and
+    all headers are then parsed in one struct.iter_unpack pass over the ring.
+    """
+    
+    def __init__(self, slots=64, slotSize=2048):
+        # slotSize must hold the largest datagram the sender emits (its MTU)
+        self.slots = slots
+        self.slotSize = slotSize
+        self.buffer = bytearray(slots * slotSize)
+        self.view = memoryview(self.buffer)
+        self.lengths = array('I', [0] * slots)
+        # The fixed header followed by padding up to the slot size
+        self.slotStruct = struct.Struct(f'!BBHII{slotSize - HEADER_SIZE}x')
+        # Non-blocking receive flag (not available on Windows)
+        self.dontWait = getattr(socket, 'MSG_DONTWAIT', 0)
+        # Report the full length of oversized datagrams (Linux) so they are dropped
+        self.truncFlag = getattr(socket, 'MSG_TRUNC', 0)
+        self.truncated = 0
+        # recvmmsg receiver, created for the first socket used
+        self.receiver = None
+    
+    def receive(self, sock):
+        """
+        Fill slots from a socket: wait (honoring the socket timeout) for the
+        first datagram, then take whatever else is already queued.
+        Returns the number of datagrams received.
+        """
+        if HAVE_MMSG:
+            if self.receiver is None or self.receiver.sock is not sock:
+                self.receiver = BatchReceiver(sock, self.buffer, self.slots, self.slotSize)
+            return self.receiver.receive(self.lengths, self.truncFlag)
+        
+        nbytes, addr = sock.recvfrom_into(self.view[:self.slotSize], 0, self.truncFlag)
+        self.lengths[0] = nbytes
+        count = 1
+        
+        while self.dontWait and count < self.slots:
+            try:
+                start = count * self.slotSize
+                nbytes, addr = sock.recvfrom_into(self.view[start:start + self.slotSize],
+                                                  0, self.dontWait | self.truncFlag)
+            except (BlockingIOError, InterruptedError, socket.timeout):
+                break
+            self.lengths[count] = nbytes
+            count += 1
+        
+        return count
+    
+    def decode(self, count):
+        """Parse the headers of the first count slots"""
+        batch = RtpBatch()
+        headers = self.slotStruct.iter_unpack(self.view[:count * self.slotSize])
+        for i, (first, second, seqNum, timestamp, ssrc) in enumerate(headers):
+            length = self.lengths[i]
+            if length < HEADER_SIZE:
+                continue
+            if length > self.slotSize:
+                self.truncated += 1
+                continue
+            start = i * self.slotSize
+            batch.add(first, second, seqNum, timestamp, ssrc, self.view[start:start + length])
+        return batch
@@ -7,7 +7,16 @@ import sys
 import socket
 import threading
 import time
-from RtpPacket import RtpPacket
+from RtpPacket import RtpSender, HEADER_SIZE
+from RtcpPacket import (ReceiverFeedback, buildSenderReport, buildSdes, reportInterval,
+                        RTCP_BUFFER_SIZE)
+from RtpJpeg import JpegPacketizer
+from Broadcast import BroadcastHub, BroadcastSubscriber
+from Adaptation import RateController, TierEncoder, renditionTiers
+from MjpegFile import loadManifest, manifestPath
+from Pacer import FramePacer
+from VideoStream import VideoStream, setFrameCache
+from FrameCache import FrameCache
 
 # RTSP States
 INIT = 0
@@ -21,10 +30,70 @@ PAUSE = 'PAUSE'
 TEARDOWN = 'TEARDOWN'
 
 
+def parseRange(lines):
+    """
+    Get the start time in seconds from an RTSP 'Range: npt=<start>-[<end>]'
+    header. Accepts seconds (npt=12.5-) and hh:mm:ss (npt=0:01:02.5-).
+    Returns None if there is no usable Range header.
+    """
+    for line in lines:
+        if line.startswith('Range:'):
+            value = line.split(':', 1)[1].strip()
+            if not value.startswith('npt='):
+                return None
+            start = value[4:].split('-')[0].strip()
+            if not start or start == 'now':
+                return None
+            try:
+                seconds = 0.0
+                for part in start.split(':'):
+                    seconds = seconds * 60 + float(part)
+                return max(seconds, 0.0)
+            except ValueError:
+                return None
+    return None
+
+
+def formatRange(start, end):
+    """Format an RTSP Range header value"""
+    return f'npt={start:.3f}-{end:.3f}'
+
+
+def parseTransport(lines):
+    """
+    Get the client RTP and RTCP ports from an RTSP Transport header
+    (RTP/AVP;unicast;client_port=25000-25001). The RTCP port is 0 if the
+    client did not give one.
+    """
+    for line in lines:
+        if line.startswith('Transport:'):
+            transport = line.split(' ')[1]
+            if 'client_port=' in transport:
+                ports = transport.split('client_port=')[1].split(';')[0]
+                portRange = ports.split('-')
+                rtcpPort = int(portRange[1]) if len(portRange) > 1 else 0
+                return int(portRange[0]), rtcpPort
+    return 0, 0
+
+
+def formatTransport(clientRtpPort, clientRtcpPort, serverRtpPort, serverRtcpPort):
+    """Format the Transport header of a SETUP reply"""
+    clientPorts = f'{clientRtpPort}-{clientRtcpPort}' if clientRtcpPort else f'{clientRtpPort}'
+    return (f'RTP/AVP;unicast;client_port={clientPorts};'
+            f'server_port={serverRtpPort}-{serverRtcpPort}')
+
+
+def senderReport(ssrc, pacer, packetsSent, bytesSent):
+    """Compound SR + SDES for a stream (bytesSent includes the RTP headers)"""
+    report = buildSenderReport(ssrc, pacer.rtpTimestampNow(), packetsSent,
+                               bytesSent - HEADER_SIZE * packetsSent)
+    return report + buildSdes(ssrc, f'server@{socket.gethostname()}')
+
+
 class ServerWorker:
     """Worker class to handle individual client connections"""
     
-    def __init__(self, clientInfo):
+    def __init__(self, clientInfo, hub=None, encoder=None):
         self.clientInfo = clientInfo
         self.clientSocket = clientInfo['socket']
         self.clientAddr = clientInfo['addr']
@@ -33,12 +102,33 @@ class ServerWorker:
         self.clientRtpPort = 0
         self.clientRtcpPort = 0
         self.rtpSocket = None
+        self.rtcpSocket = None
         self.state = INIT
         self.videoStream = None
         self.frameNum = 0
+        self.rtpSender = None
+        self.packetizer = JpegPacketizer()
+        self.pacer = None
+        
+        # Shared broadcast mode: one reader per file for all sessions
+        self.hub = hub
+        self.broadcastSource = None
+        self.subscriber = None
+        
+        # Adaptive mode: a quality tier chosen from this client's reports
+        self.encoder = encoder
+        self.rateController = None
+        # Open rendition files by path (the current one is videoStream)
+        self.renditionStreams = {}
+        
         self.stopEvent = threading.Event()
         self.workerThread = None
         
+        # RTCP: sender reports out, receiver reports in
+        self.feedback = None
+        self.rtcpStop = threading.Event()
+        self.rtcpThread = None
+        
     def run(self):
         """Main loop to handle RTSP requests"""
         print(f"[Server] Connection from {self.clientAddr}")
@@ -68,7 +158,7 @@ class ServerWorker:
                     if requestType == SETUP:
                         self.handleSetup(lines)
                     elif requestType == PLAY:
-                        self.handlePlay()
+                        self.handlePlay(lines)
                     elif requestType == PAUSE:
                         self.handlePause()
                     elif requestType == TEARDOWN:
@@ -90,31 +180,50 @@ class ServerWorker:
                 requestLine = lines[0].split(' ')
                 filename = requestLine[1]
                 
-                # Open video file
-                self.videoStream = VideoStream(filename)
+                # Open video file (or join the shared reader for it)
+                if self.hub:
+                    self.broadcastSource = self.hub.acquire(filename)
+                else:
+                    # Prefer the renditions in a manifest next to the file
+                    renditions = loadManifest(manifestPath(filename))
+                    self.videoStream = VideoStream(renditions[0].path if renditions else filename)
+                    self.renditionStreams[self.videoStream.filename] = self.videoStream
+                    self.pacer = FramePacer(self.videoStream.fps)
+                    if self.encoder:
+                        tiers = renditionTiers(renditions) if renditions else self.encoder.tiers()
+                        self.rateController = RateController(tiers)
                 
                 # Get RTP/RTCP port from request
-                for line in lines:
-                    if line.startswith('Transport:'):
-                        transport = line.split(' ')[1]
-                        # Parse client_port from Transport header
-                        # Format: RTP/AVP;unicast;client_port=25000-25001
-                        if 'client_port=' in transport:
-                            ports = transport.split('client_port=')[1]
-                            portRange = ports.split('-')
-                            self.clientRtpPort = int(portRange[0])
-                            if len(portRange) > 1:
-                                self.clientRtcpPort = int(portRange[1])
+                self.clientRtpPort, self.clientRtcpPort = parseTransport(lines)
                 
                 # Generate session ID
                 self.sessionId = int(time.time())
                 
-                # Create RTP socket
+                # Create RTP and RTCP sockets
                 self.rtpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.rtpSocket.bind(('', 0))
+                self.rtpSender = RtpSender(self.rtpSocket, (self.clientAddr[0], self.clientRtpPort),
+                                           self.sessionId, batched=True)
+                self.rtcpSocket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self.rtcpSocket.bind(('', 0))
+                self.feedback = ReceiverFeedback(self.sessionId)
+                
+                if self.broadcastSource:
+                    self.subscriber = BroadcastSubscriber(
+                        self.rtpSocket, (self.clientAddr[0], self.clientRtpPort), self.sessionId)
+                
+                # Exchange reports until the session ends
+                self.rtcpStop.clear()
+                self.rtcpThread = threading.Thread(target=self.listenRtcp)
+                self.rtcpThread.start()
                 
                 # Send RTSP reply
                 self.state = READY
-                self.sendRtspReply(200, self.rtspSeq, self.sessionId)
+                self.sendRtspReply(200, self.rtspSeq, self.sessionId, {
+                    'Transport': formatTransport(self.clientRtpPort, self.clientRtcpPort,
+                                                 self.rtpSocket.getsockname()[1],
+                                                 self.rtcpSocket.getsockname()[1])
+                })
                 
                 print(f"[Server] SETUP completed. Session: {self.sessionId}, RTP port: {self.clientRtpPort}")
                 
@@ -122,18 +231,39 @@ class ServerWorker:
                 print(f"[Server] SETUP error: {e}")
                 self.sendRtspReply(404, self.rtspSeq)
     
-    def handlePlay(self):
-        """Handle PLAY request"""
-        if self.state == READY:
+    def handlePlay(self, lines):
+        """Handle PLAY request (with an optional Range header to seek)"""
+        position = parseRange(lines)
+        
+        # A shared stream is live: it cannot be repositioned per session
+        if self.subscriber:
+            position = None
+        
+        if self.state == READY or (self.state == PLAYING and position is not None):
+            if self.state == PLAYING:
+                # PLAY while playing repositions the stream
+                self.stopStreaming()
             self.state = PLAYING
             
+            headers = {}
+            if self.videoStream:
+                if position is not None:
+                    # Jump straight to the requested frame via the index
+                    self.videoStream.seekTime(position)
+                headers['Range'] = formatRange(self.videoStream.position(),
+                                               self.videoStream.duration())
+            
             # Send RTSP reply
-            self.sendRtspReply(200, self.rtspSeq, self.sessionId)
+            self.sendRtspReply(200, self.rtspSeq, self.sessionId, headers)
             
-            # Start streaming in a new thread
-            self.stopEvent.clear()
-            self.workerThread = threading.Thread(target=self.sendRtp)
-            self.workerThread.start()
+            if self.subscriber:
+                # Join the shared stream at its current position
+                self.broadcastSource.subscribe(self.subscriber)
+            else:
+                # Start streaming in a new thread
+                self.stopEvent.clear()
+                self.workerThread = threading.Thread(target=self.sendRtp)
+                self.workerThread.start()
             
             print(f"[Server] PLAY started for session {self.sessionId}")
     
@@ -143,67 +273,168 @@ class ServerWorker:
             self.state = READY
             
             # Stop the streaming thread
-            self.stopEvent.set()
-            if self.workerThread:
-                self.workerThread.join()
+            self.stopStreaming()
             
             # Send RTSP reply
             self.sendRtspReply(200, self.rtspSeq, self.sessionId)
             
             print(f"[Server] PAUSE for session {self.sessionId}")
+            self.printSummary()
     
     def handleTeardown(self):
         """Handle TEARDOWN request"""
         # Stop streaming
-        self.stopEvent.set()
-        if self.workerThread:
-            self.workerThread.join()
+        self.stopStreaming()
         
         # Send RTSP reply
         self.sendRtspReply(200, self.rtspSeq, self.sessionId)
         
         print(f"[Server] TEARDOWN for session {self.sessionId}")
+        self.printSummary()
+    
+    def printSummary(self):
+        """Log pacing and receiver report metrics for this session"""
+        if self.pacer:
+            print(f"[Server] Pacing for session {self.sessionId}: {self.pacer.summary()}")
+        if self.feedback:
+            print(f"[Server] RTCP for session {self.sessionId}: {self.feedback.summary()}")
+        if self.rateController:
+            print(f"[Server] Adaptation for session {self.sessionId}: {self.rateController.summary()}")
+        if self.videoStream and self.videoStream.cache:
+            print(f"[Server] Frame cache: {self.videoStream.cache.summary()}")
+    
+    def stopStreaming(self):
+        """Stop sending RTP to this client"""
+        if self.subscriber:
+            self.broadcastSource.unsubscribe(self.subscriber)
+        
+        self.stopEvent.set()
+        if self.workerThread:
+            self.workerThread.join()
     
     def sendRtp(self):
         """Send RTP packets to the client"""
         print(f"[Server] Starting RTP stream to {self.clientAddr[0]}:{self.clientRtpPort}")
         
+        # Frames are due at fixed intervals from now, whatever sending costs
+        self.pacer.start()
+        
         while not self.stopEvent.is_set():
             try:
+                # Wait for the next frame's deadline
+                delay = self.pacer.timeUntilDue()
+                if delay > 0 and self.stopEvent.wait(delay):
+                    break
+                
+                # Too far behind: skip frames rather than bursting them
+                for _ in range(self.pacer.framesToDrop()):
+                    self.readFrame()
+                
+                # Move to the rendition the current tier reads from
+                if self.rateController:
+                    self.selectRendition()
+                
                 # Get next frame from video
-                data = self.videoStream.nextFrame()
+                data = self.readFrame()
+                if data and self.rateController:
+                    # Reduced frame rate: keep the schedule, send one frame in n
+                    if not self.rateController.sendFrame(self.pacer.frameIndex):
+                        self.pacer.frameSkipped()
+                        continue
+                    data = self.encoder.frame(self.videoStream.filename,
+                                              self.videoStream.frameNum() - 1, data,
+                                              self.rateController.tier())
                 if data:
-                    frameNum = self.videoStream.frameNum()
-                    
-                    # Create RTP packet
-                    rtpPacket = RtpPacket()
-                    rtpPacket.setPayloadType(26)  # MJPEG
-                    rtpPacket.setSeqNum(frameNum)
-                    rtpPacket.setTimestamp(int(time.time() * 90000))  # 90kHz clock
-                    rtpPacket.setSSRC(self.sessionId)
-                    rtpPacket.setPayload(data)
-                    
-                    # Send packet
-                    packet = rtpPacket.encode()
-                    self.rtpSocket.sendto(packet, (self.clientAddr[0], self.clientRtpPort))
-                    
-                    # Control frame rate (20 FPS)
-                    time.sleep(0.05)
-                else:
-                    # End of file, loop back
-                    self.videoStream.reset()
+                    # All fragments share the frame's media timestamp (90kHz clock)
+                    self.sendFrame(data, self.pacer.rtpTimestamp())
+                    self.pacer.frameSent()
                     
             except Exception as e:
                 print(f"[Server] Error sending RTP: {e}")
                 if self.stopEvent.is_set():
                     break
     
-    def sendRtspReply(self, code, seq, session=None):
+    def listenRtcp(self):
+        """Send sender reports while playing and read the client's receiver reports"""
+        nextReport = time.monotonic() + reportInterval()
+        
+        while not self.rtcpStop.is_set():
+            try:
+                # Wait for a report from the client until the next SR is due
+                self.rtcpSocket.settimeout(max(nextReport - time.monotonic(), 0.001))
+                data, addr = self.rtcpSocket.recvfrom(RTCP_BUFFER_SIZE)
+                reports = self.feedback.reports
+                self.feedback.receive(data)
+                if self.rateController and self.feedback.reports != reports:
+                    self.adapt()
+            except (socket.timeout, ConnectionResetError):
+                # ConnectionResetError: ICMP port unreachable reported on Windows
+                pass
+            except OSError:
+                # Socket closed by cleanup (or unusable)
+                break
+            
+            if time.monotonic() >= nextReport:
+                nextReport = time.monotonic() + reportInterval()
+                if self.state == PLAYING and self.clientRtcpPort:
+                    try:
+                        self.rtcpSocket.sendto(self.senderReport(),
+                                               (self.clientAddr[0], self.clientRtcpPort))
+                    except OSError as e:
+                        print(f"[Server] Error sending RTCP: {e}")
+    
+    def adapt(self):
+        """Move to another quality tier if the latest report calls for it"""
+        if self.rateController.update(self.feedback):
+            tier = self.rateController.tier()
+            print(f"[Server] Session {self.sessionId} switched to tier {tier.name} "
+                  f"(scale {tier.scale}, quality {tier.quality or 'stored'}, "
+                  f"1/{tier.fpsDivisor} frames) - {self.feedback.summary()}")
+    
+    def selectRendition(self):
+        """Switch to the current tier's rendition file at the same media position"""
+        path = self.rateController.tier().path
+        if path is None or path == self.videoStream.filename:
+            return
+        stream = self.renditionStreams.get(path)
+        if stream is None:
+            stream = VideoStream(path)
+            self.renditionStreams[path] = stream
+        stream.seekTime(self.videoStream.position())
+        self.videoStream = stream
+        self.pacer.setRate(stream.fps)
+    
+    def senderReport(self):
+        """Build the next SR for whichever sender feeds this session"""
+        if self.subscriber:
+            return senderReport(self.subscriber.ssrc, self.broadcastSource.pacer,
+                                self.subscriber.packetsSent, self.subscriber.bytesSent)
+        return senderReport(self.rtpSender.ssrc, self.pacer,
+                            self.rtpSender.packetsSent, self.rtpSender.bytesSent)
+    
+    def readFrame(self):
+        """Read the next frame, looping back to the start at end of file"""
+        data = self.videoStream.nextFrame()
+        if not data:
+            self.videoStream.reset()
+            data = self.videoStream.nextFrame()
+        return data
+    
+    def sendFrame(self, data, timestamp):
+        """Split a JPEG into MTU-sized RTP/JPEG fragments (RFC 2435) and send them"""
+        # Fragments are queued and the whole frame goes out in one batched send
+        for header, chunk, marker in self.packetizer.fragments(data):
+            self.rtpSender.send((header, chunk), timestamp, marker)
+        self.rtpSender.flush()
+    
+    def sendRtspReply(self, code, seq, session=None, headers=None):
         """Send RTSP reply to the client"""
         if code == 200:
             reply = f'RTSP/1.0 200 OK\nCSeq: {seq}\n'
             if session:
                 reply += f'Session: {session}\n'
+            for name, value in (headers or {}).items():
+                reply += f'{name}: {value}\n'
         elif code == 404:
             reply = f'RTSP/1.0 404 Not Found\nCSeq: {seq}\n'
         else:
@@ -216,16 +447,23 @@ class ServerWorker:
     
     def cleanup(self):
         """Clean up resources"""
-        self.stopEvent.set()
+        self.stopStreaming()
         
-        if self.workerThread:
-            self.workerThread.join()
+        if self.broadcastSource:
+            self.hub.release(self.broadcastSource)
+            self.broadcastSource = None
         
         if self.rtpSocket:
             self.rtpSocket.close()
         
-        if self.videoStream:
-            self.videoStream.close()
+        self.rtcpStop.set()
+        if self.rtcpSocket:
+            self.rtcpSocket.close()
+        if self.rtcpThread:
+            self.rtcpThread.join()
+        
+        for stream in self.renditionStreams.values():
+            stream.close()
         
         if self.clientSocket:
             self.clientSocket.close()
@@ -233,59 +471,19 @@ class ServerWorker:
         print(f"[Server] Connection closed for {self.clientAddr}")
 
 
-class VideoStream:
-    """Video stream class to read MJPEG frames"""
-    
-    def __init__(self, filename):
-        try:
-            self.filename = filename
-            self.file = open(filename, 'rb')
-            self.currentFrame = 0
-        except Exception as e:
-            print(f"[VideoStream] Error opening file {filename}: {e}")
-            raise
-    
-    def nextFrame(self):
-        """Get the next frame"""
-        try:
-            # Read frame length (5 bytes)
-            data = self.file.read(5)
-            if not data or len(data) < 5:
-                return None
-            
-            frameLength = int(data)
-            
-            # Read frame data
-            frameData = self.file.read(frameLength)
-            self.currentFrame += 1
-            
-            return frameData
-        except Exception as e:
-            print(f"[VideoStream] Error reading frame: {e}")
-            return None
-    
-    def frameNum(self):
-        """Get current frame number"""
-        return self.currentFrame
-    
-    def reset(self):
-        """Reset to beginning of file"""
-        self.file.seek(0)
-        self.currentFrame = 0
-    
-    def close(self):
-        """Close the video file"""
-        if self.file:
-            self.file.close()
-
-
 class Server:
     """Main RTSP server class"""
     
-    def __init__(self, port=8554):
+    def __init__(self, port=8554, shared=False, adaptive=False):
         self.port = port
         self.serverSocket = None
         self.clients = []
+        
+        # In shared mode every file is read once for all of its viewers
+        self.hub = BroadcastHub(VideoStream) if shared else None
+        
+        # In adaptive mode sessions share one cache of re-encoded frames
+        self.encoder = TierEncoder() if adaptive else None
     
     def start(self):
         """Start the RTSP server"""
@@ -308,7 +506,7 @@ class Server:
                     'addr': addr
                 }
                 
-                worker = ServerWorker(clientInfo)
+                worker = ServerWorker(clientInfo, self.hub, self.encoder)
                 self.clients.append(worker)
                 
                 # Handle client in new thread
@@ -336,14 +534,82 @@ def main():
     """Main function"""
     port = 8554
     
-    if len(sys.argv) > 1:
+    # Options: --shared (one reader per file for all viewers),
+    #          --async (all sessions on one asyncio event loop),
+    #          --adaptive (per-session quality tiers from receiver feedback),
+    #          --cache-mb=<n> (server-wide frame cache),
+    #          --pin=<file> (keep a file's frames cached, repeatable)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    options = [arg for arg in sys.argv[1:] if arg.startswith('--')]
+    
+    if len(args) > 0:
         try:
-            port = int(sys.argv[1])
+            port = int(args[0])
         except ValueError:
             print("Invalid port number. Using default port 8554")
     
-    server = Server(port)
+    cacheMb = 0
+    pinned = []
+    for option in options:
+        if option.startswith('--cache-mb='):
+            try:
+                cacheMb = float(option.split('=', 1)[1])
+            except ValueError:
+                print("[Server] Invalid --cache-mb value, frame cache disabled")
+        elif option.startswith('--pin='):
+            pinned.append(option.split('=', 1)[1])
+    
+    frameCache = None
+    if cacheMb > 0:
+        frameCache = FrameCache(int(cacheMb * 1024 * 1024))
+        setFrameCache(frameCache)
+        print(f"[Server] Frame cache enabled ({cacheMb:g} MB)")
+        for path in pinned:
+            # Hot titles are loaded up front and never evicted
+            try:
+                stream = VideoStream(path)
+                size = sum(stream.sizes)
+                if not frameCache.pin(path, size):
+                    stream.close()
+                    print(f"[Server] Cannot pin {path}: {size / 1048576:.1f} MB does not fit "
+                          f"in the cache next to the files already pinned")
+                    continue
+                stream.preload()
+                stream.close()
+                print(f"[Server] Pinned {path} ({stream.frameCount()} frames, "
+                      f"{size / 1048576:.1f} MB)")
+            except OSError as e:
+                print(f"[Server] Cannot pin {path}: {e}")
+    elif pinned:
+        print("[Server] --pin needs --cache-mb, ignoring")
+    
+    if '--async' in options:
+        from AsyncServer import AsyncServer
+        for option in ('--shared', '--adaptive'):
+            if option in options:
+                print(f"[Server] {option} is not supported with --async, ignoring")
+        server = AsyncServer(port)
+        server.start()
+        if frameCache:
+            print(f"[Server] Frame cache: {frameCache.summary()}")
+        return
+    
+    shared = '--shared' in options
+    if shared:
+        print("[Server] Shared broadcast mode enabled")
+    
+    adaptive = '--adaptive' in options
+    if adaptive and shared:
+        # Every viewer of a shared stream gets the same packets
+        print("[Server] --adaptive is not supported with --shared, ignoring")
+        adaptive = False
+    elif adaptive:
+        print("[Server] Adaptive bitrate mode enabled")
+    
+    server = Server(port, shared, adaptive)
     server.start()
+    if frameCache:
+        print(f"[Server] Frame cache: {frameCache.summary()}")
 
 
 if __name__ == '__main__':
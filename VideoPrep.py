@@ -5,17 +5,304 @@ Convert video files to MJPEG format for streaming
 
 import sys
 import cv2
+import numpy as np
 import os
+import math
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from MjpegFile import (FrameIndex, MjpegWriter, Rendition, indexPath, manifestPath,
+                       saveManifest, CONTAINER_VERSION, DEFAULT_FPS, LEGACY_VERSION)
 
 
-def video_to_mjpeg(input_file, output_file, fps=20):
+# One output of a conversion: frame height (None keeps the source size), JPEG quality, fps
+RenditionSpec = namedtuple('RenditionSpec', ['name', 'height', 'quality', 'fps'])
+
+# JPEG quality when none is given
+DEFAULT_QUALITY = 80
+
+# Smallest frame range given to one worker in a parallel convert
+MIN_CHUNK_FRAMES = 60
+
+# Encodes in flight per encoding thread in a pipelined convert
+PIPELINE_DEPTH = 4
+
+# Synthetic video patterns, frame number stamp and bitrate calibration
+SYNTH_PATTERNS = ('bars', 'gradient', 'checker', 'noise')
+FRAME_STAMP_BITS = 24
+STAMP_BLOCK = 8
+CHECKER_CELL = 32
+# Consecutive frames per calibration run: enough to cover every alignment
+# of the moving pattern with the 8x8 JPEG block grid
+CALIBRATION_FRAMES = 8
+
+
+def parse_renditions(spec, fps=20):
+    """
+    Parse a rendition list such as '1080p:85:20,720p:80,360p:60:10'
+    
+    Each entry is <height>p[:<quality>[:<fps>]]; quality defaults to 80
+    and fps to the conversion fps.
+    
+    Args:
+        spec: Comma-separated rendition entries
+        fps: Default frames per second
+    """
+    renditions = []
+    for entry in spec.split(','):
+        parts = entry.strip().split(':')
+        name = parts[0].lower()
+        if not name.endswith('p') or not name[:-1].isdigit():
+            raise ValueError(f"Bad rendition '{entry}' (expected e.g. 720p:80:20)")
+        quality = int(parts[1]) if len(parts) > 1 and parts[1] else DEFAULT_QUALITY
+        rendition_fps = float(parts[2]) if len(parts) > 2 and parts[2] else fps
+        renditions.append(RenditionSpec(name, int(name[:-1]), quality, rendition_fps))
+    
+    # Largest first: it is written to the output file itself
+    renditions.sort(key=lambda r: (r.height, r.quality, r.fps), reverse=True)
+    return renditions
+
+
+def rendition_path(output_file, name):
+    """Output path of a secondary rendition (video/movie_360p.Mjpeg)"""
+    root, ext = os.path.splitext(output_file)
+    return f"{root}_{name}{ext}"
+
+
+def rendition_size(width, height, target_height):
+    """
+    Frame size for a rendition: the source aspect ratio at the target
+    height (never upscaled), rounded down to multiples of 8 as RTP/JPEG
+    carries dimensions in 8-pixel blocks
+    """
+    if target_height is None or target_height >= height:
+        target_height = height
+    target_width = width * target_height / height
+    return max(8, int(target_width) // 8 * 8), max(8, int(target_height) // 8 * 8)
+
+
+def keep_frame(frame_num, step):
+    """
+    True if a source frame is shown in an output resampled to step output
+    frames per source frame (step <= 1). Output frame k shows the source
+    frame on screen at its presentation time, so source frame n is kept if
+    some k falls in [n * step, (n + 1) * step).
+    
+    Args:
+        frame_num: Source frame number
+        step: Output fps / source fps
+    """
+    # The epsilon absorbs rounding in fps ratios such as 20 / 29.97
+    return math.ceil((frame_num + 1) * step - 1e-9) > math.ceil(frame_num * step - 1e-9)
+
+
+def encode_frame(frame, size, quality):
+    """
+    Resize a decoded frame if needed and encode it as JPEG
+    
+    Args:
+        frame: Decoded BGR frame
+        size: Output (width, height)
+        quality: JPEG quality
+    """
+    if size != (frame.shape[1], frame.shape[0]):
+        frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    result, encoded_frame = cv2.imencode('.jpg', frame, encode_param)
+    return encoded_frame.tobytes() if result else None
+
+
+def convert_pipelined(cap, plans, writers, threads):
+    """
+    Decode, encode and write as a pipeline: frames are decoded on this
+    thread, encoded on a thread pool (OpenCV releases the GIL while it
+    resizes and encodes) and written in order by a writer thread. The
+    queue of encodes in flight is bounded, so memory use stays flat
+    however long the input is.
+    
+    Args:
+        cap: Opened cv2.VideoCapture
+        plans: (rendition, path, size, step) per rendition
+        writers: MjpegWriter per rendition
+        threads: Number of encoding threads
+    """
+    # (writer, future) per encoded frame, in output order
+    pending = queue.Queue(maxsize=threads * PIPELINE_DEPTH)
+    errors = []
+    
+    def write():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            writer, future = item
+            if errors:
+                # Keep draining so the decoder never blocks
+                continue
+            try:
+                data = future.result()
+                if data is not None:
+                    # MjpegWriter frames it for the output format (v2 or legacy)
+                    writer.write(data)
+            except Exception as e:
+                errors.append(e)
+    
+    writer_thread = threading.Thread(target=write)
+    writer_thread.start()
+    frame_num = 0
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            while not errors:
+                ret, frame = cap.read()
+                
+                if not ret:
+                    break
+                
+                for (rendition, path, size, step), writer in zip(plans, writers):
+                    # Take the frames shown at the output's presentation times
+                    if not keep_frame(frame_num, step):
+                        continue
+                    pending.put((writer, pool.submit(encode_frame, frame, size, rendition.quality)))
+                
+                frame_num += 1
+                if frame_num % 10 == 0:
+                    print(f"Processed {frame_num} frames...", end='\r')
+    finally:
+        pending.put(None)
+        writer_thread.join()
+    
+    if errors:
+        raise errors[0]
+    return frame_num
+
+
+def encode_chunk(input_file, first, last, plans, chunk_paths):
+    """
+    Decode source frames [first, last) and encode them for every rendition.
+    Runs in a worker process: JPEGs are appended to one chunk file per
+    rendition and their sizes returned.
+    
+    Args:
+        input_file: Input video file path
+        first: First source frame number
+        last: Source frame number to stop at
+        plans: (rendition, path, size, step) per rendition
+        chunk_paths: Chunk file per rendition
+    """
+    cap = cv2.VideoCapture(input_file)
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    sizes = [[] for _ in plans]
+    files = [open(path, 'wb') for path in chunk_paths]
+    try:
+        frame_num = first
+        while frame_num < last:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            
+            for i, (rendition, path, size, step) in enumerate(plans):
+                # Frame selection uses the source frame number, as in a sequential run
+                if not keep_frame(frame_num, step):
+                    continue
+                data = encode_frame(frame, size, rendition.quality)
+                if data is not None:
+                    files[i].write(data)
+                    sizes[i].append(len(data))
+            
+            frame_num += 1
+    finally:
+        for f in files:
+            f.close()
+        cap.release()
+    
+    return frame_num - first, sizes
+
+
+def convert_parallel(input_file, output_file, frame_count, plans, writers, workers):
+    """
+    Split the source into frame ranges, encode them on a process pool and
+    stitch the chunks into the outputs in order
+    
+    Args:
+        input_file: Input video file path
+        output_file: Output MJPEG file path (chunks go in a temporary directory beside it)
+        frame_count: Number of source frames
+        plans: (rendition, path, size, step) per rendition
+        writers: MjpegWriter per rendition
+        workers: Number of worker processes
+    """
+    # Several chunks per worker so a slow chunk does not hold up the rest
+    chunk_frames = max(MIN_CHUNK_FRAMES, -(-frame_count // (workers * 4)))
+    ranges = [(first, min(first + chunk_frames, frame_count))
+              for first in range(0, frame_count, chunk_frames)]
+    print(f"Encoding {len(ranges)} chunks of up to {chunk_frames} frames on {workers} processes")
+    
+    temp_dir = tempfile.mkdtemp(prefix='.chunks-', dir=os.path.dirname(output_file) or '.')
+    start = time.perf_counter()
+    decoded = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {}
+            for n, (first, last) in enumerate(ranges):
+                chunk_paths = [os.path.join(temp_dir, f"{n}.{i}") for i in range(len(plans))]
+                future = pool.submit(encode_chunk, input_file, first, last, plans, chunk_paths)
+                futures[future] = (n, chunk_paths)
+            
+            # Stitch each chunk as soon as every chunk before it is done
+            done = {}
+            next_chunk = 0
+            for future in as_completed(futures):
+                n, chunk_paths = futures[future]
+                count, sizes = future.result()
+                decoded += count
+                done[n] = (chunk_paths, sizes)
+                
+                while next_chunk in done:
+                    chunk_paths, sizes = done.pop(next_chunk)
+                    for chunk_path, frame_sizes, writer in zip(chunk_paths, sizes, writers):
+                        with open(chunk_path, 'rb') as f:
+                            data = memoryview(f.read())
+                        pos = 0
+                        for frame_size in frame_sizes:
+                            writer.write(data[pos:pos + frame_size])
+                            pos += frame_size
+                        os.remove(chunk_path)
+                    next_chunk += 1
+                
+                elapsed = time.perf_counter() - start
+                print(f"Processed {decoded}/{frame_count} frames "
+                      f"({decoded / elapsed if elapsed > 0 else 0:.1f} frames/s)...", end='\r')
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    
+    return decoded
+
+
+def video_to_mjpeg(input_file, output_file, fps=20, renditions=None, workers=1, threads=None,
+                   version=CONTAINER_VERSION):
     """
     Convert a video file to MJPEG format
     
+    With renditions, every rendition is encoded from a single decode pass:
+    the first (largest) is written to output_file, the others next to it,
+    and a manifest describing them to output_file.json.
+    
+    Frames are decoded, encoded and written in a pipeline (see
+    convert_pipelined). With more than one worker the source is split into frame ranges that
+    are decoded and encoded in parallel, each worker seeking to its range.
+    
     Args:
         input_file: Input video file path
         output_file: Output MJPEG file path
         fps: Target frames per second (default: 20)
+        renditions: Optional list of RenditionSpec (see parse_renditions)
+        workers: Number of encoding processes (default: 1, no pool)
+        threads: Number of encoding threads without a process pool (default: one per CPU)
+        version: Output format (CONTAINER_VERSION, or LEGACY_VERSION for 5-digit prefixes)
     """
     try:
         # Open video file
@@ -35,48 +322,67 @@ def video_to_mjpeg(input_file, output_file, fps=20):
         print(f"Resolution: {width}x{height}")
         print(f"FPS: {original_fps}")
         print(f"Total frames: {frame_count}")
-        print(f"Target FPS: {fps}")
+        print(f"Target FPS: {fps:g}")
         
-        # Calculate frame skip for target FPS
-        frame_skip = max(1, int(original_fps / fps))
+        manifest = renditions is not None
+        if not manifest:
+            # A single output at the exact source resolution (not rounded to
+            # 8-pixel blocks, so the aspect ratio is kept)
+            renditions = [RenditionSpec('source', None, DEFAULT_QUALITY, fps)]
         
-        # Open output file
-        with open(output_file, 'wb') as outfile:
-            frame_num = 0
-            written_frames = 0
-            
-            while True:
-                ret, frame = cap.read()
-                
-                if not ret:
-                    break
-                
-                # Skip frames to achieve target FPS
-                if frame_num % frame_skip == 0:
-                    # Encode frame as JPEG
-                    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 80]
-                    result, encoded_frame = cv2.imencode('.jpg', frame, encode_param)
-                    
-                    if result:
-                        # Get frame data
-                        frame_data = encoded_frame.tobytes()
-                        frame_length = len(frame_data)
-                        
-                        # Write frame length (5 bytes) followed by frame data
-                        outfile.write(str(frame_length).zfill(5).encode())
-                        outfile.write(frame_data)
-                        
-                        written_frames += 1
-                        
-                        if written_frames % 10 == 0:
-                            print(f"Processed {written_frames} frames...", end='\r')
-                
-                frame_num += 1
-            
-            print(f"\nConversion complete!")
-            print(f"Written {written_frames} frames to {output_file}")
+        # What each rendition takes from the source: (rendition, path, size, step)
+        plans = []
+        for i, rendition in enumerate(renditions):
+            path = output_file if i == 0 else rendition_path(output_file, rendition.name)
+            # Only generated renditions are scaled and rounded to 8-pixel blocks
+            size = rendition_size(width, height, rendition.height) if manifest else (width, height)
+            # Resample by presentation time; frames are never repeated, so
+            # the output rate is capped at the source rate
+            if original_fps > 0 and rendition.fps > original_fps:
+                print(f"Note: source has only {original_fps:g} fps, "
+                      f"writing {rendition.name} at that rate")
+                rendition = rendition._replace(fps=original_fps)
+            step = rendition.fps / original_fps if original_fps > 0 else 1.0
+            plans.append((rendition, path, size, step))
+            if manifest:
+                print(f"Rendition {rendition.name}: {size[0]}x{size[1]}, "
+                      f"quality {rendition.quality}, {rendition.fps:g} fps -> {path}")
+        
+        writers = [MjpegWriter(path, rendition.fps, width=size[0], height=size[1], version=version)
+                   for rendition, path, size, step in plans]
+        start = time.perf_counter()
+        try:
+            if workers > 1 and frame_count > 0:
+                # Workers open the file themselves
+                cap.release()
+                decoded = convert_parallel(input_file, output_file, frame_count, plans,
+                                           writers, workers)
+            else:
+                decoded = convert_pipelined(cap, plans, writers, threads or os.cpu_count() or 1)
+        finally:
+            cap.release()
+            for writer in writers:
+                writer.close()
+        elapsed = time.perf_counter() - start
+        
+        print(f"\nConversion complete!")
+        print(f"Decoded {decoded} frames in {elapsed:.2f} s "
+              f"({decoded / elapsed if elapsed > 0 else 0:.1f} frames/s)")
+        for (rendition, path, size, step), writer in zip(plans, writers):
+            print(f"Written {writer.frameCount()} frames at {rendition.fps:g} fps to {path}")
+            print(f"Frame index: {writer.indexLocation()}")
+        
+        if manifest:
+            entries = []
+            for (rendition, path, size, step), writer in zip(plans, writers):
+                frames = writer.frameCount()
+                duration = frames / rendition.fps
+                bitrate = round(writer.index.totalSize() * 8 / duration) if duration else 0
+                entries.append(Rendition(rendition.name, path, size[0], size[1],
+                                         rendition.quality, rendition.fps, frames, bitrate))
+            saveManifest(manifestPath(output_file), entries, os.path.basename(input_file))
+            print(f"Manifest: {manifestPath(output_file)}")
         
-        cap.release()
         return True
         
     except Exception as e:
@@ -84,7 +390,8 @@ def video_to_mjpeg(input_file, output_file, fps=20):
         return False
 
 
-def create_test_video(output_file, duration=10, fps=20, width=640, height=480):
+def create_test_video(output_file, duration=10, fps=20, width=640, height=480,
+                      version=CONTAINER_VERSION):
     """
     Create a test video with colored frames
     
@@ -94,16 +401,16 @@ def create_test_video(output_file, duration=10, fps=20, width=640, height=480):
         fps: Frames per second
         width: Frame width
         height: Frame height
+        version: Output format (CONTAINER_VERSION or LEGACY_VERSION)
     """
     try:
-        import numpy as np
         
         print(f"Creating test video: {output_file}")
         print(f"Duration: {duration}s, FPS: {fps}, Resolution: {width}x{height}")
         
         total_frames = duration * fps
         
-        with open(output_file, 'wb') as outfile:
+        with MjpegWriter(output_file, fps, width=width, height=height, version=version) as outfile:
             for i in range(total_frames):
                 # Create colored frame (cycling through colors)
                 hue = int((i / total_frames) * 180)
@@ -123,17 +430,14 @@ def create_test_video(output_file, duration=10, fps=20, width=640, height=480):
                 result, encoded_frame = cv2.imencode('.jpg', frame, encode_param)
                 
                 if result:
-                    frame_data = encoded_frame.tobytes()
-                    frame_length = len(frame_data)
-                    
                     # Write frame
-                    outfile.write(str(frame_length).zfill(5).encode())
-                    outfile.write(frame_data)
+                    outfile.write(encoded_frame.tobytes())
                     
                     if (i + 1) % 10 == 0:
                         print(f"Created {i+1}/{total_frames} frames...", end='\r')
             
             print(f"\nTest video created successfully!")
+            print(f"Frame index: {outfile.indexLocation()}")
         
         return True
         
@@ -142,6 +446,182 @@ def create_test_video(output_file, duration=10, fps=20, width=640, height=480):
         return False
 
 
+class SyntheticSource:
+    """
+    Deterministic generated video with the read() interface of
+    cv2.VideoCapture, so it feeds the same encode pipeline as a real file.
+    
+    Every frame is built with whole-array NumPy operations on precomputed
+    coordinate grids (no per-pixel Python work and no per-frame text
+    rendering) and depends only on the pattern, frame number and seed.
+    The frame number is stamped in the top-left corner as a row of black
+    and white blocks, one per bit, so receivers can check which frame
+    they got.
+    """
+    
+    def __init__(self, width, height, frames, pattern='bars', motion=4, seed=0):
+        if pattern not in SYNTH_PATTERNS:
+            raise ValueError(f"Unknown pattern '{pattern}' (choose from {', '.join(SYNTH_PATTERNS)})")
+        self.width = width
+        self.height = height
+        self.frames = frames
+        self.pattern = pattern
+        self.motion = motion
+        self.seed = seed
+        self.frame_num = 0
+        
+        # Coordinate grids, wrapping at 256 like the uint8 pixels they feed
+        self.xs = (np.arange(width) % 256).astype(np.uint8)
+        self.ys = (np.arange(height) % 256).astype(np.uint8)
+        
+        # One row of colour bars, scrolled sideways for the 'bars' pattern
+        bars = np.array([[255, 255, 255], [0, 255, 255], [255, 255, 0], [0, 255, 0],
+                         [255, 0, 255], [0, 0, 255], [255, 0, 0], [0, 0, 0]], dtype=np.uint8)
+        self.bar_row = bars[np.arange(width) * len(bars) // width]
+        
+        # Frame number stamp: FRAME_STAMP_BITS blocks of STAMP_BLOCK pixels
+        self.stamp_bits = 1 << np.arange(FRAME_STAMP_BITS - 1, -1, -1)
+    
+    def render(self, frame_num):
+        """Build one BGR frame"""
+        shift = frame_num * self.motion
+        if self.pattern == 'bars':
+            row = np.roll(self.bar_row, shift, axis=0)
+            frame = np.broadcast_to(row, (self.height, self.width, 3)).copy()
+        elif self.pattern == 'gradient':
+            # Diagonal ramps moving at different speeds per channel
+            base = self.ys[:, None] + self.xs[None, :]
+            frame = np.empty((self.height, self.width, 3), dtype=np.uint8)
+            for channel in range(3):
+                frame[:, :, channel] = base + np.uint8((shift * (channel + 1)) % 256)
+        elif self.pattern == 'checker':
+            cells_x = ((np.arange(self.width) + shift) // CHECKER_CELL) & 1
+            cells_y = ((np.arange(self.height) + shift // 2) // CHECKER_CELL) & 1
+            plane = ((cells_y[:, None] ^ cells_x[None, :]) * 255).astype(np.uint8)
+            frame = np.repeat(plane[:, :, None], 3, axis=2)
+        else:
+            # Seeded per frame, so any frame can be regenerated on its own
+            rng = np.random.default_rng((self.seed, frame_num))
+            frame = rng.integers(0, 256, (self.height, self.width, 3), dtype=np.uint8)
+        
+        # Stamp the frame number
+        bits = ((frame_num & self.stamp_bits) != 0).astype(np.uint8) * 255
+        stamp = np.repeat(bits, STAMP_BLOCK)[:self.width]
+        frame[:STAMP_BLOCK, :len(stamp)] = stamp[None, :, None]
+        return frame
+    
+    def read(self):
+        """Next frame as (ok, frame), like cv2.VideoCapture.read"""
+        if self.frame_num >= self.frames:
+            return False, None
+        frame = self.render(self.frame_num)
+        self.frame_num += 1
+        return True, frame
+    
+    def release(self):
+        """Nothing to close (cv2.VideoCapture compatibility)"""
+        pass
+
+
+def calibrate_quality(source, fps, bitrate):
+    """
+    Find the highest JPEG quality whose bitrate stays within a target, by
+    binary search over two runs of consecutive sample frames
+    
+    Args:
+        source: SyntheticSource to sample
+        fps: Frames per second
+        bitrate: Target bitrate in kbit/s
+    """
+    # Evenly spaced frames can all share one block alignment (a stride of
+    # 20 at 4 px/frame moves the pattern 80 px), so sample whole runs
+    runs = (source.frames // 4, source.frames * 3 // 4)
+    samples = []
+    for start in runs:
+        start = min(start, max(source.frames - CALIBRATION_FRAMES, 0))
+        samples.extend(source.render(n) for n in
+                       range(start, min(start + CALIBRATION_FRAMES, source.frames)))
+    if not samples:
+        return DEFAULT_QUALITY
+    size = (source.width, source.height)
+    
+    def achieved(quality):
+        """Bitrate in kbit/s of the samples at a quality"""
+        total = sum(len(encode_frame(frame, size, quality)) for frame in samples)
+        return total / len(samples) * fps * 8 / 1000
+    
+    low, high = 5, 95
+    best = low
+    while low <= high:
+        quality = (low + high) // 2
+        if achieved(quality) <= bitrate:
+            best = quality
+            low = quality + 1
+        else:
+            high = quality - 1
+    
+    estimate = achieved(best)
+    if estimate > bitrate:
+        print(f"Warning: even quality {best} needs about {estimate:.0f} kbit/s")
+    return best
+
+
+def create_synthetic_video(output_file, duration=60, fps=20, width=1280, height=720,
+                           pattern='bars', quality=DEFAULT_QUALITY, bitrate=None,
+                           motion=4, seed=0, threads=None, version=CONTAINER_VERSION):
+    """
+    Generate a long deterministic test video quickly for load testing
+    
+    Args:
+        output_file: Output MJPEG file path
+        duration: Video duration in seconds
+        fps: Frames per second
+        width: Frame width
+        height: Frame height
+        pattern: One of SYNTH_PATTERNS
+        quality: JPEG quality (ignored when bitrate is given)
+        bitrate: Optional target bitrate in kbit/s
+        motion: Pixels the pattern moves per frame
+        seed: Seed for the 'noise' pattern
+        threads: Number of encoding threads (default: one per CPU)
+        version: Output format (CONTAINER_VERSION or LEGACY_VERSION)
+    """
+    try:
+        frames = int(round(duration * fps))
+        source = SyntheticSource(width, height, frames, pattern, motion, seed)
+        
+        print(f"Creating synthetic video: {output_file}")
+        print(f"Duration: {duration:g}s, FPS: {fps:g}, Resolution: {width}x{height}, "
+              f"Pattern: {pattern}")
+        
+        if bitrate:
+            quality = calibrate_quality(source, fps, bitrate)
+            print(f"Quality {quality} for a target of {bitrate:g} kbit/s")
+        
+        rendition = RenditionSpec('synth', height, quality, fps)
+        start = time.perf_counter()
+        with MjpegWriter(output_file, fps, width=width, height=height, version=version) as writer:
+            convert_pipelined(source, [(rendition, output_file, (width, height), 1.0)],
+                              [writer], threads or os.cpu_count() or 1)
+        elapsed = time.perf_counter() - start
+        
+        size = writer.index.totalSize()
+        print(f"\nSynthetic video created successfully!")
+        print(f"Encoded {frames} frames in {elapsed:.2f} s "
+              f"({frames / elapsed if elapsed > 0 else 0:.1f} frames/s)")
+        achieved = size * 8 / 1000 / duration if duration else 0
+        print(f"Bitrate: {achieved:.0f} kbit/s")
+        if bitrate and achieved > bitrate * 1.05:
+            print(f"Warning: {achieved / bitrate * 100 - 100:.0f}% above the "
+                  f"{bitrate:g} kbit/s target")
+        print(f"Frame index: {writer.indexLocation()}")
+        return True
+        
+    except Exception as e:
+        print(f"Error creating synthetic video: {e}")
+        return False
+
+
 def get_video_info(mjpeg_file):
     """
     Display information about an MJPEG file
@@ -150,60 +630,151 @@ def get_video_info(mjpeg_file):
         mjpeg_file: MJPEG file path
     """
     try:
-        with open(mjpeg_file, 'rb') as infile:
-            frame_count = 0
-            total_size = 0
-            
-            while True:
-                # Read frame length
-                length_data = infile.read(5)
-                if not length_data or len(length_data) < 5:
-                    break
-                
-                frame_length = int(length_data)
-                
-                # Skip frame data
-                infile.seek(frame_length, 1)
-                
-                frame_count += 1
-                total_size += frame_length
-            
-            print(f"\nMJPEG File Info: {mjpeg_file}")
-            print(f"Total frames: {frame_count}")
-            print(f"Total size: {total_size / 1024:.2f} KB")
-            print(f"Average frame size: {total_size / frame_count if frame_count > 0 else 0:.2f} bytes")
+        # Use the sidecar index when it is current, otherwise scan the file
+        # (which reads a v2 container's trailing index)
+        start = time.perf_counter()
+        stat = os.stat(mjpeg_file)
+        index = FrameIndex.load(indexPath(mjpeg_file), stat.st_size, stat.st_mtime_ns)
+        source = 'index'
+        if index is None:
+            index = FrameIndex.build(mjpeg_file)
+            source = 'container' if index.version == CONTAINER_VERSION else 'scan'
+        elapsed = (time.perf_counter() - start) * 1000
+        
+        frame_count = index.frameCount()
+        total_size = index.totalSize()
+        
+        print(f"\nMJPEG File Info: {mjpeg_file}")
+        if index.version == CONTAINER_VERSION:
+            print(f"Format: container v{index.version}")
+        else:
+            print("Format: legacy (5-digit length prefix)")
+        if index.width and index.height:
+            print(f"Resolution: {index.width}x{index.height}")
+        print(f"Total frames: {frame_count}")
+        print(f"Total size: {total_size / 1024:.2f} KB")
+        print(f"Average frame size: {total_size / frame_count if frame_count > 0 else 0:.2f} bytes")
+        print(f"FPS: {index.fps:g}")
+        print(f"Duration: {index.duration():.2f} s")
+        print(f"Metadata from {source} in {elapsed:.2f} ms")
         
     except Exception as e:
         print(f"Error reading MJPEG file: {e}")
 
 
+def build_index(mjpeg_file, fps=None):
+    """
+    Build the sidecar frame index for an existing MJPEG file
+    
+    Args:
+        mjpeg_file: MJPEG file path
+        fps: Nominal frames per second of the file (default: the fps of the
+             existing index, even a stale one, otherwise DEFAULT_FPS)
+    """
+    try:
+        start = time.perf_counter()
+        if fps is None:
+            # Keep the rate the file was converted at
+            previous = FrameIndex.load(indexPath(mjpeg_file))
+            fps = previous.fps if previous else DEFAULT_FPS
+        index = FrameIndex.build(mjpeg_file, fps)
+        if index.version == CONTAINER_VERSION:
+            print(f"{mjpeg_file} is a v2 container; its frame index is stored in the file")
+            return True
+        index.save(indexPath(mjpeg_file))
+        elapsed = time.perf_counter() - start
+        
+        print(f"Indexed {index.frameCount()} frames at {index.fps:g} fps in {elapsed:.2f} s")
+        print(f"Frame index: {indexPath(mjpeg_file)}")
+        return True
+        
+    except Exception as e:
+        print(f"Error indexing MJPEG file: {e}")
+        return False
+
+
 def main():
     """Main function"""
     if len(sys.argv) < 2:
         print("Video Preparation Utility for RTSP/RTP Streaming")
         print("\nUsage:")
         print("  Convert video:")
-        print("    python VideoPrep.py convert <input_video> <output_mjpeg> [fps]")
+        print("    python VideoPrep.py convert <input_video> <output_mjpeg> [fps] [--renditions <list>] [--workers <n>] [--threads <n>]")
         print("    Example: python VideoPrep.py convert sample.mp4 video/movie.Mjpeg 20")
+        print("    Example: python VideoPrep.py convert sample.mp4 video/movie.Mjpeg 20 "
+              "--renditions 1080p:85,720p:80,360p:60:10")
+        print("    Example: python VideoPrep.py convert sample.mp4 video/movie.Mjpeg 20 --workers 8")
+        print("\n  Files are written as binary container v2; add --legacy to convert, test or synth")
+        print("  for the old 5-digit length-prefixed format (frames up to 99999 bytes).")
         print("\n  Create test video:")
         print("    python VideoPrep.py test <output_mjpeg> [duration] [fps]")
         print("    Example: python VideoPrep.py test video/test.Mjpeg 10 20")
+        print("\n  Generate a synthetic load-test video:")
+        print("    python VideoPrep.py synth <output_mjpeg> [duration] [fps] [--size WxH] "
+              "[--pattern bars|gradient|checker|noise] [--quality q | --bitrate kbps] "
+              "[--motion px] [--seed n] [--threads n]")
+        print("    Example: python VideoPrep.py synth video/soak.Mjpeg 3600 30 --size 1920x1080 --bitrate 8000")
         print("\n  Get video info:")
         print("    python VideoPrep.py info <mjpeg_file>")
         print("    Example: python VideoPrep.py info video/movie.Mjpeg")
+        print("\n  Build frame index for an existing file:")
+        print("    python VideoPrep.py index <mjpeg_file> [fps]")
+        print("    Example: python VideoPrep.py index video/movie.Mjpeg 20")
         sys.exit(1)
     
     command = sys.argv[1].lower()
     
+    # --legacy writes the old 5-digit length-prefixed format
+    version = CONTAINER_VERSION
+    if '--legacy' in sys.argv:
+        sys.argv.remove('--legacy')
+        version = LEGACY_VERSION
+    
     if command == 'convert':
-        if len(sys.argv) < 4:
+        args = sys.argv[2:]
+        renditions = None
+        if '--renditions' in args:
+            i = args.index('--renditions')
+            if i + 1 >= len(args):
+                print("Error: --renditions needs a list such as 720p:80:20,360p:60:10")
+                sys.exit(1)
+            renditions = args[i + 1]
+            del args[i:i + 2]
+        workers = 1
+        if '--workers' in args:
+            i = args.index('--workers')
+            try:
+                # 0 means one per CPU
+                workers = int(args[i + 1]) or os.cpu_count() or 1
+            except (IndexError, ValueError):
+                print("Error: --workers needs a number of processes (0 for one per CPU)")
+                sys.exit(1)
+            del args[i:i + 2]
+        threads = None
+        if '--threads' in args:
+            i = args.index('--threads')
+            try:
+                threads = int(args[i + 1]) or None
+            except (IndexError, ValueError):
+                print("Error: --threads needs a number of encoding threads (0 for one per CPU)")
+                sys.exit(1)
+            del args[i:i + 2]
+        
+        if len(args) < 2:
             print("Error: Missing arguments for convert command")
-            print("Usage: python VideoPrep.py convert <input_video> <output_mjpeg> [fps]")
+            print("Usage: python VideoPrep.py convert <input_video> <output_mjpeg> [fps] [--renditions <list>] [--workers <n>] [--threads <n>]")
             sys.exit(1)
         
-        input_file = sys.argv[2]
-        output_file = sys.argv[3]
-        fps = int(sys.argv[4]) if len(sys.argv) > 4 else 20
+        input_file = args[0]
+        output_file = args[1]
+        fps = float(args[2]) if len(args) > 2 else 20
+        
+        if renditions is not None:
+            try:
+                renditions = parse_renditions(renditions, fps)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
         
         if not os.path.exists(input_file):
             print(f"Error: Input file {input_file} not found")
@@ -214,7 +785,7 @@ def main():
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        video_to_mjpeg(input_file, output_file, fps)
+        video_to_mjpeg(input_file, output_file, fps, renditions, workers, threads, version)
     
     elif command == 'test':
         if len(sys.argv) < 3:
@@ -231,7 +802,47 @@ def main():
         if output_dir and not os.path.exists(output_dir):
             os.makedirs(output_dir)
         
-        create_test_video(output_file, duration, fps)
+        create_test_video(output_file, duration, fps, version=version)
+    
+    elif command == 'synth':
+        args = sys.argv[2:]
+        options = {}
+        for name in ('--size', '--pattern', '--quality', '--bitrate', '--motion', '--seed', '--threads'):
+            if name in args:
+                i = args.index(name)
+                if i + 1 >= len(args):
+                    print(f"Error: {name} needs a value")
+                    sys.exit(1)
+                options[name] = args[i + 1]
+                del args[i:i + 2]
+        
+        if len(args) < 1:
+            print("Error: Missing arguments for synth command")
+            print("Usage: python VideoPrep.py synth <output_mjpeg> [duration] [fps] [options]")
+            sys.exit(1)
+        
+        output_file = args[0]
+        try:
+            duration = float(args[1]) if len(args) > 1 else 60
+            fps = float(args[2]) if len(args) > 2 else 20
+            width, height = (int(v) for v in options.get('--size', '1280x720').lower().split('x'))
+            quality = int(options.get('--quality', DEFAULT_QUALITY))
+            bitrate = float(options['--bitrate']) if '--bitrate' in options else None
+            motion = int(options.get('--motion', 4))
+            seed = int(options.get('--seed', 0))
+            threads = int(options.get('--threads', 0)) or None
+        except ValueError as e:
+            print(f"Error: Bad synth option ({e})")
+            sys.exit(1)
+        
+        # Create output directory if needed
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        
+        create_synthetic_video(output_file, duration, fps, width, height,
+                               options.get('--pattern', 'bars'), quality, bitrate,
+                               motion, seed, threads, version)
     
     elif command == 'info':
         if len(sys.argv) < 3:
@@ -247,9 +858,24 @@ def main():
         
         get_video_info(mjpeg_file)
     
+    elif command == 'index':
+        if len(sys.argv) < 3:
+            print("Error: Missing arguments for index command")
+            print("Usage: python VideoPrep.py index <mjpeg_file> [fps]")
+            sys.exit(1)
+        
+        mjpeg_file = sys.argv[2]
+        fps = float(sys.argv[3]) if len(sys.argv) > 3 else None
+        
+        if not os.path.exists(mjpeg_file):
+            print(f"Error: File {mjpeg_file} not found")
+            sys.exit(1)
+        
+        build_index(mjpeg_file, fps)
+    
     else:
         print(f"Error: Unknown command '{command}'")
-        print("Valid commands: convert, test, info")
+        print("Valid commands: convert, test, synth, info, index")
         sys.exit(1)
 
 
@@ -0,0 +1,145 @@
+"""
+MJPEG Video Stream
+Memory-mapped, indexed reader for MJPEG files
+"""
+
+import mmap
+import os
+import threading
+from MjpegFile import FrameIndex, indexPath
+
+# Frame indexes already loaded in this process: path -> (size, mtime, index)
+_indexCache = {}
+_indexLock = threading.Lock()
+
+# Server-wide FrameCache consulted before the file (None: read the mapping directly)
+_frameCache = None
+
+
+def setFrameCache(cache):
+    """Share a FrameCache between every VideoStream opened from now on"""
+    global _frameCache
+    _frameCache = cache
+
+
+class VideoStream:
+    """
+    Video stream class to read MJPEG frames.
+
+    The file is memory-mapped and indexed once (from the trailing index of
+    a v2 container, or the sidecar .idx file of a legacy file when it is
+    current), so frames are handed out as zero-copy memoryview slices and
+    any frame can be reached in O(1).
+
+    With a frame cache set (setFrameCache), frames are looked up there
+    first and copied into it from the file on a miss.
+    """
+
+    def __init__(self, filename):
+        try:
+            self.filename = filename
+            self.file = open(filename, 'rb')
+            self.currentFrame = 0
+
+            stat = os.fstat(self.file.fileno())
+            # Cache keys change when the file does
+            self.cache = _frameCache
+            self.cacheKey = (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+            if stat.st_size > 0:
+                self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = b''
+            self.view = memoryview(self.data)
+
+            self.index = self.loadIndex(stat)
+            self.offsets = self.index.offsets
+            self.sizes = self.index.sizes
+            # Nominal playback rate of the file
+            self.fps = self.index.fps
+        except Exception as e:
+            print(f"[VideoStream] Error opening file {filename}: {e}")
+            raise
+
+    def loadIndex(self, stat):
+        """Return the frame index, reusing one built earlier for the same file"""
+        key = os.path.abspath(self.filename)
+        with _indexLock:
+            cached = _indexCache.get(key)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+
+        index = FrameIndex.load(indexPath(self.filename), stat.st_size, stat.st_mtime_ns)
+        if index is None:
+            # No current sidecar: read the container's index or walk the frames once
+            index = FrameIndex.scan(self.data)
+        with _indexLock:
+            _indexCache[key] = (stat.st_size, stat.st_mtime_ns, index)
+        return index
+
+    def nextFrame(self):
+        """Get the next frame as a memoryview, or None at end of file"""
+        frame = self.getFrame(self.currentFrame)
+        if frame is not None:
+            self.currentFrame += 1
+        return frame
+
+    def getFrame(self, frameNumber):
+        """Get frame data by index without moving the read position"""
+        if frameNumber < 0 or frameNumber >= len(self.offsets):
+            return None
+        start = self.offsets[frameNumber]
+        if self.cache is None:
+            return self.view[start:start + self.sizes[frameNumber]]
+
+        key = self.cacheKey + (frameNumber,)
+        data = self.cache.get(key)
+        if data is None:
+            data = bytes(self.view[start:start + self.sizes[frameNumber]])
+            self.cache.put(key, data)
+        return memoryview(data)
+
+    def preload(self):
+        """Read every frame into the frame cache (for pinned files)"""
+        if self.cache is not None:
+            for frameNumber in range(len(self.offsets)):
+                self.getFrame(frameNumber)
+
+    def frameNum(self):
+        """Get current frame number"""
+        return self.currentFrame
+
+    def frameCount(self):
+        """Get the number of frames in the file"""
+        return len(self.offsets)
+
+    def seek(self, frameNumber):
+        """Move the read position to a frame (clamped to the file)"""
+        self.currentFrame = min(max(frameNumber, 0), len(self.offsets))
+
+    def seekTime(self, seconds):
+        """Move the read position to the frame shown at a time in seconds"""
+        self.seek(self.index.frameAt(seconds))
+
+    def position(self):
+        """Current read position in seconds"""
+        return self.currentFrame / self.fps
+
+    def duration(self):
+        """Playback duration in seconds"""
+        return self.index.duration()
+
+    def reset(self):
+        """Reset to beginning of file"""
+        self.seek(0)
+
+    def close(self):
+        """Close the video file"""
+        self.view.release()
+        if isinstance(self.data, mmap.mmap):
+            try:
+                self.data.close()
+            except BufferError:
+                # Frames are still referenced; the mapping goes away with them
+                pass
+        if self.file:
+            self.file.close()
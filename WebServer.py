@@ -7,13 +7,19 @@ from flask import Flask, render_template, jsonify, request
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 import socket
+import selectors
 import threading
 import time
 import base64
 import subprocess
 import sys
 import os
-from RtpPacket import RtpPacket
+from collections import deque
+from RtpPacket import RtpRing
+from RtpJpeg import JpegReassembler
+from JitterBuffer import JitterBuffer
+from RtcpPacket import ReceiverReporter
+from PortAllocator import PortAllocator
 import io
 
 app = Flask(__name__)
@@ -26,40 +32,89 @@ INIT = 0
 READY = 1
 PLAYING = 2
 
-# Active sessions storage
+# RTP receive ring: datagrams taken per burst, and slot size (above the server MTU)
+RTP_RING_SLOTS = 64
+RTP_SLOT_SIZE = 2048
+
+# Local UDP ports for upstream sessions (one even/odd RTP/RTCP pair each)
+RTP_PORT_MIN = 25000
+RTP_PORT_MAX = 35000
+
+# Longest the ingest loop sleeps while sessions are playing
+RTP_TIMEOUT = 0.5
+
+# How frames reach the browser: raw JPEG bytes as a binary Socket.IO
+# attachment, or base64 text inside the JSON event (older pages)
+FRAME_TRANSPORTS = ('binary', 'base64')
+DEFAULT_FRAME_TRANSPORT = 'base64'
+
+# Frames sent to a browser and not yet acknowledged; newer frames wait in a
+# single slot (the latest replaces it) until an ack frees room
+MAX_FRAMES_IN_FLIGHT = 2
+
+# An ack not seen within this time is taken as lost and frees its slot
+ACK_TIMEOUT = 1.0
+
+# Browser viewers by Socket.IO session id
 sessions = {}
 
+# Upstream RTSP sessions by (server, port, file), shared by their viewers
+upstreams = {}
+upstreams_lock = threading.Lock()
+
+# RTP/RTCP port pairs for upstream sessions
+port_allocator = PortAllocator(RTP_PORT_MIN, RTP_PORT_MAX)
+
 # RTSP Server process
 rtsp_server_process = None
 server_running = False
 
 
 class WebStreamingClient:
-    """Web-based streaming client handler"""
+    """
+    RTSP/RTP session with the streaming server, shared by every browser
+    watching the same file on the same server. Frames are reassembled and
+    serialized once and fanned out to the viewers.
+    """
     
-    def __init__(self, client_id, server_addr, server_port, video_file):
-        self.client_id = client_id
+    def __init__(self, key, server_addr, server_port, video_file):
+        self.key = key
         self.server_addr = server_addr
         self.server_port = int(server_port)
         self.video_file = video_file
+        self.room = f"stream-{id(self):x}"
+        
+        # Viewers (sid -> Viewer); replaced rather than mutated so the RTP
+        # thread can iterate a snapshot
+        self.viewers = {}
+        
+        # Serializes RTSP requests from different viewers' handlers
+        self.lock = threading.Lock()
         
         # RTSP/RTP parameters
         self.rtsp_socket = None
         self.rtp_socket = None
-        self.rtp_port = 25000 + (hash(client_id) % 1000)
+        self.rtcp_socket = None
+        self.rtcp = None
+        self.rtp_port = None
         self.rtsp_seq = 0
         self.session_id = 0
         self.state = INIT
+        self.range = None
         
         # Statistics
         self.frame_num = 0
+        self.frames_received = 0
         self.packets_received = 0
         self.bytes_received = 0
+        self.bytes_sent = 0
+        self.fanout = 0
         self.start_time = 0
         
-        # Threading
-        self.rtp_thread = None
-        self.stop_event = threading.Event()
+        # RTP/JPEG frame reassembly
+        self.rtp_ring = RtpRing(RTP_RING_SLOTS, RTP_SLOT_SIZE)
+        self.jitter_buffer = JitterBuffer()
+        self.reassembler = JpegReassembler()
     
     def setup(self):
         """Send SETUP request"""
@@ -68,16 +123,17 @@ class WebStreamingClient:
             self.rtsp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.rtsp_socket.connect((self.server_addr, self.server_port))
             
-            # Create RTP socket
-            self.rtp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.rtp_socket.settimeout(0.5)
-            self.rtp_socket.bind(('', self.rtp_port))
+            # Take an RTP port and the RTCP port above it, both read by the ingest loop
+            self.rtp_port, self.rtp_socket, self.rtcp_socket = port_allocator.allocate()
+            self.rtp_socket.setblocking(False)
+            self.rtcp_socket.setblocking(False)
+            self.rtcp = ReceiverReporter(self.rtcp_socket, playback=self.reassembler)
             
             # Send SETUP request
             self.rtsp_seq += 1
             request = f"SETUP {self.video_file} RTSP/1.0\n"
             request += f"CSeq: {self.rtsp_seq}\n"
-            request += f"Transport: RTP/AVP;unicast;client_port={self.rtp_port}\n"
+            request += f"Transport: RTP/AVP;unicast;client_port={self.rtp_port}-{self.rtp_port + 1}\n"
             
             self.rtsp_socket.send(request.encode('utf-8'))
             
@@ -91,6 +147,11 @@ class WebStreamingClient:
                     self.session_id = int(line.split(' ')[1])
                     break
             
+            # Receiver reports go to the server's RTCP port
+            server_rtcp_port = self.parse_server_rtcp_port(lines)
+            if server_rtcp_port:
+                self.rtcp.serverAddr = (self.server_addr, server_rtcp_port)
+            
             self.state = READY
             
             return {
@@ -105,36 +166,75 @@ class WebStreamingClient:
                 'message': f'Setup failed: {str(e)}'
             }
     
-    def play(self):
-        """Send PLAY request"""
+    def play(self, position=None):
+        """Send PLAY request, optionally starting at a position in seconds"""
         if self.state != READY:
             return {'success': False, 'message': 'Not in READY state'}
         
         try:
-            # Send PLAY request
-            self.rtsp_seq += 1
-            request = f"PLAY {self.video_file} RTSP/1.0\n"
-            request += f"CSeq: {self.rtsp_seq}\n"
-            request += f"Session: {self.session_id}\n"
-            
-            self.rtsp_socket.send(request.encode('utf-8'))
-            
-            # Receive reply
-            reply = self.rtsp_socket.recv(1024).decode('utf-8')
+            reply = self.send_play(position)
             
             self.state = PLAYING
             self.start_time = time.time()
             
-            # Start RTP receiving thread
-            self.stop_event.clear()
-            self.rtp_thread = threading.Thread(target=self.listen_rtp)
-            self.rtp_thread.start()
+            # Receive RTP on the shared ingest loop
+            rtp_ingest.add(self)
             
-            return {'success': True, 'message': 'Playing'}
+            self.range = self.parse_range(reply)
+            return {'success': True, 'message': 'Playing', 'range': self.range}
             
         except Exception as e:
             return {'success': False, 'message': f'Play failed: {str(e)}'}
     
+    def seek(self, position):
+        """Jump to a position in seconds (PLAY with a Range header)"""
+        if self.state == READY:
+            return self.play(position)
+        if self.state != PLAYING:
+            return {'success': False, 'message': 'No active session'}
+        
+        try:
+            # The server repositions the running stream; RTP keeps flowing
+            reply = self.send_play(position)
+            self.range = self.parse_range(reply)
+            return {'success': True, 'message': f'Seeked to {position:.1f}s',
+                    'range': self.range}
+            
+        except Exception as e:
+            return {'success': False, 'message': f'Seek failed: {str(e)}'}
+    
+    def send_play(self, position=None):
+        """Send a PLAY request and return the reply"""
+        self.rtsp_seq += 1
+        request = f"PLAY {self.video_file} RTSP/1.0\n"
+        request += f"CSeq: {self.rtsp_seq}\n"
+        request += f"Session: {self.session_id}\n"
+        if position is not None:
+            request += f"Range: npt={position:.3f}-\n"
+        
+        self.rtsp_socket.send(request.encode('utf-8'))
+        
+        # Receive reply
+        return self.rtsp_socket.recv(1024).decode('utf-8')
+    
+    @staticmethod
+    def parse_range(reply):
+        """Get the Range header value from an RTSP reply"""
+        for line in reply.split('\n'):
+            if line.startswith('Range:'):
+                return line.split(' ', 1)[1].strip()
+        return None
+    
+    @staticmethod
+    def parse_server_rtcp_port(lines):
+        """Get the server's RTCP port from the Transport header of a SETUP reply"""
+        for line in lines:
+            if line.startswith('Transport:') and 'server_port=' in line:
+                ports = line.split('server_port=')[1].split(';')[0].strip().split('-')
+                if len(ports) > 1:
+                    return int(ports[1])
+        return 0
+    
     def pause(self):
         """Send PAUSE request"""
         if self.state != PLAYING:
@@ -154,10 +254,8 @@ class WebStreamingClient:
             
             self.state = READY
             
-            # Stop RTP thread
-            self.stop_event.set()
-            if self.rtp_thread:
-                self.rtp_thread.join()
+            # Stop receiving (takes effect on the ingest loop's next wakeup)
+            rtp_ingest.remove(self)
             
             return {'success': True, 'message': 'Paused'}
             
@@ -182,67 +280,564 @@ class WebStreamingClient:
                 except:
                     pass
             
-            # Stop RTP thread
-            self.stop_event.set()
-            if self.rtp_thread:
-                self.rtp_thread.join()
-            
-            # Close sockets
-            if self.rtp_socket:
-                self.rtp_socket.close()
-            if self.rtsp_socket:
-                self.rtsp_socket.close()
-            
             self.state = INIT
             
             return {'success': True, 'message': 'Teardown complete'}
             
         except Exception as e:
             return {'success': False, 'message': f'Teardown failed: {str(e)}'}
+        
+        finally:
+            # The ingest loop lets go of the sockets, then closes them
+            rtp_ingest.remove(self, self.close)
     
-    def listen_rtp(self):
-        """Listen for RTP packets and send to browser via WebSocket"""
-        while not self.stop_event.is_set():
-            try:
-                # Receive RTP packet
-                data, addr = self.rtp_socket.recvfrom(20480)
-                
-                if data:
-                    # Decode RTP packet
-                    rtp_packet = RtpPacket()
-                    rtp_packet.decode(data)
-                    
-                    # Update statistics
-                    self.packets_received += 1
-                    self.bytes_received += len(data)
-                    self.frame_num = rtp_packet.getSeqNum()
-                    
-                    # Get frame data
-                    payload = rtp_packet.getPayload()
-                    
-                    # Convert to base64 for transmission to browser
-                    frame_b64 = base64.b64encode(payload).decode('utf-8')
-                    
-                    # Calculate statistics
-                    elapsed = time.time() - self.start_time if self.start_time > 0 else 1
-                    data_rate = (self.bytes_received * 8) / (elapsed * 1000)
-                    fps = self.packets_received / elapsed if elapsed > 0 else 0
-                    
-                    # Send frame to browser
-                    socketio.emit('video_frame', {
-                        'frame': frame_b64,
-                        'frame_num': self.frame_num,
-                        'packets': self.packets_received,
-                        'data_rate': round(data_rate, 2),
-                        'fps': round(fps, 2)
-                    }, room=self.client_id)
-                    
-            except socket.timeout:
+    def close(self):
+        """Close the sockets and give the RTP/RTCP ports back to the pool (on the ingest loop)"""
+        if self.frames_received:
+            print(f"[WebClient] {self.room} ({self.video_file}): received "
+                  f"{self.frames_received} frames, {self.bytes_sent / 1024:.0f} KB "
+                  f"sent to rooms, {self.fanout} viewer deliveries")
+        
+        if self.rtp_socket:
+            self.rtp_socket.close()
+            self.rtp_socket = None
+        if self.rtcp_socket:
+            if self.rtcp:
+                try:
+                    self.rtcp.bye()
+                except OSError:
+                    pass
+            self.rtcp_socket.close()
+            self.rtcp_socket = None
+        if self.rtsp_socket:
+            self.rtsp_socket.close()
+            self.rtsp_socket = None
+        if self.rtp_port is not None:
+            port_allocator.release(self.rtp_port)
+            self.rtp_port = None
+    
+    def receive_rtp(self):
+        """Take the queued RTP packets into the jitter buffer (socket is readable)"""
+        try:
+            # Receive a burst of RTP packets and parse their headers together
+            count = self.rtp_ring.receive(self.rtp_socket)
+        except (BlockingIOError, InterruptedError, socket.timeout):
+            return
+        batch = self.rtp_ring.decode(count)
+        
+        # Update statistics
+        self.packets_received += len(batch)
+        self.bytes_received += batch.bytes
+        
+        # Reorder in the jitter buffer
+        now = time.monotonic()
+        for packet in zip(batch.seqNums, batch.timestamps, batch.markers, batch.payloads):
+            self.jitter_buffer.push(*packet, now)
+        self.rtcp.update(batch, now)
+    
+    def time_until_due(self):
+        """Seconds until the next playout deadline or RTCP report, whichever comes first"""
+        wait = self.jitter_buffer.timeUntilNext()
+        report = self.rtcp.timeUntilReport()
+        return report if wait is None else min(wait, report)
+    
+    def play_out(self):
+        """Reassemble the packets that are due for playout and send frames to the browser"""
+        for timestamp, marker, payload in self.jitter_buffer.pop():
+            # Add the fragment; a frame is returned once it is complete
+            frame = self.reassembler.addPacket(timestamp, marker, payload)
+            if frame is None:
                 continue
-            except Exception as e:
-                if not self.stop_event.is_set():
-                    print(f"[WebClient] Error receiving RTP: {e}")
-                break
+            
+            self.frames_received += 1
+            self.frame_num = self.reassembler.framesCompleted
+            
+            # Calculate statistics
+            elapsed = time.time() - self.start_time if self.start_time > 0 else 1
+            data_rate = (self.bytes_received * 8) / (elapsed * 1000)
+            fps = self.frames_received / elapsed if elapsed > 0 else 0
+            
+            # Serialize once per transport and fan out to the viewers
+            stats = {
+                'frame_num': self.frame_num,
+                'packets': self.packets_received,
+                'data_rate': round(data_rate, 2),
+                'fps': round(fps, 2),
+                'buffer_ms': round(self.jitter_buffer.delay * 1000),
+                'buffer_depth': self.jitter_buffer.depth(),
+                'late': self.jitter_buffer.late,
+                'lost': self.jitter_buffer.lost,
+                'jitter_ms': round(self.rtcp.stats.jitterSeconds() * 1000, 1),
+                'loss': round(self.rtcp.stats.fractionLost / 256 * 100, 1),
+                'viewers': len(self.viewers)
+            }
+            messages = {}
+            rooms = set()
+            for viewer in list(self.viewers.values()):
+                if not viewer.playing:
+                    continue
+                message = messages.get(viewer.transport)
+                if message is None:
+                    message = frame_message(frame, stats, viewer.transport)
+                    messages[viewer.transport] = message
+                self.fanout += 1
+                if viewer.queue:
+                    # Own copy: the queue stamps its sequence number on it
+                    viewer.queue.offer(dict(message))
+                else:
+                    rooms.add(viewer.transport)
+            
+            # Viewers without a queue share one emit per transport
+            for transport in rooms:
+                self.bytes_sent += len(messages[transport]['frame'])
+                socketio.emit('video_frame', messages[transport], room=self.room_name(transport))
+    
+    def room_name(self, transport):
+        """Socket.IO room of this session's unqueued viewers on a transport"""
+        return f"{self.room}/{transport}"
+    
+    def add_viewer(self, viewer):
+        """Attach a viewer (call with upstreams_lock held)"""
+        viewer.upstream = self
+        self.viewers = {**self.viewers, viewer.sid: viewer}
+    
+    def remove_viewer(self, viewer):
+        """Detach a viewer (call with upstreams_lock held)"""
+        self.viewers = {sid: v for sid, v in self.viewers.items() if sid != viewer.sid}
+    
+    def playing_viewers(self):
+        """Number of attached viewers that are playing"""
+        return sum(1 for viewer in self.viewers.values() if viewer.playing)
+
+
+class RtpIngest:
+    """
+    One loop receiving RTP and RTCP for every playing upstream session.
+    
+    The sockets of all sessions are multiplexed with a selector instead of
+    a thread per session, and the loop sleeps until a socket is readable or
+    the earliest playout deadline or receiver report comes up. Handlers
+    never touch the selector: they queue the change and wake the loop with
+    a byte on a socket pair, so PLAY, PAUSE and TEARDOWN return at once
+    instead of waiting out a receive timeout and a thread join.
+    """
+    
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.sessions = set()
+        self.changes = deque()
+        self.stalled = set()
+        self.lock = threading.Lock()
+        self.started = False
+        
+        # Wakes the loop when a change is queued
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ, None)
+        
+        # Metrics
+        self.wakeups = 0
+        self.peak_sessions = 0
+    
+    def add(self, upstream):
+        """Start receiving for a session (PLAY)"""
+        self.change(upstream, True)
+    
+    def remove(self, upstream, on_removed=None):
+        """Stop receiving for a session; on_removed runs on the loop once it has let go"""
+        self.change(upstream, False, on_removed)
+    
+    def watch(self, queue):
+        """Expire a ViewerQueue's acks on time while it holds back a frame"""
+        with self.lock:
+            if queue in self.stalled:
+                return
+            self.stalled.add(queue)
+        self.wake()
+    
+    def unwatch(self, queue):
+        """Stop expiring a ViewerQueue's acks (called with the queue's lock held)"""
+        with self.lock:
+            self.stalled.discard(queue)
+    
+    def change(self, upstream, playing, on_removed=None):
+        """Queue a change for the loop and wake it up"""
+        self.changes.append((upstream, playing, on_removed))
+        self.wake()
+    
+    def wake(self):
+        """Start the loop if needed and interrupt its wait"""
+        with self.lock:
+            if not self.started:
+                self.started = True
+                socketio.start_background_task(self.run)
+        try:
+            self.wake_send.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            # Wakeups already pending
+            pass
+    
+    def apply_changes(self):
+        """Register and unregister session sockets as queued by the handlers"""
+        while self.changes:
+            upstream, playing, on_removed = self.changes.popleft()
+            if playing and upstream not in self.sessions:
+                # Resuming after a pause starts a new playout clock
+                upstream.jitter_buffer.reset()
+                upstream.reassembler.reset()
+                self.selector.register(upstream.rtp_socket, selectors.EVENT_READ,
+                                       (upstream, upstream.receive_rtp))
+                self.selector.register(upstream.rtcp_socket, selectors.EVENT_READ,
+                                       (upstream, upstream.rtcp.poll))
+                self.sessions.add(upstream)
+                self.peak_sessions = max(self.peak_sessions, len(self.sessions))
+            elif not playing:
+                self.drop(upstream)
+            if on_removed:
+                on_removed()
+    
+    def drop(self, upstream):
+        """Stop watching a session's sockets"""
+        if upstream in self.sessions:
+            self.sessions.discard(upstream)
+            self.selector.unregister(upstream.rtp_socket)
+            self.selector.unregister(upstream.rtcp_socket)
+    
+    def run(self):
+        """Receive, play out and report for every session until the process exits"""
+        print("[WebServer] RTP ingest loop started")
+        while True:
+            self.apply_changes()
+            
+            # Sleep until a socket is readable or the next deadline
+            timeout = None
+            if self.sessions:
+                timeout = min([RTP_TIMEOUT] + [upstream.time_until_due()
+                                               for upstream in self.sessions])
+            for queue in self.stalled_queues():
+                expiry = queue.time_until_expiry()
+                if expiry is not None:
+                    timeout = expiry if timeout is None else min(timeout, expiry)
+            events = self.selector.select(None if timeout is None else max(timeout, 0))
+            self.wakeups += 1
+            
+            for key, _ in events:
+                if key.data is None:
+                    try:
+                        while self.wake_recv.recv(256):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    continue
+                upstream, handler = key.data
+                try:
+                    handler()
+                except Exception as e:
+                    print(f"[WebClient] Error receiving RTP for {upstream.room}: {e}")
+                    self.drop(upstream)
+            
+            # Frames that are due go to the viewers; reports go out when due
+            for upstream in list(self.sessions):
+                try:
+                    upstream.play_out()
+                    upstream.rtcp.poll()
+                except Exception as e:
+                    print(f"[WebClient] Error playing out {upstream.room}: {e}")
+                    self.drop(upstream)
+            
+            # Viewers holding back a frame get it once their overdue acks expire
+            for queue in self.stalled_queues():
+                queue.poll()
+    
+    def stalled_queues(self):
+        """Snapshot of the viewer queues holding back a frame"""
+        with self.lock:
+            return list(self.stalled)
+    
+    def stats(self):
+        """Ingest loop metrics for logging"""
+        return {
+            'sessions': len(self.sessions),
+            'peak_sessions': self.peak_sessions,
+            'wakeups': self.wakeups,
+        }
+
+
+def frame_message(frame, stats, transport='binary'):
+    """
+    Build the video_frame event for one JPEG frame.
+    
+    With the binary transport the frame goes out as bytes, which Socket.IO
+    sends as a binary attachment next to the JSON stats: no base64 copy and
+    no 33% size overhead. The base64 transport embeds it as text.
+    """
+    message = dict(stats)
+    if transport == 'binary':
+        message['frame'] = bytes(frame)
+    else:
+        message['frame'] = base64.b64encode(frame).decode('utf-8')
+    message['transport'] = transport
+    return message
+
+
+class ViewerQueue:
+    """
+    Bounded frame queue for one browser.
+    
+    At most max_in_flight frames are outstanding: sent to the browser and
+    not yet acknowledged with frame_ack. A frame that arrives when the
+    browser is that far behind waits in a single pending slot, and a newer
+    frame replaces it (counted as dropped), so a slow tab gets fewer frames
+    instead of a growing backlog in the Socket.IO server, and what it does
+    get is current. Frames whose ack does not come within ack_timeout are
+    written off so a lost ack cannot stall the viewer.
+    """
+    
+    def __init__(self, sid, max_in_flight=MAX_FRAMES_IN_FLIGHT, ack_timeout=ACK_TIMEOUT,
+                 clock=time.monotonic):
+        self.sid = sid
+        self.max_in_flight = max_in_flight
+        self.ack_timeout = ack_timeout
+        self.clock = clock
+        self.in_flight = {}
+        self.pending = None
+        self.seq = 0
+        self.lock = threading.Lock()
+        
+        # Metrics
+        self.sent = 0
+        self.bytes_sent = 0
+        self.acked = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.max_depth = 0
+        self.ack_ms = 0.0
+    
+    def offer(self, message):
+        """Queue a video_frame message; sends it now if the browser has room"""
+        with self.lock:
+            self.expire()
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = message
+            self.flush()
+    
+    def ack(self, seq):
+        """Take the browser's acknowledgement of a frame and send the pending one"""
+        with self.lock:
+            sent_at = self.in_flight.pop(seq, None)
+            if sent_at is not None:
+                self.acked += 1
+                # Smoothed time from emit to the browser having drawn the frame
+                self.ack_ms += ((self.clock() - sent_at) * 1000 - self.ack_ms) / 16
+            self.expire()
+            self.flush()
+    
+    def expire(self):
+        """Write off frames whose ack is overdue, sending the pending frame into the room freed"""
+        deadline = self.clock() - self.ack_timeout
+        overdue = [seq for seq, sent_at in self.in_flight.items() if sent_at < deadline]
+        for seq in overdue:
+            del self.in_flight[seq]
+            self.timeouts += 1
+        if overdue:
+            self.flush()
+    
+    def flush(self):
+        """Send the pending frame if fewer than max_in_flight are outstanding"""
+        if self.pending is None:
+            return
+        if len(self.in_flight) >= self.max_in_flight:
+            # Nothing may arrive to retry this (end of stream, paused upstream),
+            # so the ingest loop expires the window when the acks are overdue
+            rtp_ingest.watch(self)
+            return
+        message = self.pending
+        self.pending = None
+        self.seq += 1
+        message['seq'] = self.seq
+        message['dropped'] = self.dropped
+        self.in_flight[self.seq] = self.clock()
+        self.sent += 1
+        self.bytes_sent += len(message['frame'])
+        self.max_depth = max(self.max_depth, self.depth())
+        # Emitting under the lock keeps frames in order on the socket
+        socketio.emit('video_frame', message, room=self.sid)
+    
+    def time_until_expiry(self):
+        """Seconds until the oldest outstanding frame's ack is overdue, or None"""
+        with self.lock:
+            if not self.in_flight:
+                return None
+            return min(self.in_flight.values()) + self.ack_timeout - self.clock()
+    
+    def poll(self):
+        """Expire overdue acks (from the ingest loop); stops being watched once nothing is held back"""
+        with self.lock:
+            self.expire()
+            if self.pending is None:
+                rtp_ingest.unwatch(self)
+    
+    def depth(self):
+        """Frames held for this viewer (outstanding plus pending)"""
+        return len(self.in_flight) + (self.pending is not None)
+    
+    def stats(self):
+        """Queue metrics for logging"""
+        with self.lock:
+            return {
+                'sent': self.sent,
+                'bytes_sent': self.bytes_sent,
+                'acked': self.acked,
+                'dropped': self.dropped,
+                'ack_timeouts': self.timeouts,
+                'depth': self.depth(),
+                'max_depth': self.max_depth,
+                'ack_ms': round(self.ack_ms, 1),
+            }
+    
+    def summary(self):
+        """One-line description of the queue metrics"""
+        s = self.stats()
+        return (f"sent {s['sent']} ({s['bytes_sent'] / 1024:.0f} KB), acked {s['acked']}, dropped {s['dropped']}, "
+                f"ack timeouts {s['ack_timeouts']}, max depth {s['max_depth']}, "
+                f"ack {s['ack_ms']:.1f} ms")
+
+
+class Viewer:
+    """One browser tab watching an upstream session"""
+    
+    def __init__(self, sid, transport=DEFAULT_FRAME_TRANSPORT, acks=False):
+        self.sid = sid
+        self.transport = transport if transport in FRAME_TRANSPORTS else DEFAULT_FRAME_TRANSPORT
+        
+        # Pages that acknowledge frames get a bounded queue; others get every
+        # frame through the session's Socket.IO room
+        self.queue = ViewerQueue(sid) if acks else None
+        self.upstream = None
+        self.playing = False
+    
+    def start(self):
+        """Begin delivering frames to this viewer"""
+        self.playing = True
+        if self.queue is None:
+            socketio.server.enter_room(self.sid, self.upstream.room_name(self.transport),
+                                       namespace='/')
+    
+    def stop(self):
+        """Stop delivering frames to this viewer"""
+        self.playing = False
+        if self.queue is None and self.upstream:
+            socketio.server.leave_room(self.sid, self.upstream.room_name(self.transport),
+                                       namespace='/')
+    
+    def play(self, position=None):
+        """Start watching, starting the upstream session if it is not running"""
+        upstream = self.upstream
+        with upstream.lock:
+            if upstream.state == READY:
+                result = upstream.play(position)
+            elif upstream.state == PLAYING:
+                result = {'success': True, 'message': 'Playing (shared session)',
+                          'range': upstream.range}
+            else:
+                result = {'success': False, 'message': 'No active session'}
+        if result['success']:
+            self.start()
+        return result
+    
+    def pause(self):
+        """Stop watching; the upstream session pauses once no viewer is playing"""
+        if not self.playing:
+            return {'success': False, 'message': 'Not playing'}
+        self.stop()
+        upstream = self.upstream
+        with upstream.lock:
+            if upstream.state == PLAYING and not upstream.playing_viewers():
+                return upstream.pause()
+        return {'success': True, 'message': 'Paused'}
+    
+    def seek(self, position):
+        """Jump to a position, moving to a session of its own if others are watching"""
+        upstream = self.upstream
+        if len(upstream.viewers) > 1:
+            print(f"[WebServer] {self.sid} seeks away from {upstream.room}")
+            detach_viewer(self)
+            result = attach_viewer(self, upstream.server_addr, upstream.server_port,
+                                   upstream.video_file, private=True)
+            if not result['success']:
+                return {'success': False, 'message': result['message']}
+            result = self.play(position)
+            if result['success']:
+                result['message'] = f'Seeked to {position:.1f}s'
+            return result
+        
+        with upstream.lock:
+            result = upstream.seek(position)
+        if result['success'] and not self.playing:
+            self.start()
+        return result
+
+
+def attach_viewer(viewer, server_addr, server_port, video_file, private=False):
+    """
+    Attach a viewer to the upstream session for a file, setting one up if
+    nobody is watching it yet. A private session is never shared.
+    """
+    key = (server_addr, int(server_port), video_file)
+    if private:
+        key += (viewer.sid,)
+    
+    with upstreams_lock:
+        upstream = upstreams.get(key)
+        if upstream is None:
+            upstream = WebStreamingClient(key, server_addr, server_port, video_file)
+            upstreams[key] = upstream
+        upstream.add_viewer(viewer)
+    
+    with upstream.lock:
+        if upstream.state == INIT:
+            result = upstream.setup()
+        else:
+            result = {'success': True, 'message': 'Joined shared session',
+                      'session_id': upstream.session_id}
+    
+    if not result['success']:
+        detach_viewer(viewer)
+    else:
+        result['viewers'] = len(upstream.viewers)
+        print(f"[WebServer] {viewer.sid} watching {video_file} on {upstream.room} "
+              f"({len(upstream.viewers)} viewers)")
+    return result
+
+
+def detach_viewer(viewer):
+    """Detach a viewer; the upstream session is torn down when its last viewer leaves"""
+    upstream = viewer.upstream
+    if upstream is None:
+        return {'success': True, 'message': 'Teardown complete'}
+    viewer.stop()
+    if viewer.queue:
+        print(f"[WebClient] {viewer.sid}: {viewer.queue.summary()}")
+    
+    with upstreams_lock:
+        upstream.remove_viewer(viewer)
+        viewer.upstream = None
+        last = not upstream.viewers
+        if last and upstreams.get(upstream.key) is upstream:
+            del upstreams[upstream.key]
+    
+    with upstream.lock:
+        if last:
+            return upstream.teardown()
+        if upstream.state == PLAYING and not upstream.playing_viewers():
+            upstream.pause()
+    return {'success': True, 'message': 'Teardown complete'}
+
+
+# Receives RTP for every upstream session
+rtp_ingest = RtpIngest()
 
 
 # Flask routes
@@ -282,10 +877,9 @@ def handle_disconnect():
     client_id = request.sid
     print(f"[WebServer] Client disconnected: {client_id}")
     
-    # Teardown session if exists
+    # Leave the session if watching
     if client_id in sessions:
-        sessions[client_id].teardown()
-        del sessions[client_id]
+        detach_viewer(sessions.pop(client_id))
 
 
 @socketio.on('check_server_status')
@@ -361,8 +955,7 @@ def handle_stop_server():
     try:
         # Close all client sessions first
         for client_id in list(sessions.keys()):
-            sessions[client_id].teardown()
-            del sessions[client_id]
+            detach_viewer(sessions.pop(client_id))
         
         # Terminate the server process
         if rtsp_server_process:
@@ -376,6 +969,8 @@ def handle_stop_server():
             'message': 'RTSP/RTP Server stopped'
         }, broadcast=True)
         print("[WebServer] RTSP Server stopped")
+        print(f"[WebServer] RTP ports: {port_allocator.summary()}")
+        print(f"[WebServer] RTP ingest: {rtp_ingest.stats()}")
         
     except Exception as e:
         emit('server_output', {
@@ -392,15 +987,22 @@ def handle_setup(data):
     server_addr = data.get('server_addr', 'localhost')
     server_port = data.get('server_port', 8554)
     video_file = data.get('video_file', 'video/movie.Mjpeg')
+    transport = data.get('transport', DEFAULT_FRAME_TRANSPORT)
+    acks = bool(data.get('acks', False))
     
-    print(f"[WebServer] Setup request from {client_id}")
+    print(f"[WebServer] Setup request from {client_id} ({transport} frames"
+          f"{', acknowledged' if acks else ''})")
     
-    # Create new session
-    client = WebStreamingClient(client_id, server_addr, server_port, video_file)
-    result = client.setup()
+    # A repeated setup starts over
+    if client_id in sessions:
+        detach_viewer(sessions.pop(client_id))
+    
+    # Join the session for this file, or set one up
+    viewer = Viewer(client_id, transport, acks)
+    result = attach_viewer(viewer, server_addr, server_port, video_file)
     
     if result['success']:
-        sessions[client_id] = client
+        sessions[client_id] = viewer
     
     emit('setup_response', result)
 
@@ -419,6 +1021,37 @@ def handle_play():
     emit('play_response', result)
 
 
+@socketio.on('seek')
+def handle_seek(data):
+    """Handle seek request from browser"""
+    client_id = request.sid
+    
+    if client_id not in sessions:
+        emit('seek_response', {'success': False, 'message': 'No session found'})
+        return
+    
+    try:
+        position = max(float(data.get('position', 0)), 0.0)
+    except (TypeError, ValueError):
+        emit('seek_response', {'success': False, 'message': 'Invalid position'})
+        return
+    
+    print(f"[WebServer] Seek request from {client_id} to {position}s")
+    result = sessions[client_id].seek(position)
+    emit('seek_response', result)
+
+
+@socketio.on('frame_ack')
+def handle_frame_ack(data):
+    """Handle the browser's acknowledgement of a drawn frame"""
+    viewer = sessions.get(request.sid)
+    if viewer and viewer.queue:
+        try:
+            viewer.queue.ack(int(data.get('seq', 0)))
+        except (TypeError, ValueError, AttributeError):
+            pass
+
+
 @socketio.on('pause')
 def handle_pause():
     """Handle PAUSE request from browser"""
@@ -443,10 +1076,7 @@ def handle_teardown():
         return
     
     print(f"[WebServer] Teardown request from {client_id}")
-    result = sessions[client_id].teardown()
-    
-    if result['success']:
-        del sessions[client_id]
+    result = detach_viewer(sessions.pop(client_id))
     
     emit('teardown_response', result)
 
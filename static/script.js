@@ -38,6 +38,10 @@ function initializeSocket() {
         handlePauseResponse(response);
     });
 
+    socket.on('seek_response', (response) => {
+        handleSeekResponse(response);
+    });
+
     socket.on('teardown_response', (response) => {
         handleTeardownResponse(response);
     });
@@ -120,7 +124,9 @@ function setup() {
     socket.emit('setup', {
         server_addr: serverAddr,
         server_port: parseInt(serverPort),
-        video_file: videoFile
+        video_file: videoFile,
+        transport: 'binary',
+        acks: true
     });
 
     document.getElementById('setupBtn').disabled = true;
@@ -132,6 +138,18 @@ function play() {
     document.getElementById('playBtn').disabled = true;
 }
 
+function seek() {
+    const position = parseFloat(document.getElementById('seekPosition').value);
+    if (isNaN(position) || position < 0) {
+        addLog('Seek position must be a number of seconds', 'error');
+        return;
+    }
+
+    addLog(`Sending PLAY request with Range: npt=${position}-`, 'info');
+    socket.emit('seek', { position: position });
+    document.getElementById('seekBtn').disabled = true;
+}
+
 function pause() {
     addLog('Sending PAUSE request', 'info');
     socket.emit('pause');
@@ -149,6 +167,7 @@ function handleSetupResponse(response) {
     if (response.success) {
         addLog(`Setup successful! Session ID: ${response.session_id}`, 'success');
         document.getElementById('playBtn').disabled = false;
+        document.getElementById('seekBtn').disabled = false;
         document.getElementById('teardownBtn').disabled = false;
         updateStatus('connected', 'Ready to Play');
     } else {
@@ -160,6 +179,8 @@ function handleSetupResponse(response) {
 function handlePlayResponse(response) {
     if (response.success) {
         addLog('Playback started', 'success');
+        showRange(response.range);
+        document.getElementById('seekBtn').disabled = false;
         document.getElementById('pauseBtn').disabled = false;
         document.getElementById('teardownBtn').disabled = false;
         updateStatus('connected', 'Playing');
@@ -181,6 +202,24 @@ function handlePauseResponse(response) {
     }
 }
 
+function handleSeekResponse(response) {
+    document.getElementById('seekBtn').disabled = false;
+    if (response.success) {
+        addLog(response.message, 'success');
+        showRange(response.range);
+        document.getElementById('playBtn').disabled = true;
+        document.getElementById('pauseBtn').disabled = false;
+        updateStatus('connected', 'Playing');
+    } else {
+        addLog(`Seek failed: ${response.message}`, 'error');
+    }
+}
+
+// Show the range reported by the server (npt=start-end)
+function showRange(range) {
+    document.getElementById('rangeInfo').textContent = range || '';
+}
+
 function handleTeardownResponse(response) {
     if (response.success) {
         addLog('Session terminated', 'success');
@@ -191,16 +230,112 @@ function handleTeardownResponse(response) {
     }
 }
 
+// Frames arriving while the previous one is still decoding; only the newest is kept
+let decoding = false;
+let pendingFrame = null;
+
 // Display video frame
 function displayFrame(data) {
-    const img = document.getElementById('videoFrame');
-    img.src = 'data:image/jpeg;base64,' + data.frame;
+    if (decoding) {
+        if (pendingFrame) {
+            // Superseded before it was drawn
+            ackFrame(pendingFrame);
+        }
+        pendingFrame = data;
+    } else {
+        renderFrame(data);
+    }
 
     // Update statistics
     document.getElementById('frameNum').textContent = data.frame_num;
     document.getElementById('packets').textContent = data.packets;
     document.getElementById('dataRate').textContent = data.data_rate + ' kbps';
     document.getElementById('fps').textContent = data.fps;
+    document.getElementById('buffer').textContent = `${data.buffer_ms} ms (${data.buffer_depth})`;
+    document.getElementById('lateLost').textContent = `${data.late} / ${data.lost}`;
+    document.getElementById('jitter').textContent = `${data.jitter_ms} ms (${data.loss}% loss)`;
+    if (data.dropped !== undefined) {
+        document.getElementById('dropped').textContent = data.dropped;
+    }
+}
+
+// Decode a frame and draw it, then acknowledge it so the server sends the next one
+function renderFrame(data) {
+    decoding = true;
+    decodeFrame(data).then((image) => {
+        drawToCanvas(image);
+        if (image.close) {
+            image.close();
+        }
+    }).catch(() => {
+        // Corrupt frame: keep the last one on screen
+    }).finally(() => {
+        ackFrame(data);
+        decoding = false;
+        if (pendingFrame) {
+            const next = pendingFrame;
+            pendingFrame = null;
+            renderFrame(next);
+        }
+    });
+}
+
+// Decode a base64 frame, or a binary JPEG off the main thread
+function decodeFrame(data) {
+    if (typeof data.frame === 'string') {
+        return loadImage('data:image/jpeg;base64,' + data.frame);
+    }
+    const blob = new Blob([data.frame], { type: 'image/jpeg' });
+    return window.createImageBitmap
+        ? createImageBitmap(blob)
+        : loadImage(URL.createObjectURL(blob), true);
+}
+
+// Tell the server a frame is off our hands
+function ackFrame(data) {
+    if (data.seq !== undefined && socket) {
+        socket.emit('frame_ack', { seq: data.seq });
+    }
+}
+
+// Load an image from a URL (revoking object URLs once loaded)
+function loadImage(url, revoke = false) {
+    return new Promise((resolve, reject) => {
+        const image = new Image();
+        image.onload = () => {
+            if (revoke) {
+                URL.revokeObjectURL(url);
+            }
+            resolve(image);
+        };
+        image.onerror = reject;
+        image.src = url;
+    });
+}
+
+// Draw a decoded frame, resizing the canvas to the video resolution
+function drawToCanvas(image) {
+    const canvas = document.getElementById('videoFrame');
+    if (canvas.width !== image.width || canvas.height !== image.height) {
+        canvas.width = image.width;
+        canvas.height = image.height;
+    }
+    canvas.getContext('2d').drawImage(image, 0, 0);
+}
+
+// Draw the idle placeholder
+function drawPlaceholder() {
+    const canvas = document.getElementById('videoFrame');
+    canvas.width = 640;
+    canvas.height = 480;
+    const ctx = canvas.getContext('2d');
+    ctx.fillStyle = '#000';
+    ctx.fillRect(0, 0, canvas.width, canvas.height);
+    ctx.fillStyle = '#fff';
+    ctx.font = '24px sans-serif';
+    ctx.textAlign = 'center';
+    ctx.textBaseline = 'middle';
+    ctx.fillText('Click Setup to Start', canvas.width / 2, canvas.height / 2);
 }
 
 // Add log entry
@@ -228,21 +363,28 @@ function resetUI() {
     document.getElementById('playBtn').disabled = true;
     document.getElementById('pauseBtn').disabled = true;
     document.getElementById('teardownBtn').disabled = true;
+    document.getElementById('seekBtn').disabled = true;
+    showRange('');
     
     // Reset statistics
     document.getElementById('frameNum').textContent = '0';
     document.getElementById('packets').textContent = '0';
     document.getElementById('dataRate').textContent = '0.00 kbps';
     document.getElementById('fps').textContent = '0.00';
+    document.getElementById('buffer').textContent = '0 ms';
+    document.getElementById('lateLost').textContent = '0 / 0';
+    document.getElementById('jitter').textContent = '0 ms';
+    document.getElementById('dropped').textContent = '0';
     
     // Reset video frame
-    const img = document.getElementById('videoFrame');
-    img.src = "data:image/svg+xml,%3Csvg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 640 480'%3E%3Crect width='640' height='480' fill='%23000'/%3E%3Ctext x='50%25' y='50%25' font-size='24' fill='%23fff' text-anchor='middle' dominant-baseline='middle'%3EClick Setup to Start%3C/text%3E%3C/svg%3E";
+    pendingFrame = null;
+    drawPlaceholder();
 }
 
 // Disable all buttons
 function disableAllButtons() {
     document.getElementById('setupBtn').disabled = true;
+    document.getElementById('seekBtn').disabled = true;
     document.getElementById('playBtn').disabled = true;
     document.getElementById('pauseBtn').disabled = true;
     document.getElementById('teardownBtn').disabled = true;
@@ -265,6 +407,7 @@ async function loadConfig() {
 // Initialize on page load
 window.addEventListener('DOMContentLoaded', () => {
     addLog('Web client initialized', 'info');
+    drawPlaceholder();
     loadConfig();
     initializeSocket();
 });
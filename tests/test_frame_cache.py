@@ -0,0 +1,169 @@
+"""
+Tests for FrameCache: segmented LRU eviction, promotion, and pinning within the budget
+"""
+
+import os
+import unittest
+
+from FrameCache import FrameCache
+
+
+def key(path, frameNum):
+    """Cache key as VideoStream builds it: (path, size, mtime, frame number)"""
+    return (os.path.abspath(path), 1000, 0, frameNum)
+
+
+def frame(size=100):
+    return bytes(size)
+
+
+class FrameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        # 800 bytes protected, the rest probation
+        self.cache = FrameCache(1000, protectedRatio=0.8)
+
+    def fill(self, path, frames, size=100):
+        for frameNum in frames:
+            self.cache.put(key(path, frameNum), frame(size))
+
+    def cached(self, path, frames):
+        """Which frames are in the cache (without counting as hits)"""
+        return [frameNum for frameNum in frames
+                if any(key(path, frameNum) in segment for segment in
+                       (self.cache.probation, self.cache.protected, self.cache.pinned))]
+
+    def usedBytes(self):
+        s = self.cache.stats()
+        return s['cached_bytes'] + s['pinned_bytes']
+
+    def testMissThenHit(self):
+        self.assertIsNone(self.cache.get(key('a.mjpeg', 0)))
+        self.cache.put(key('a.mjpeg', 0), b'jpeg')
+        self.assertEqual(self.cache.get(key('a.mjpeg', 0)), b'jpeg')
+        s = self.cache.stats()
+        self.assertEqual((s['hits'], s['misses'], s['insertions']), (1, 1, 1))
+
+    def testDuplicatePutIgnored(self):
+        self.cache.put(key('a.mjpeg', 0), b'first')
+        self.cache.put(key('a.mjpeg', 0), b'second')
+        self.assertEqual(self.cache.get(key('a.mjpeg', 0)), b'first')
+        self.assertEqual(self.cache.stats()['insertions'], 1)
+
+    def testEvictsLeastRecentlyUsed(self):
+        self.fill('a.mjpeg', range(12))
+        self.assertEqual(self.cached('a.mjpeg', range(12)), list(range(2, 12)))
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+        self.assertEqual(self.usedBytes(), 1000)
+
+    def testSecondHitPromotes(self):
+        self.fill('a.mjpeg', range(2))
+        self.cache.get(key('a.mjpeg', 0))
+        self.assertIn(key('a.mjpeg', 0), self.cache.protected)
+        self.assertIn(key('a.mjpeg', 1), self.cache.probation)
+
+    def testScanDoesNotEvictProtected(self):
+        self.fill('hot.mjpeg', range(5))
+        for frameNum in range(5):
+            self.cache.get(key('hot.mjpeg', frameNum))
+
+        # A long pass over cold content only churns probation
+        self.fill('cold.mjpeg', range(100))
+        self.assertEqual(self.cached('hot.mjpeg', range(5)), list(range(5)))
+        self.assertEqual(self.cached('cold.mjpeg', range(100)), list(range(95, 100)))
+        self.assertLessEqual(self.usedBytes(), 1000)
+
+    def testProtectedOverflowDemotes(self):
+        self.fill('a.mjpeg', range(10))
+        for frameNum in range(10):
+            self.cache.get(key('a.mjpeg', frameNum))
+        # Only 800 bytes fit in protected; the least recently hit drop back
+        self.assertEqual(self.cache.protectedBytes, 800)
+        self.assertEqual(list(self.cache.probation), [key('a.mjpeg', 0), key('a.mjpeg', 1)])
+
+        self.fill('b.mjpeg', range(2))
+        self.assertEqual(self.cached('a.mjpeg', range(10)), list(range(2, 10)))
+
+    def testProtectedHitRefreshes(self):
+        self.fill('a.mjpeg', range(9))
+        for frameNum in range(9):
+            self.cache.get(key('a.mjpeg', frameNum))
+        # Frame 1 would be demoted next, but a hit makes it most recent
+        self.cache.get(key('a.mjpeg', 1))
+        self.fill('b.mjpeg', range(1))
+        self.cache.get(key('b.mjpeg', 0))
+        self.assertIn(key('a.mjpeg', 1), self.cache.protected)
+        self.assertIn(key('a.mjpeg', 2), self.cache.probation)
+
+    def testOversizedFrameNotCached(self):
+        self.cache.put(key('a.mjpeg', 0), frame(300))
+        self.assertIsNone(self.cache.get(key('a.mjpeg', 0)))
+        self.assertEqual(self.cache.stats()['insertions'], 0)
+
+    def testPinMovesCachedFrames(self):
+        self.fill('a.mjpeg', range(3))
+        self.cache.get(key('a.mjpeg', 0))
+        self.assertTrue(self.cache.pin('a.mjpeg'))
+        self.assertTrue(self.cache.isPinned('a.mjpeg'))
+        self.assertEqual(len(self.cache.pinned), 3)
+        self.assertEqual((self.cache.probationBytes, self.cache.protectedBytes), (0, 0))
+
+    def testPinnedFramesNeverEvicted(self):
+        self.cache.pin('a.mjpeg')
+        self.fill('a.mjpeg', range(3))
+        self.fill('b.mjpeg', range(50))
+        for frameNum in range(50):
+            self.cache.get(key('b.mjpeg', frameNum))
+        self.assertEqual(self.cached('a.mjpeg', range(3)), list(range(3)))
+        self.assertEqual(self.cache.stats()['pinned_bytes'], 300)
+        self.assertLessEqual(self.usedBytes(), 1000)
+
+    def testPinnedBytesShrinkSegments(self):
+        self.fill('b.mjpeg', range(8))
+        for frameNum in range(8):
+            self.cache.get(key('b.mjpeg', frameNum))
+        self.cache.pin('a.mjpeg')
+        self.fill('a.mjpeg', range(5))
+        self.assertEqual(self.cache.protectedLimit, 400)
+        self.assertLessEqual(self.cache.protectedBytes, 400)
+        self.assertLessEqual(self.usedBytes(), 1000)
+        self.assertEqual(self.cached('a.mjpeg', range(5)), list(range(5)))
+
+    def testPinRefusedOverBudget(self):
+        self.assertFalse(self.cache.pin('a.mjpeg', size=1001))
+        self.assertFalse(self.cache.isPinned('a.mjpeg'))
+        self.assertTrue(self.cache.pin('a.mjpeg', size=600))
+        self.fill('a.mjpeg', range(6))
+        self.assertFalse(self.cache.pin('b.mjpeg', size=500))
+        self.assertTrue(self.cache.pin('c.mjpeg', size=400))
+
+    def testPinnedOverflowStaysInBudget(self):
+        self.cache.pin('a.mjpeg')
+        self.fill('a.mjpeg', range(9))
+        self.cache.put(key('a.mjpeg', 9), frame(150))
+        s = self.cache.stats()
+        self.assertEqual(s['pinned_bytes'], 900)
+        self.assertEqual(s['pin_overflows'], 1)
+        self.assertNotIn(key('a.mjpeg', 9), self.cache.pinned)
+        self.assertLessEqual(self.usedBytes(), 1000)
+
+    def testUnpinMakesFramesEvictable(self):
+        self.cache.pin('a.mjpeg')
+        self.fill('a.mjpeg', range(5))
+        self.cache.unpin('a.mjpeg')
+        self.assertFalse(self.cache.isPinned('a.mjpeg'))
+        self.assertEqual(self.cache.stats()['pinned_bytes'], 0)
+        self.assertEqual(self.cache.protectedLimit, 800)
+
+        self.fill('b.mjpeg', range(10))
+        self.assertEqual(self.cached('a.mjpeg', range(5)), [])
+        self.assertEqual(self.usedBytes(), 1000)
+
+    def testKeyIncludesFileVersion(self):
+        self.cache.put(key('a.mjpeg', 0), b'old')
+        replaced = (os.path.abspath('a.mjpeg'), 1000, 1, 0)
+        self.assertIsNone(self.cache.get(replaced))
+
+
+if __name__ == '__main__':
+    unittest.main()
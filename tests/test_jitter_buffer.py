@@ -0,0 +1,139 @@
+"""
+Tests for JitterBuffer: sequence/timestamp unwrap, reordering and loss accounting
+"""
+
+import unittest
+
+from JitterBuffer import JitterBuffer, _extend
+
+FRAME_TICKS = 3000
+FRAME_TIME = FRAME_TICKS / 90000
+
+
+class ExtendTest(unittest.TestCase):
+
+    def testNoWrap(self):
+        self.assertEqual(_extend(100, 90, 16), 100)
+        self.assertEqual(_extend(80, 90, 16), 80)
+
+    def testSequenceWrapsForward(self):
+        self.assertEqual(_extend(2, 65534, 16), 65538)
+        self.assertEqual(_extend(0, 65535, 16), 65536)
+
+    def testSequenceBehindWrap(self):
+        # A reordered packet from before the wrap stays below the reference
+        self.assertEqual(_extend(65534, 65538, 16), 65534)
+        self.assertEqual(_extend(65535, 2 * 65536 + 1, 16), 65536 + 65535)
+
+    def testSequenceSecondCycle(self):
+        self.assertEqual(_extend(10, 65536 + 65530, 16), 2 * 65536 + 10)
+
+    def testTimestampWraps(self):
+        self.assertEqual(_extend(0x100, 0xFFFFFF00, 32), 0x100000100)
+        self.assertEqual(_extend(0xFFFFFF00, 0x100000100, 32), 0xFFFFFF00)
+
+    def testHalfRange(self):
+        # Exactly half the range away counts as behind
+        self.assertEqual(_extend(0x8000, 0, 16), -0x8000)
+        self.assertEqual(_extend(0x7FFF, 0, 16), 0x7FFF)
+
+
+class JitterBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.buffer = JitterBuffer(minDelay=0.04, maxDelay=0.5, clock=lambda: 0.0)
+
+    def push(self, seqNum, timestamp=0, now=0.0, payload=None):
+        if payload is None:
+            payload = str(seqNum).encode()
+        return self.buffer.push(seqNum, timestamp, 0, payload, now)
+
+    def payloads(self, now=100.0):
+        return [payload for _, _, payload in self.buffer.pop(now)]
+
+    def testReleasesInSequenceOrder(self):
+        for seqNum in (10, 12, 11, 13):
+            self.push(seqNum)
+        self.assertEqual(self.payloads(), [b'10', b'11', b'12', b'13'])
+        self.assertEqual(self.buffer.reordered, 1)
+        self.assertEqual(self.buffer.lost, 0)
+
+    def testReorderAcrossSequenceWrap(self):
+        for seqNum in (65534, 0, 65535, 1):
+            self.assertTrue(self.push(seqNum))
+        self.assertEqual(self.payloads(), [b'65534', b'65535', b'0', b'1'])
+        self.assertEqual(self.buffer.lost, 0)
+        self.assertEqual(self.buffer.late, 0)
+
+    def testLossAcrossSequenceWrap(self):
+        for seqNum in (65534, 1):
+            self.push(seqNum)
+        self.payloads()
+        self.assertEqual(self.buffer.lost, 2)
+
+    def testTimestampWrapKeepsPlayoutClock(self):
+        start = 0xFFFFFFFF - FRAME_TICKS + 1
+        for i in range(4):
+            self.push(i, (start + i * FRAME_TICKS) & 0xFFFFFFFF, now=i * FRAME_TIME)
+        self.assertEqual(self.buffer.resyncs, 0)
+        self.assertAlmostEqual(self.buffer.timeUntilNext(now=0.0), 0.04, places=6)
+
+        # Frames on either side of the wrap are due one frame time apart
+        due = 2 * FRAME_TIME + 0.04
+        self.assertEqual(self.payloads(now=due - 0.001), [b'0', b'1'])
+        self.assertEqual(self.payloads(now=due + 0.001), [b'2'])
+        self.assertEqual(self.buffer.depth(), 1)
+
+    def testReorderAcrossTimestampWrap(self):
+        self.push(1, 0xFFFFFF00)
+        self.push(3, 0x00000100 + FRAME_TICKS)
+        self.push(2, 0x00000100)
+        self.assertEqual(self.buffer.resyncs, 0)
+        timestamps = [timestamp for timestamp, _, _ in self.buffer.pop(100.0)]
+        self.assertEqual(timestamps, [0xFFFFFF00, 0x100, 0x100 + FRAME_TICKS])
+
+    def testHoldsPacketsUntilDue(self):
+        self.push(1, 0, now=0.0)
+        self.assertEqual(self.payloads(now=0.03), [])
+        self.assertEqual(self.payloads(now=0.05), [b'1'])
+
+    def testLatePacketDropped(self):
+        for seqNum in (1, 3):
+            self.push(seqNum)
+        self.payloads()
+        delay = self.buffer.delay
+        self.assertFalse(self.push(2))
+        self.assertEqual(self.buffer.late, 1)
+        self.assertGreater(self.buffer.delay, delay)
+        self.assertEqual(self.buffer.lost, 1)
+
+    def testDuplicateDropped(self):
+        self.assertTrue(self.push(5))
+        self.assertFalse(self.push(5))
+        self.assertEqual(self.buffer.duplicates, 1)
+        self.assertEqual(self.payloads(), [b'5'])
+
+    def testOverflowReleasesEarly(self):
+        self.buffer.maxPackets = 2
+        for seqNum in range(4):
+            self.push(seqNum)
+        self.assertEqual(self.payloads(now=0.0), [b'0', b'1'])
+        self.assertEqual(self.buffer.depth(), 2)
+
+    def testPayloadCopied(self):
+        data = bytearray(b'abc')
+        self.push(1, payload=memoryview(data))
+        data[:] = b'xyz'
+        self.assertEqual(self.payloads(), [b'abc'])
+
+    def testResetAcceptsEarlierSequence(self):
+        self.push(100)
+        self.payloads()
+        self.buffer.reset()
+        self.assertTrue(self.push(50))
+        self.assertEqual(self.payloads(), [b'50'])
+        self.assertEqual(self.buffer.late, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
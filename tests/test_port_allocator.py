@@ -0,0 +1,123 @@
+"""
+Tests for PortAllocator: even/odd RTP/RTCP pairs, skipping taken ports, and reuse order
+"""
+
+import socket
+import unittest
+
+from PortAllocator import PortAllocator
+
+HOST = '127.0.0.1'
+
+
+def freeRange(count=8):
+    """First even port of count consecutive UDP ports nothing else is using"""
+    for base in range(40000, 60000, 32):
+        sockets = []
+        try:
+            for port in range(base, base + count):
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                sockets.append(sock)
+                sock.bind((HOST, port))
+            return base
+        except OSError:
+            continue
+        finally:
+            for sock in sockets:
+                sock.close()
+    raise unittest.SkipTest("No free UDP port range")
+
+
+class PortAllocatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.low = freeRange()
+        # Three pairs: low, low + 2, low + 4
+        self.allocator = PortAllocator(self.low, self.low + 6, host=HOST)
+        self.sockets = []
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+
+    def allocate(self):
+        port, rtpSocket, rtcpSocket = self.allocator.allocate()
+        self.sockets += [rtpSocket, rtcpSocket]
+        return port, rtpSocket, rtcpSocket
+
+    def release(self, port):
+        for sock in list(self.sockets):
+            if sock.getsockname()[1] in (port, port + 1):
+                sock.close()
+                self.sockets.remove(sock)
+        self.allocator.release(port)
+
+    def testEvenOddPair(self):
+        port, rtpSocket, rtcpSocket = self.allocate()
+        self.assertEqual(port % 2, 0)
+        self.assertEqual(rtpSocket.getsockname(), (HOST, port))
+        self.assertEqual(rtcpSocket.getsockname(), (HOST, port + 1))
+
+    def testOddLowRoundsUp(self):
+        allocator = PortAllocator(self.low + 1, self.low + 6, host=HOST)
+        self.assertEqual(list(allocator.free), [self.low + 2, self.low + 4])
+
+    def testUniquePairs(self):
+        ports = [self.allocate()[0] for _ in range(3)]
+        self.assertEqual(ports, [self.low, self.low + 2, self.low + 4])
+        self.assertEqual(self.allocator.stats()['in_use'], 3)
+        self.assertEqual(self.allocator.stats()['peak'], 3)
+
+    def testExhaustedRaises(self):
+        for _ in range(3):
+            self.allocate()
+        with self.assertRaises(OSError):
+            self.allocator.allocate()
+
+    def testReleasedPairReusedLast(self):
+        first = self.allocate()[0]
+        self.release(first)
+        # The pair goes to the back of the pool, behind the unused ones
+        self.assertEqual(self.allocate()[0], self.low + 2)
+        self.assertEqual(self.allocate()[0], self.low + 4)
+        self.assertEqual(self.allocate()[0], first)
+        self.assertEqual(self.allocator.stats()['allocations'], 4)
+
+    def testReleaseUnknownIgnored(self):
+        self.allocator.release(self.low)
+        self.allocator.release(12345)
+        self.assertEqual(list(self.allocator.free), [self.low, self.low + 2, self.low + 4])
+
+    def testSkipsTakenRtpPort(self):
+        blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(blocker)
+        blocker.bind((HOST, self.low))
+        self.assertEqual(self.allocate()[0], self.low + 2)
+        self.assertEqual(self.allocator.stats()['bind_failures'], 1)
+        # The taken pair is kept for later rather than dropped
+        self.assertEqual(list(self.allocator.free), [self.low + 4, self.low])
+
+    def testSkipsTakenRtcpPort(self):
+        blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(blocker)
+        blocker.bind((HOST, self.low + 1))
+        port, rtpSocket, rtcpSocket = self.allocate()
+        self.assertEqual(port, self.low + 2)
+        # The RTP socket of the failed pair was closed again
+        probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sockets.append(probe)
+        probe.bind((HOST, self.low))
+
+    def testAllTakenRaises(self):
+        for port in (self.low, self.low + 2, self.low + 4):
+            blocker = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.sockets.append(blocker)
+            blocker.bind((HOST, port))
+        with self.assertRaises(OSError):
+            self.allocator.allocate()
+        self.assertEqual(self.allocator.stats()['bind_failures'], 3)
+        self.assertEqual(len(self.allocator.free), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,294 @@
+"""
+Tests for RtcpPacket: SR/RR/SDES/BYE/APP encoding and parsing, jitter, loss and RTT
+"""
+
+import select
+import socket
+import unittest
+
+from RtcpPacket import (APP_FEEDBACK, NTP_OFFSET, PT_APP, PT_BYE, PT_RR, PT_SDES,
+                        PT_SR, ReceiverFeedback, ReceiverReporter, ReceptionStats,
+                        ReportBlock, buildApp, buildBye, buildFeedback,
+                        buildReceiverReport, buildSdes, buildSenderReport,
+                        ntpMiddle, ntpTime, parseCompound)
+
+BLOCK = ReportBlock(ssrc=0x11223344, fractionLost=64, cumulativeLost=1000,
+                    highestSeq=0x00012345, jitter=450, lastSR=0xAABBCCDD,
+                    delaySinceLastSR=0x8000)
+
+
+class NtpTest(unittest.TestCase):
+
+    def testNtpTime(self):
+        self.assertEqual(ntpTime(0.5), (NTP_OFFSET, 1 << 31))
+        self.assertEqual(ntpTime(1.25), (NTP_OFFSET + 1, 1 << 30))
+
+    def testNtpMiddle(self):
+        self.assertEqual(ntpMiddle(0x12345678, 0x9ABCDEF0), 0x56789ABC)
+
+
+class EncodeDecodeTest(unittest.TestCase):
+
+    def parseOne(self, data):
+        self.assertEqual(len(data) % 4, 0)
+        packets = parseCompound(data)
+        self.assertEqual(len(packets), 1)
+        return packets[0]
+
+    def testSenderReport(self):
+        data = buildSenderReport(0xDEADBEEF, 0x1_0000_0010, 1234, 567890,
+                                 blocks=[BLOCK], now=1.5)
+        self.assertEqual(len(data), 4 + 24 + 24)
+        packet = self.parseOne(data)
+        self.assertEqual(packet.pt, PT_SR)
+        self.assertEqual(packet.count, 1)
+        self.assertEqual(packet.ssrc, 0xDEADBEEF)
+        self.assertEqual((packet.ntpSeconds, packet.ntpFraction), ntpTime(1.5))
+        self.assertEqual(packet.rtpTimestamp, 0x10)
+        self.assertEqual((packet.packetCount, packet.octetCount), (1234, 567890))
+        self.assertEqual(packet.reports, [BLOCK])
+        self.assertEqual(packet.ntpMiddle(), ntpMiddle(*ntpTime(1.5)))
+
+    def testReceiverReport(self):
+        packet = self.parseOne(buildReceiverReport(7, [BLOCK, BLOCK._replace(ssrc=9)]))
+        self.assertEqual(packet.pt, PT_RR)
+        self.assertEqual(packet.ssrc, 7)
+        self.assertEqual([block.ssrc for block in packet.reports], [BLOCK.ssrc, 9])
+        self.assertEqual(packet.reports[0], BLOCK)
+
+    def testEmptyReceiverReport(self):
+        data = buildReceiverReport(7)
+        self.assertEqual(len(data), 8)
+        self.assertEqual(self.parseOne(data).reports, [])
+
+    def testCumulativeLostIsSigned(self):
+        # Duplicates can make the count negative; it is a signed 24-bit field
+        packet = self.parseOne(buildReceiverReport(7, [BLOCK._replace(cumulativeLost=-3)]))
+        self.assertEqual(packet.reports[0].cumulativeLost, -3)
+
+    def testCumulativeLostClamped(self):
+        packet = self.parseOne(buildReceiverReport(7, [BLOCK._replace(cumulativeLost=1 << 24)]))
+        self.assertEqual(packet.reports[0].cumulativeLost, 0x7FFFFF)
+
+    def testSdes(self):
+        packet = self.parseOne(buildSdes(5, 'alice@host'))
+        self.assertEqual(packet.pt, PT_SDES)
+        self.assertEqual(packet.ssrc, 5)
+        self.assertIn(b'alice@host', packet.body)
+
+    def testBye(self):
+        packet = self.parseOne(buildBye(5))
+        self.assertEqual((packet.pt, packet.count, packet.ssrc), (PT_BYE, 1, 5))
+
+    def testApp(self):
+        packet = self.parseOne(buildApp(5, b'TEST', b'abcde', subtype=3))
+        self.assertEqual((packet.pt, packet.count, packet.ssrc), (PT_APP, 3, 5))
+        self.assertEqual(packet.name, b'TEST')
+        # Data is padded to a 32-bit boundary
+        self.assertEqual(packet.data, b'abcde\x00\x00\x00')
+
+    def testFeedback(self):
+        packet = self.parseOne(buildFeedback(5, 2_500_000.7, 300, 0x1_0000_0002))
+        self.assertEqual(packet.name, APP_FEEDBACK)
+        self.assertEqual(packet.data, bytes.fromhex('002625a0' '0000012c' '00000002'))
+
+    def testCompound(self):
+        data = (buildReceiverReport(7, [BLOCK]) + buildSdes(7, 'bob') +
+                buildFeedback(7, 1000, 1, 0) + buildBye(7))
+        self.assertEqual([packet.pt for packet in parseCompound(data)],
+                         [PT_RR, PT_SDES, PT_APP, PT_BYE])
+
+    def testTruncatedTailIgnored(self):
+        data = buildReceiverReport(7, [BLOCK]) + buildSdes(7, 'bob')
+        packets = parseCompound(data[:-4])
+        self.assertEqual([packet.pt for packet in packets], [PT_RR])
+
+    def testBadVersionStops(self):
+        bad = bytearray(buildBye(9))
+        bad[0] &= 0x3F
+        packets = parseCompound(buildBye(7) + bytes(bad) + buildBye(8))
+        self.assertEqual([packet.ssrc for packet in packets], [7])
+
+
+class ReceptionStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stats = ReceptionStats(clockRate=90000)
+
+    def testLossAndFraction(self):
+        for seqNum in (0, 1, 2, 5, 6, 7, 8, 9):
+            self.stats.update(1, seqNum, 0, 0.0)
+        self.assertEqual(self.stats.expected(), 10)
+        self.assertEqual(self.stats.lost(), 2)
+        block = self.stats.reportBlock(0.0)
+        self.assertEqual(block.fractionLost, (2 << 8) // 10)
+        self.assertEqual(block.cumulativeLost, 2)
+        self.assertEqual(block.highestSeq, 9)
+
+        # Loss fraction is per report interval, the cumulative count is not
+        for seqNum in range(10, 20):
+            self.stats.update(1, seqNum, 0, 0.0)
+        block = self.stats.reportBlock(0.0)
+        self.assertEqual(block.fractionLost, 0)
+        self.assertEqual(block.cumulativeLost, 2)
+
+    def testSequenceWrap(self):
+        for seqNum in (65534, 65535, 0, 2):
+            self.stats.update(1, seqNum, 0, 0.0)
+        self.assertEqual(self.stats.maxSeq, 65536 + 2)
+        self.assertEqual(self.stats.lost(), 1)
+        self.assertEqual(self.stats.reportBlock(0.0).highestSeq, 65538)
+
+    def testReorderedPacketNotLost(self):
+        for seqNum in (1, 3, 2):
+            self.stats.update(1, seqNum, 0, 0.0)
+        self.assertEqual(self.stats.maxSeq, 3)
+        self.assertEqual(self.stats.lost(), 0)
+
+    def testNewSourceRestarts(self):
+        for seqNum in (0, 5):
+            self.stats.update(1, seqNum, 0, 0.0)
+        self.stats.update(2, 1000, 0, 0.0)
+        self.assertEqual(self.stats.ssrc, 2)
+        self.assertEqual(self.stats.lost(), 0)
+
+    def testJitterZeroForSteadyArrival(self):
+        for i in range(10):
+            self.stats.update(1, i, i * 3000, i / 30)
+        self.assertAlmostEqual(self.stats.jitter, 0.0, places=6)
+
+    def testJitterEstimate(self):
+        # J += (|D| - J) / 16 with D in timestamp units (RFC 3550 6.4.1)
+        self.stats.update(1, 0, 0, 0.0)
+        self.stats.update(1, 1, 9000, 0.11)
+        self.assertAlmostEqual(self.stats.jitter, 900 / 16)
+        self.stats.update(1, 2, 18000, 0.2)
+        self.assertAlmostEqual(self.stats.jitter, 900 / 16 + (900 - 900 / 16) / 16)
+        self.assertAlmostEqual(self.stats.jitterSeconds(), self.stats.jitter / 90000)
+        self.assertEqual(self.stats.reportBlock(0.2).jitter, int(self.stats.jitter))
+
+    def testJitterIgnoresTimestampWrap(self):
+        self.stats.update(1, 0, 0xFFFFFF00, 0.0)
+        self.stats.update(1, 1, 0x00000100, 0.0)
+        self.assertEqual(self.stats.jitter, 0.0)
+
+    def testLastSenderReportDelay(self):
+        self.stats.update(1, 0, 0, 0.0)
+        self.assertEqual(self.stats.reportBlock(10.0)[5:], (0, 0))
+
+        sr = parseCompound(buildSenderReport(1, 0, 0, 0, now=100.75))[0]
+        self.stats.senderReport(sr, 10.0)
+        block = self.stats.reportBlock(10.5)
+        self.assertEqual(block.lastSR, ntpMiddle(*ntpTime(100.75)))
+        self.assertEqual(block.delaySinceLastSR, 32768)
+
+
+class ReceiverFeedbackTest(unittest.TestCase):
+
+    def setUp(self):
+        self.feedback = ReceiverFeedback(0x11223344, clockRate=90000)
+
+    def testReportBlock(self):
+        self.feedback.receive(buildReceiverReport(7, [BLOCK._replace(lastSR=0)]), now=5.0)
+        self.assertEqual(self.feedback.reports, 1)
+        self.assertEqual(self.feedback.fractionLost, 0.25)
+        self.assertEqual(self.feedback.cumulativeLost, 1000)
+        self.assertAlmostEqual(self.feedback.jitter, 0.005)
+        self.assertIsNone(self.feedback.rtt)
+
+    def testIgnoresOtherSources(self):
+        self.feedback.receive(buildReceiverReport(7, [BLOCK._replace(ssrc=1)]), now=5.0)
+        self.assertEqual(self.feedback.reports, 0)
+
+    def testRoundTripTime(self):
+        # RTT = A - LSR - DLSR (RFC 3550 6.4.1)
+        sent = 1_700_000_000.0
+        lastSR = ntpMiddle(*ntpTime(sent))
+        block = BLOCK._replace(lastSR=lastSR, delaySinceLastSR=int(0.25 * 65536))
+        self.feedback.receive(buildReceiverReport(7, [block]), now=sent + 0.3)
+        self.assertAlmostEqual(self.feedback.rtt, 0.05, delta=1 / 65536 * 2)
+
+    def testRoundTripTimeAcrossWrap(self):
+        # The middle 32 bits wrap every 65536 s; send just before a wrap
+        sent = (NTP_OFFSET // 65536 + 1) * 65536 - NTP_OFFSET - 0.1
+        self.assertEqual(ntpMiddle(*ntpTime(sent)) >> 16, 0xFFFF)
+        block = BLOCK._replace(lastSR=ntpMiddle(*ntpTime(sent)), delaySinceLastSR=0)
+        self.feedback.receive(buildReceiverReport(7, [block]), now=sent + 0.2)
+        self.assertAlmostEqual(self.feedback.rtt, 0.2, delta=1 / 65536 * 2)
+
+    def testPlayback(self):
+        self.feedback.receive(buildFeedback(7, 2_000_000, 90, 10))
+        self.assertEqual(self.feedback.receiveRate, 2_000_000)
+        self.assertAlmostEqual(self.feedback.frameLoss, 0.1)
+
+        # Loss covers the interval since the previous feedback
+        self.feedback.receive(buildFeedback(7, 1_000_000, 140, 10))
+        self.assertEqual(self.feedback.frameLoss, 0.0)
+        self.feedback.receive(buildFeedback(7, 1_000_000, 170, 20))
+        self.assertAlmostEqual(self.feedback.frameLoss, 0.25)
+
+    def testPlaybackCounterRestart(self):
+        self.feedback.receive(buildFeedback(7, 1000, 500, 50))
+        self.feedback.receive(buildFeedback(7, 1000, 3, 1))
+        self.assertAlmostEqual(self.feedback.frameLoss, 0.25)
+
+
+class ReceiverReporterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.client.bind(('127.0.0.1', 0))
+        self.client.setblocking(False)
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def receive(self, sock):
+        self.assertTrue(select.select([sock], [], [], 1.0)[0])
+        return sock.recv(2048)
+
+    def testSenderReportToRoundTrip(self):
+        """SR out, RR back with LSR/DLSR, and the server derives the RTT"""
+
+        class Playback:
+            framesCompleted = 30
+            framesDropped = 2
+
+        reporter = ReceiverReporter(self.client, ssrc=42, cname='test', clock=lambda: 0.0,
+                                    playback=Playback())
+        reporter.serverAddr = self.server.getsockname()
+        reporter.stats.update(0x11223344, 1, 0, 0.0)
+
+        sent = 1_700_000_000.0
+        self.server.sendto(buildSenderReport(0x11223344, 0, 1, 100, now=sent),
+                           self.client.getsockname())
+        select.select([self.client], [], [], 1.0)
+        reporter.poll(now=0.0)
+        self.assertEqual(reporter.senderReports, 1)
+        self.assertEqual(reporter.reportsSent, 0)
+
+        # The receiver reports 2 s after the SR arrived; the network adds 0.02 s
+        reporter.poll(now=2.0)
+        self.assertEqual(reporter.reportsSent, 1)
+        feedback = ReceiverFeedback(0x11223344)
+        packets = feedback.receive(self.receive(self.server), now=sent + 2.02)
+        self.assertEqual([packet.pt for packet in packets], [PT_RR, PT_SDES, PT_APP])
+        self.assertEqual(packets[0].ssrc, 42)
+        self.assertAlmostEqual(feedback.rtt, 0.02, delta=1 / 65536 * 2)
+        self.assertEqual((feedback.framesCompleted, feedback.framesDropped), (30, 2))
+
+    def testBye(self):
+        reporter = ReceiverReporter(self.client, ssrc=42, cname='test')
+        reporter.bye()
+        reporter.serverAddr = self.server.getsockname()
+        reporter.bye()
+        packets = parseCompound(self.receive(self.server))
+        self.assertEqual([packet.pt for packet in packets], [PT_RR, PT_BYE])
+        self.assertEqual(packets[1].ssrc, 42)
+
+
+if __name__ == '__main__':
+    unittest.main()
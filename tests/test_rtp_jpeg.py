@@ -0,0 +1,191 @@
+"""
+Tests for RtpJpeg: RFC 2435 fragmentation, reassembly and restart markers
+"""
+
+import struct
+import unittest
+
+from RtpJpeg import (JPEG_HEADER_SIZE, RESTART_HEADER_SIZE, RTP_HEADER_SIZE,
+                     TYPE_JFIF, JpegPacketizer, JpegReassembler, makeHeaders,
+                     makeTables, parseJpeg)
+
+# Entropy-coded data never contains a bare 0xFF; keep the fake scan free of it
+SCAN = bytes(i % 0xFF for i in range(5000))
+
+
+def makeJpeg(jpegType=1, width=64, height=48, q=50, restartInterval=0, scan=SCAN):
+    """A baseline JFIF image in exactly the layout the reassembler rebuilds"""
+    return makeHeaders(jpegType, width, height, makeTables(q), restartInterval) + scan + b'\xff\xd9'
+
+
+def offsetOf(payload):
+    """Fragment offset from the main JPEG header"""
+    return struct.unpack_from('!I', payload)[0] & 0xFFFFFF
+
+
+class PacketizerTest(unittest.TestCase):
+
+    def testParseBaseline(self):
+        frame = parseJpeg(makeJpeg(jpegType=0, width=320, height=240))
+        self.assertEqual(frame.type, 0)
+        self.assertEqual((frame.width, frame.height), (320, 240))
+        self.assertEqual(frame.qtables, makeTables(50))
+        self.assertEqual(bytes(frame.scan), SCAN)
+
+    def testParseRestartInterval(self):
+        frame = parseJpeg(makeJpeg(jpegType=1, restartInterval=4))
+        self.assertEqual(frame.type, 65)
+        self.assertEqual(frame.restartInterval, 4)
+
+    def testParseRejectsUnsupported(self):
+        self.assertIsNone(parseJpeg(b'not a jpeg'))
+        # Dimensions must be a multiple of 8
+        self.assertIsNone(parseJpeg(makeJpeg(width=60)))
+        # Only luma 2x1 and 2x2 sampling map to types 0/1
+        jpeg = bytearray(makeJpeg())
+        sof = jpeg.index(b'\xff\xc0')
+        jpeg[sof + 11] = 0x11
+        self.assertIsNone(parseJpeg(bytes(jpeg)))
+
+    def testFragmentsFitMtu(self):
+        mtu = 500
+        packets = JpegPacketizer(mtu).packetize(makeJpeg())
+        self.assertGreater(len(packets), 1)
+        for payload, marker in packets:
+            self.assertLessEqual(RTP_HEADER_SIZE + len(payload), mtu)
+
+    def testMarkerOnLastFragmentOnly(self):
+        packets = JpegPacketizer(500).packetize(makeJpeg())
+        self.assertEqual([marker for _, marker in packets], [0] * (len(packets) - 1) + [1])
+
+    def testOffsetsAreContiguous(self):
+        fragments = JpegPacketizer(500).fragments(makeJpeg())
+        expected = 0
+        for header, chunk, marker in fragments:
+            self.assertEqual(offsetOf(header), expected)
+            expected += len(chunk)
+        self.assertEqual(expected, len(SCAN))
+
+    def testTablesOnlyInFirstFragment(self):
+        fragments = JpegPacketizer(500).fragments(makeJpeg())
+        first = fragments[0][0]
+        self.assertEqual(first[5], 255)
+        self.assertEqual(len(first), JPEG_HEADER_SIZE + 4 + 128)
+        for header, chunk, marker in fragments[1:]:
+            self.assertEqual(len(header), JPEG_HEADER_SIZE)
+
+    def testRestartHeaderInEveryFragment(self):
+        fragments = JpegPacketizer(500).fragments(makeJpeg(restartInterval=4))
+        for header, chunk, marker in fragments:
+            self.assertEqual(header[4], 65)
+            interval, flags = struct.unpack_from('!HH', header, JPEG_HEADER_SIZE)
+            self.assertEqual(interval, 4)
+            self.assertEqual(flags, 0xFFFF)
+        self.assertEqual(len(fragments[1][0]), JPEG_HEADER_SIZE + RESTART_HEADER_SIZE)
+
+    def testUnsupportedJpegSentWhole(self):
+        data = b'\xff\xd8' + bytes(3000) + b'\xff\xd9'
+        fragments = JpegPacketizer(500).fragments(data)
+        self.assertTrue(all(header[4] == TYPE_JFIF for header, _, _ in fragments))
+        self.assertEqual(b''.join(bytes(chunk) for _, chunk, _ in fragments), data)
+
+
+class ReassemblerTest(unittest.TestCase):
+
+    def reassemble(self, packets, timestamp=1000, reassembler=None):
+        reassembler = reassembler or JpegReassembler()
+        frames = [reassembler.addPacket(timestamp, marker, payload)
+                  for payload, marker in packets]
+        return reassembler, frames
+
+    def testRoundTrip(self):
+        jpeg = makeJpeg()
+        reassembler, frames = self.reassemble(JpegPacketizer(500).packetize(jpeg))
+        self.assertEqual(frames[-1], jpeg)
+        self.assertTrue(all(frame is None for frame in frames[:-1]))
+        self.assertEqual(reassembler.framesCompleted, 1)
+        self.assertEqual(reassembler.pending, {})
+
+    def testRoundTripSingleFragment(self):
+        jpeg = makeJpeg(scan=SCAN[:100])
+        packets = JpegPacketizer().packetize(jpeg)
+        self.assertEqual(len(packets), 1)
+        self.assertEqual(self.reassemble(packets)[1], [jpeg])
+
+    def testRoundTripRestartInterval(self):
+        jpeg = makeJpeg(jpegType=0, restartInterval=8)
+        reassembler, frames = self.reassemble(JpegPacketizer(500).packetize(jpeg))
+        self.assertEqual(frames[-1], jpeg)
+
+    def testRoundTripUnsupportedJpeg(self):
+        data = b'\xff\xd8' + bytes(3000) + b'\xff\xd9'
+        reassembler, frames = self.reassemble(JpegPacketizer(500).packetize(data))
+        self.assertEqual(frames[-1], data)
+
+    def testStandardTablesFromQ(self):
+        # Q below 128 means the receiver derives the tables itself
+        jpeg = makeJpeg(q=75)
+        packetizer = JpegPacketizer(500)
+        fragments = packetizer._fragment(memoryview(SCAN), 1, 75, 8, 6, b'', b'')
+        packets = [(header + chunk, marker) for header, chunk, marker in fragments]
+        self.assertEqual(self.reassemble(packets)[1][-1], jpeg)
+
+    def testOutOfOrderFragments(self):
+        jpeg = makeJpeg()
+        packets = JpegPacketizer(500).packetize(jpeg)
+        shuffled = packets[1::2] + packets[::2]
+        frames = self.reassemble(shuffled)[1]
+        self.assertEqual([frame for frame in frames if frame is not None], [jpeg])
+
+    def testMissingFragment(self):
+        packets = JpegPacketizer(500).packetize(makeJpeg())
+        del packets[1]
+        reassembler, frames = self.reassemble(packets)
+        self.assertTrue(all(frame is None for frame in frames))
+        self.assertEqual(reassembler.framesCompleted, 0)
+        self.assertIn(1000, reassembler.pending)
+
+    def testCompletedFrameDropsOlderPartial(self):
+        packetizer = JpegPacketizer(500)
+        broken = packetizer.packetize(makeJpeg())[:-1]
+        reassembler, _ = self.reassemble(broken, timestamp=1000)
+        jpeg = makeJpeg(q=60)
+        frames = self.reassemble(packetizer.packetize(jpeg), timestamp=4000,
+                                 reassembler=reassembler)[1]
+        self.assertEqual(frames[-1], jpeg)
+        self.assertEqual(reassembler.pending, {})
+        self.assertEqual(reassembler.framesDropped, 1)
+
+    def testOlderAcrossTimestampWrap(self):
+        packetizer = JpegPacketizer(500)
+        reassembler, _ = self.reassemble(packetizer.packetize(makeJpeg())[:-1],
+                                         timestamp=0xFFFFF000)
+        self.reassemble(packetizer.packetize(makeJpeg()), timestamp=0x1000,
+                        reassembler=reassembler)
+        self.assertEqual(reassembler.pending, {})
+        self.assertEqual(reassembler.framesDropped, 1)
+
+    def testMaxPendingDropsOldest(self):
+        reassembler = JpegReassembler(maxPending=2)
+        first = JpegPacketizer(500).packetize(makeJpeg())[0]
+        for timestamp in (1000, 2000, 3000):
+            self.reassemble([first], timestamp, reassembler)
+        self.assertEqual(list(reassembler.pending), [2000, 3000])
+        self.assertEqual(reassembler.framesDropped, 1)
+
+    def testReset(self):
+        packets = JpegPacketizer(500).packetize(makeJpeg())
+        reassembler, _ = self.reassemble(packets[:-1])
+        reassembler.reset()
+        self.assertEqual(reassembler.pending, {})
+        # The tail alone cannot complete the frame after a reset
+        self.assertIsNone(reassembler.addPacket(1000, 1, packets[-1][0]))
+
+    def testShortPayloadIgnored(self):
+        reassembler = JpegReassembler()
+        self.assertIsNone(reassembler.addPacket(1000, 1, b'\x00' * 4))
+        self.assertEqual(reassembler.pending, {})
+
+
+if __name__ == '__main__':
+    unittest.main()